@@ -1,8 +1,8 @@
 from flask import Flask, request, jsonify
 from functools import wraps
-import pandas as pd
+import hashlib
+import json
 import logging
-import joblib
 from io import BytesIO
 import boto3
 import os
@@ -10,6 +10,18 @@ from dotenv import load_dotenv
 import threading
 import time
 from datetime import datetime
+import numpy as np
+from compiled_forest import FEATURE_COLUMNS, CompiledForest
+from live_drift import LiveDriftMonitor
+from metrics import Metrics, SamplingProfiler
+from micro_batcher import MicroBatcher
+from model_registry import ModelRegistry
+from model_serving import ModelSlot, RowSample, ServingModel, validate_model
+from model_sync import OwnerLock, SharedModelStore
+from payloads import PayloadError, decode_request, dumps_json
+from prediction_cache import IdempotencyStore, PredictionCache
+from request_logger import RequestLogger
+from weekly_uploader import WeeklyUploader
 
 # Load environment variables
 load_dotenv()
@@ -19,20 +31,91 @@ AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
 BUCKET_NAME = os.getenv("BUCKET_NAME", "fraud-detection-project-data-science")
 MODEL_BACKUPS_PREFIX = os.getenv("MODEL_BACKUPS_PREFIX", "model_backups")
 MODEL_RELOAD_INTERVAL = int(os.getenv("MODEL_RELOAD_INTERVAL", 300))
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "./models/cache")
 API_TOKEN = os.getenv("API_TOKEN")
+PORT = int(os.getenv("PORT", 8000))
 WEEKLY_UPLOAD_PREFIX = os.getenv("WEEKLY_UPLOAD_PREFIX", "weekly_data")
+USE_COMPILED_MODEL = os.getenv("USE_COMPILED_MODEL", "false").lower() == "true"
+FAST_START = os.getenv("FAST_START", "false").lower() == "true"
+USE_MICRO_BATCHING = os.getenv("USE_MICRO_BATCHING", "false").lower() == "true"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 64))
+BATCH_MAX_WAIT_US = int(os.getenv("BATCH_MAX_WAIT_US", 500))
+MODEL_HISTORY_SIZE = int(os.getenv("MODEL_HISTORY_SIZE", 3))
+RECENT_SAMPLE_SIZE = int(os.getenv("RECENT_SAMPLE_SIZE", 512))
+MAX_SHADOW_FRAUD_RATE = float(os.getenv("MAX_SHADOW_FRAUD_RATE", 0.5))
+REQUEST_LOG_DIR = os.getenv("REQUEST_LOG_DIR", "request_logs")
+REQUEST_LOG_FORMAT = os.getenv("REQUEST_LOG_FORMAT", "parquet")
+REQUEST_LOG_CAPACITY = int(os.getenv("REQUEST_LOG_CAPACITY", 100000))
+REQUEST_LOG_FLUSH_ROWS = int(os.getenv("REQUEST_LOG_FLUSH_ROWS", 5000))
+REQUEST_LOG_FLUSH_INTERVAL = float(os.getenv("REQUEST_LOG_FLUSH_INTERVAL", 1.0))
+REQUEST_LOG_POLICY = os.getenv("REQUEST_LOG_POLICY", "drop")
+WEEKLY_STAGING_PREFIX = os.getenv("WEEKLY_STAGING_PREFIX", "weekly_staging")
+WEEKLY_UPLOAD_THRESHOLD_MB = int(os.getenv("WEEKLY_UPLOAD_THRESHOLD_MB", 64))
+WEEKLY_UPLOAD_CHECK_INTERVAL = int(os.getenv("WEEKLY_UPLOAD_CHECK_INTERVAL", 60))
+UPLOAD_PART_SIZE_MB = int(os.getenv("UPLOAD_PART_SIZE_MB", 8))
+UPLOAD_MAX_WORKERS = int(os.getenv("UPLOAD_MAX_WORKERS", 4))
+SHARED_MODEL_DIR = os.getenv("SHARED_MODEL_DIR", "./models/shared")
+MODEL_SYNC_INTERVAL = float(os.getenv("MODEL_SYNC_INTERVAL", 1.0))
+REQUEST_LOG_SEGMENT_MAX_AGE = float(os.getenv("REQUEST_LOG_SEGMENT_MAX_AGE", 300))
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 0))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", 300))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 3600))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 5))
+PROFILER_MAX_DURATION = float(os.getenv("PROFILER_MAX_DURATION", 300))
+LIVE_DRIFT_ENABLED = os.getenv("LIVE_DRIFT_ENABLED", "true").lower() == "true"
+LIVE_DRIFT_WINDOW_ROWS = int(os.getenv("LIVE_DRIFT_WINDOW_ROWS", 50000))
+LIVE_DRIFT_BUCKETS = int(os.getenv("LIVE_DRIFT_BUCKETS", 10))
+LIVE_DRIFT_INTERVAL = float(os.getenv("LIVE_DRIFT_INTERVAL", 30))
+LIVE_DRIFT_MIN_ROWS = int(os.getenv("LIVE_DRIFT_MIN_ROWS", 2000))
+LIVE_DRIFT_TESTS = os.getenv("LIVE_DRIFT_TESTS", "psi").split(",")
+LIVE_DRIFT_ALPHA = float(os.getenv("LIVE_DRIFT_ALPHA", 0.05))
+LIVE_DRIFT_PSI_THRESHOLD = float(os.getenv("LIVE_DRIFT_PSI_THRESHOLD", 0.2))
+LIVE_DRIFT_FRAUD_RATE_RATIO = float(os.getenv("LIVE_DRIFT_FRAUD_RATE_RATIO", 3.0))
+LIVE_DRIFT_ALERT_COOLDOWN = float(os.getenv("LIVE_DRIFT_ALERT_COOLDOWN", 3600))
+DRIFT_ALERT_PREFIX = os.getenv("DRIFT_ALERT_PREFIX", "drift_alerts")
 
 # Flask App
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# Metrics of this process, exposed in Prometheus text format at /metrics
+metrics = Metrics(prefix="fraud_api_")
+metrics.histogram("predict_seconds", "Total /predict handler time")
+metrics.histogram("predict_stage_seconds", "Time spent in each /predict stage")
+metrics.counter("predict_requests_total", "/predict responses by HTTP status")
+metrics.counter("predict_rows_total", "Rows scored by /predict")
+metrics.histogram("s3_request_seconds", "Latency of S3 operations")
+metrics.histogram("model_reload_seconds", "Time to load, compile and validate a new model")
+metrics.counter("model_reload_failures_total", "Model reloads that failed or were rejected")
+metrics.histogram("request_log_flush_seconds", "Time per request log flush")
+metrics.histogram("weekly_upload_seconds", "Duration of weekly staging and compaction")
+metrics.counter("drift_alerts_total", "Live drift alerts raised by this process")
+process_started = time.time()
+
+# Sampling profiler, switched on and off at runtime through /profiler
+profiler = SamplingProfiler()
+
 # boto3 S3 client
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_DEFAULT_REGION
-)
+def make_s3_client():
+    return boto3.client(
+        "s3",
+        aws_access_key_id=AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+        region_name=AWS_DEFAULT_REGION
+    )
+
+# Created on first use (load_initial_model or init_process); building a client takes ~0.1s
+s3_client = None
+
+# Model registry with paginated/pointer lookup and local pickle cache
+registry = ModelRegistry(s3_client, BUCKET_NAME, MODEL_BACKUPS_PREFIX, MODEL_CACHE_DIR)
+
+# Multi-process serving: the serving model is announced to all workers through
+# SHARED_MODEL_DIR, and whichever process holds the owner lock runs the reload
+# and upload threads
+shared_models = SharedModelStore(SHARED_MODEL_DIR)
+owner_lock = OwnerLock(os.path.join(SHARED_MODEL_DIR, "owner.lock"))
 
 # Authentification Decorator
 def require_api_token(f):
@@ -45,116 +128,590 @@ def require_api_token(f):
     return decorated
 
 # Global model variables
-model = None
-latest_model_key = None
-lock = threading.Lock()
+model_slot = ModelSlot(history_size=MODEL_HISTORY_SIZE)
+latest_model_key = None  # newest key seen in S3, even if rejected or rolled back
+reload_status = {"failures": 0, "last_error": None, "last_error_at": None, "last_duration": None}
+recent_traffic = RowSample(RECENT_SAMPLE_SIZE)  # sample of traffic rows for shadow validation
 
 # Model handling
 def get_latest_model_key():
-    resp = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=MODEL_BACKUPS_PREFIX)
-    keys = [obj['Key'] for obj in resp.get('Contents', []) if obj['Key'].endswith("model.pkl")]
-    if not keys:
-        raise FileNotFoundError("No model found in S3.")
-    return sorted(keys, reverse=True)[0]
+    with metrics.timer("s3_request_seconds", op="latest_key"):
+        return registry.latest_key()
 
 def load_model_from_s3(key):
-    obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    m = joblib.load(BytesIO(obj['Body'].read()))
+    with metrics.timer("s3_request_seconds", op="load_model"):
+        m = registry.load(key)
     logging.info(f"Model loaded from s3://{BUCKET_NAME}/{key}")
     return m
 
+def compile_model(m):
+    """Flatten the forest into NumPy arrays if USE_COMPILED_MODEL is set, else return None."""
+    if not USE_COMPILED_MODEL:
+        return None
+    try:
+        cm = CompiledForest.from_sklearn(m)
+        logging.info(f"Compiled model with {cm.n_trees} trees, max depth {cm.max_depth}")
+        return cm
+    except Exception as e:
+        logging.error(f"Model compilation failed, falling back to sklearn: {e}")
+        return None
+
+def load_model_file(key, name, op):
+    """Bytes of a file stored next to a model in S3, or None."""
+    file_key = f"{os.path.dirname(key)}/{name}"
+    try:
+        with metrics.timer("s3_request_seconds", op=op):
+            obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=file_key)
+            return obj['Body'].read()
+    except Exception as e:
+        logging.warning(f"No usable {name} at s3://{BUCKET_NAME}/{file_key}: {e}")
+        return None
+
+def load_input_example(key):
+    """The input_example.csv stored next to a model, or None."""
+    body = load_model_file(key, "input_example.csv", "input_example")
+    if body is None:
+        return None
+    import pandas as pd
+    return pd.read_csv(BytesIO(body))
+
+def load_reference_stats(key):
+    """The drift reference snapshot (reference_stats.json) stored next to a model, or None."""
+    body = load_model_file(key, "reference_stats.json", "reference_stats")
+    return json.loads(body) if body is not None else None
+
+def load_validation_samples(example, feature_names):
+    """Stored input example of the model folder plus a sample of recent traffic."""
+    samples = []
+    if example is not None and set(feature_names) <= set(example.columns):
+        samples.append(example[feature_names].to_numpy(dtype="float32"))
+    recent = recent_traffic.get(feature_names)
+    if recent is not None:
+        samples.append(recent)
+    if not samples:
+        return None
+    return np.concatenate(samples)
+
+def prepare_model(key):
+    """Load, compile, warm up and validate a model off the request path."""
+    m = load_model_from_s3(key)
+    example = load_input_example(key)
+    # Models fitted on plain arrays have no feature_names_in_; take the order from their input example
+    feature_names = None
+    if getattr(m, "feature_names_in_", None) is None and example is not None:
+        feature_names = [c for c in example.columns if c != "Class"]
+    candidate = ServingModel(key, m, compile_model(m), feature_names, load_reference_stats(key))
+    samples = load_validation_samples(example, candidate.feature_names)
+    ok, message = validate_model(candidate, samples, model_slot.current, MAX_SHADOW_FRAUD_RATE)
+    if not ok:
+        raise ValueError(f"Model {key} failed validation: {message}")
+    logging.info(f"Model {key} validated: {message}")
+    return candidate
+
+def prepare_compiled_model():
+    """Serving model built from memory-mapped compiled arrays only, without unpickling model.pkl.
+
+    Uses the model last announced on this host if its arrays are still in
+    SHARED_MODEL_DIR, else the compiled copy stored next to the newest model
+    in S3. Returns None if neither exists.
+    """
+    entry = shared_models.read()
+    if entry is not None and entry.get("compiled_dir") and os.path.isdir(entry["compiled_dir"]):
+        return load_announced_model(entry, compiled_only=True)
+    key = get_latest_model_key()
+    with metrics.timer("s3_request_seconds", op="load_compiled"):
+        compiled_dir = registry.fetch_compiled(key)
+    if compiled_dir is None:
+        return None
+    return ServingModel(key, None, CompiledForest.load(compiled_dir), reference=load_reference_stats(key))
+
+def warm_up(serving):
+    """Score one row so the first request does not pay for page faults and lazy imports."""
+    serving.predict_proba(np.zeros((1, len(serving.feature_names)), dtype=np.float32))
+
+def record_reload(started, error=None):
+    """Update reload metrics and the status shown by /health."""
+    duration = time.perf_counter() - started
+    metrics.observe("model_reload_seconds", duration)
+    reload_status["last_duration"] = duration
+    if error is not None:
+        metrics.inc("model_reload_failures_total")
+        reload_status["failures"] += 1
+        reload_status["last_error"] = str(error)
+        reload_status["last_error_at"] = time.time()
+
 def reload_model_periodically():
-    global model, latest_model_key
+    global latest_model_key
     while True:
         try:
             key = get_latest_model_key()
             if key != latest_model_key:
                 logging.info(f"New model detected: {key}. Reloading...")
-                new_model = load_model_from_s3(key)
-                with lock:
-                    model = new_model
-                    latest_model_key = key
+                started = time.perf_counter()
+                try:
+                    candidate = prepare_model(key)
+                except Exception as e:
+                    record_reload(started, e)
+                    if isinstance(e, ValueError):
+                        latest_model_key = key  # do not retry a model that failed validation
+                    raise
+                record_reload(started)
+                model_slot.publish(candidate)
+                latest_model_key = key
+                announce_model(candidate)
         except Exception as e:
             logging.error(f"Error loading model: {e}")
         time.sleep(MODEL_RELOAD_INTERVAL)
 
-# Request logging
-REQUEST_LOG_PATH = "requests_log.csv"
+def announce_model(serving):
+    """Tell the other worker processes to serve `serving`."""
+    model_path = registry.cached_path(serving.key)
+    if model_path is None and serving.model is not None:
+        logging.warning(f"Model {serving.key} is not in the local cache, not announcing it")
+        return
+    # Only the owner polls S3, so other processes keep the newest key it recorded
+    latest_seen = latest_model_key if owner_lock.held else (shared_models.read() or {}).get("latest_seen")
+    shared_models.announce(serving, model_path, latest_seen)
 
-def log_request_to_csv(df, preds_proba, threshold=0.5):
-    """Append incoming requests + predicted class to local CSV."""
-    try:
-        df_to_log = df.copy()
-        # add Class column to the df
-        df_to_log["Class"] = (preds_proba >= threshold).astype(int)
+def load_announced_model(entry, compiled_only=False):
+    """Build a ServingModel from a manifest entry using only local files.
 
-        if os.path.exists(REQUEST_LOG_PATH):
-            df_to_log.to_csv(REQUEST_LOG_PATH, mode="a", header=False, index=False)
-        else:
-            df_to_log.to_csv(REQUEST_LOG_PATH, mode="w", header=True, index=False)
+    With `compiled_only`, or for a model announced without a pickle, the
+    sklearn model is not loaded at all.
+    """
+    reference = None
+    if entry.get("reference_path"):
+        with open(entry["reference_path"]) as f:
+            reference = json.load(f)
+    if entry.get("compiled_dir") and (compiled_only or not entry.get("model_path")):
+        return ServingModel(entry["key"], None, CompiledForest.load(entry["compiled_dir"]),
+                            entry.get("feature_names"), reference)
+    import joblib
+    m = joblib.load(entry["model_path"])
+    if USE_COMPILED_MODEL and entry.get("compiled_dir"):
+        # Memory-mapped: every worker shares the same node arrays
+        compiled = CompiledForest.load(entry["compiled_dir"])
+    else:
+        compiled = compile_model(m)
+    return ServingModel(entry["key"], m, compiled, entry.get("feature_names"), reference)
+
+def follow_announced_models():
+    """Switch to the model last announced by the owner process or by a rollback in any worker."""
+    while True:
+        try:
+            entry = shared_models.poll()
+            current = model_slot.current
+            if entry is not None and (current is None or entry["key"] != current.key):
+                if model_slot.find(entry["key"]) is not None:
+                    model_slot.rollback(entry["key"])
+                else:
+                    model_slot.publish(load_announced_model(entry))
+                logging.info(f"Process {os.getpid()} switched to announced model {entry['key']}")
+        except Exception as e:
+            logging.error(f"Error following announced model: {e}")
+        time.sleep(MODEL_SYNC_INTERVAL)
+
+def score_matrix(serving, X):
+    """Fraud probability for each row of a matrix in model column order."""
+    return serving.predict_proba(X)
+
+# Per-process state; created by init_process() after any fork
+request_logger = None
+weekly_uploader = None
+batcher = None
+prediction_cache = None
+idempotency_cache = None
+drift_monitor = None
+
+def raise_drift_alert(status):
+    """Record a live drift alert in S3, where drift_watchdog.py picks it up and retrains."""
+    metrics.inc("drift_alerts_total")
+    logging.warning(f"Live drift detected for {status['model_key']}: features {status['drifted_features']}, "
+                    f"fraud rate {status['fraud_rate']} (reference {status['reference_fraud_rate']})")
+    alert_key = f"{DRIFT_ALERT_PREFIX}/{datetime.utcnow().strftime('%Y-%m-%d_%H-%M-%S')}_{os.getpid()}.json"
+    summary = {k: v for k, v in status.items() if k != "features"}
+    try:
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=alert_key, Body=json.dumps(summary).encode("utf-8"))
     except Exception as e:
-        logging.error(f"Error logging request: {e}")
+        logging.error(f"Error writing drift alert: {e}")
+
+def init_process():
+    """Create the S3 client, request logger and micro-batcher of this process.
+
+    Called once per serving process: under gunicorn from the post_fork hook,
+    so no thread or open S3 connection is ever shared across a fork.
+    """
+    global s3_client, request_logger, weekly_uploader, batcher, prediction_cache, idempotency_cache, drift_monitor
+    s3_client = make_s3_client()
+    registry.s3 = s3_client
+
+    request_logger = RequestLogger(
+        REQUEST_LOG_DIR,
+        FEATURE_COLUMNS,
+        fmt=REQUEST_LOG_FORMAT,
+        capacity=REQUEST_LOG_CAPACITY,
+        flush_rows=REQUEST_LOG_FLUSH_ROWS,
+        flush_interval=REQUEST_LOG_FLUSH_INTERVAL,
+        policy=REQUEST_LOG_POLICY,
+        segment_max_age=REQUEST_LOG_SEGMENT_MAX_AGE,
+        on_flush=lambda seconds, rows: metrics.observe("request_log_flush_seconds", seconds),
+    )
+
+    weekly_uploader = WeeklyUploader(
+        s3_client,
+        BUCKET_NAME,
+        request_logger,
+        weekly_prefix=WEEKLY_UPLOAD_PREFIX,
+        staging_prefix=WEEKLY_STAGING_PREFIX,
+        part_size=UPLOAD_PART_SIZE_MB * 1024 * 1024,
+        max_workers=UPLOAD_MAX_WORKERS,
+    )
+
+    # Optional micro-batching of concurrent /predict calls
+    batcher = MicroBatcher(score_matrix, BATCH_MAX_SIZE, BATCH_MAX_WAIT_US) if USE_MICRO_BATCHING else None
+
+    # Optional caches: scores of repeated rows, and responses of requests retried with an Idempotency-Key
+    prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL) if PREDICTION_CACHE_SIZE > 0 else None
+    # The idempotency store lives under SHARED_MODEL_DIR so all gunicorn workers see the same keys
+    idempotency_cache = (IdempotencyStore(os.path.join(SHARED_MODEL_DIR, "idempotency.sqlite3"),
+                                          IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+                         if IDEMPOTENCY_CACHE_SIZE > 0 else None)
+
+    # Drift scores of this process's traffic against the serving model's reference snapshot
+    drift_monitor = LiveDriftMonitor(
+        window_rows=LIVE_DRIFT_WINDOW_ROWS,
+        n_buckets=LIVE_DRIFT_BUCKETS,
+        interval=LIVE_DRIFT_INTERVAL,
+        min_rows=LIVE_DRIFT_MIN_ROWS,
+        tests=LIVE_DRIFT_TESTS,
+        alpha=LIVE_DRIFT_ALPHA,
+        psi_threshold=LIVE_DRIFT_PSI_THRESHOLD,
+        fraud_rate_ratio=LIVE_DRIFT_FRAUD_RATE_RATIO,
+        alert_cooldown=LIVE_DRIFT_ALERT_COOLDOWN,
+        on_alert=raise_drift_alert,
+    ) if LIVE_DRIFT_ENABLED else None
 
 def upload_weekly_data():
-    """Upload collected requests to S3 once per week."""
+    """Stage request logs to S3 when they grow large, and compact them into one weekly CSV once per week."""
+    last_compaction = 0.0
     while True:
         try:
-            now = datetime.utcnow()
-            year, week_num, _ = now.isocalendar()
-            s3_key = f"{WEEKLY_UPLOAD_PREFIX}/week_{year}_{week_num}.csv"
-
-            if os.path.exists(REQUEST_LOG_PATH):
-                logging.info(f"Uploading weekly data to s3://{BUCKET_NAME}/{s3_key}")
-                s3_client.upload_file(REQUEST_LOG_PATH, BUCKET_NAME, s3_key)
-                os.remove(REQUEST_LOG_PATH)  # clear local log after upload
-            else:
-                logging.info("No new data to upload this week.")
+            if time.time() - last_compaction >= 7 * 24 * 60 * 60:
+                with metrics.timer("weekly_upload_seconds", step="stage"):
+                    weekly_uploader.stage_segments()
+                with metrics.timer("weekly_upload_seconds", step="compact"):
+                    weekly_uploader.compact_all()
+                last_compaction = time.time()
+            elif request_logger.pending_bytes() >= WEEKLY_UPLOAD_THRESHOLD_MB * 1024 * 1024:
+                with metrics.timer("weekly_upload_seconds", step="stage"):
+                    weekly_uploader.stage_segments()
 
         except Exception as e:
             logging.error(f"Error uploading weekly data: {e}")
 
-        # Sleep for one week (604800 seconds)
-        time.sleep(7 * 24 * 60 * 60)
+        time.sleep(WEEKLY_UPLOAD_CHECK_INTERVAL)
 
 # Background Threads
-threading.Thread(target=reload_model_periodically, daemon=True).start()
-threading.Thread(target=upload_weekly_data, daemon=True).start()
+def start_background_threads():
+    threading.Thread(target=reload_model_periodically, daemon=True).start()
+    threading.Thread(target=upload_weekly_data, daemon=True).start()
+
+def claim_background_threads():
+    """Run the reload and upload threads if this process wins the owner lock; keep trying otherwise."""
+    global latest_model_key
+    while not owner_lock.try_acquire():
+        time.sleep(MODEL_RELOAD_INTERVAL)
+    # Taking over from a previous owner: continue from the newest key it saw
+    entry = shared_models.read()
+    if entry is not None and entry.get("latest_seen"):
+        latest_model_key = entry["latest_seen"]
+    logging.info(f"Process {os.getpid()} owns model reloading and weekly uploads")
+    start_background_threads()
+
+def load_initial_model():
+    """Load the newest model before serving; under gunicorn this runs once in the master before forking.
+
+    With FAST_START the model is served from its compiled arrays when they
+    exist; the owner's reload thread picks up anything newer afterwards.
+    """
+    global latest_model_key, s3_client
+    if s3_client is None:
+        s3_client = registry.s3 = make_s3_client()
+    started = time.perf_counter()
+    try:
+        candidate = None
+        if FAST_START:
+            try:
+                candidate = prepare_compiled_model()
+            except Exception as e:
+                logging.warning(f"Fast start failed, loading the pickled model instead: {e}")
+        if candidate is None:
+            candidate = prepare_model(get_latest_model_key())
+        warm_up(candidate)
+        latest_model_key = candidate.key
+        model_slot.publish(candidate)
+        record_reload(started)
+        logging.info(f"Serving {candidate.key} {time.time() - process_started:.2f}s after start")
+        announce_model(model_slot.current)
+    except Exception as e:
+        record_reload(started, e)
+        logging.error(f"Failed to load initial model: {e}")
+
+def init_worker():
+    """Entry point for a pre-forked worker (see gunicorn.conf.py)."""
+    init_process()
+    threading.Thread(target=follow_announced_models, daemon=True).start()
+    threading.Thread(target=claim_background_threads, daemon=True).start()
 
 # Routes
+@app.route("/ready")
+def ready():
+    """Readiness probe: 503 until this process has a warmed-up model to serve."""
+    current = model_slot.current
+    if current is None:
+        return jsonify({"status": "loading", "pid": os.getpid()}), 503
+    return jsonify({"status": "ready", "pid": os.getpid(), "model_key": current.key})
+
 @app.route("/health")
 def health():
-    return jsonify({"status": "ok"})
+    current = model_slot.current
+    now = time.time()
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "uptime_seconds": now - process_started,
+        "model_key": current.key if current is not None else None,
+        "model_age_seconds": now - current.loaded_at if current is not None else None,
+        "latest_seen": latest_model_key,
+        "owner": owner_lock.held,
+        "reload_failures": reload_status["failures"],
+        "last_reload_error": reload_status["last_error"],
+        "last_reload_error_at": reload_status["last_error_at"],
+        "last_reload_seconds": reload_status["last_duration"],
+    })
+
+def component_gauges(get_stats, fields):
+    """Gauge callback reading counters from a per-process component's stats(), if it exists."""
+    def read():
+        stats = get_stats()
+        if stats is None:
+            return {}
+        return {(("counter", field),): stats[field] for field in fields}
+    return read
+
+metrics.gauge("model_age_seconds", "Seconds since the serving model was loaded in this process",
+              lambda: time.time() - model_slot.current.loaded_at if model_slot.current is not None else None)
+metrics.gauge("model_reload_owner", "1 if this process runs model reloading and weekly uploads",
+              lambda: int(owner_lock.held))
+metrics.gauge("request_log", "Request logger counters",
+              component_gauges(lambda: request_logger.stats() if request_logger is not None else None,
+                               ["logged_rows", "dropped_rows", "buffered_rows", "flushes", "write_errors"]))
+metrics.gauge("batch_queue_depth", "Requests waiting for the micro-batcher",
+              lambda: batcher.stats()["queue_depth"] if batcher is not None else None)
+metrics.gauge("live_drift_max_psi", "Largest PSI of any feature between live traffic and the model reference",
+              lambda: drift_monitor.status().get("max_psi") if drift_monitor is not None else None)
+metrics.gauge("live_drift_window_rows", "Rows in the live drift window",
+              lambda: drift_monitor.status().get("window_rows") if drift_monitor is not None else None)
+metrics.gauge("live_fraud_rate", "Predicted fraud rate in the live drift window",
+              lambda: drift_monitor.status().get("fraud_rate") if drift_monitor is not None else None)
+metrics.gauge("prediction_cache", "Prediction cache counters",
+              component_gauges(lambda: prediction_cache.stats() if prediction_cache is not None else None,
+                               ["hits", "misses", "evictions", "expirations", "entries"]))
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint (per process; under gunicorn each scrape reaches one worker)."""
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/profiler", methods=["GET", "POST"])
+@require_api_token
+def profiler_endpoint():
+    """POST {"action": "start"|"stop", "interval_ms", "duration_s"}; GET returns collapsed stacks."""
+    if request.method == "GET":
+        match = request.args.get("match")
+        limit = int(request.args.get("limit", 100))
+        if request.args.get("format") == "collapsed":
+            lines = [f"{stack} {count}" for stack, count in profiler.report(match, limit)]
+            return app.response_class("\n".join(lines) + "\n", mimetype="text/plain")
+        return jsonify({**profiler.describe(),
+                        "stacks": [{"stack": s, "count": c} for s, c in profiler.report(match, limit)]})
+    body = request.get_json(silent=True) or {}
+    action = body.get("action")
+    if action == "start":
+        interval = float(body.get("interval_ms", PROFILER_INTERVAL_MS)) / 1000
+        duration = min(float(body.get("duration_s", PROFILER_MAX_DURATION)), PROFILER_MAX_DURATION)
+        if not profiler.start(interval, duration):
+            return jsonify({"error": "Profiler is already running"}), 409
+        logging.info(f"Profiler started in process {os.getpid()} for up to {duration}s")
+    elif action == "stop":
+        profiler.stop()
+    else:
+        return jsonify({"error": "action must be 'start' or 'stop'"}), 400
+    return jsonify(profiler.describe())
+
+@app.route("/batch_stats")
+@require_api_token
+def batch_stats():
+    if batcher is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **batcher.stats()})
+
+@app.route("/log_stats")
+@require_api_token
+def log_stats():
+    return jsonify(request_logger.stats())
+
+@app.route("/cache_stats")
+@require_api_token
+def cache_stats():
+    return jsonify({
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else {"enabled": False},
+        "idempotency_cache": idempotency_cache.stats() if idempotency_cache is not None else {"enabled": False},
+    })
+
+@app.route("/drift")
+@require_api_token
+def drift():
+    if drift_monitor is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **drift_monitor.status()})
+
+@app.route("/models")
+@require_api_token
+def models():
+    return jsonify({"latest_seen": latest_model_key, **model_slot.describe()})
+
+@app.route("/rollback", methods=["POST"])
+@require_api_token
+def rollback():
+    """Revert to the previous in-memory model, or to a specific key from history."""
+    key = (request.get_json(silent=True) or {}).get("key")
+    try:
+        target = model_slot.rollback(key)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    logging.info(f"Rolled back to model {target.key}")
+    announce_model(target)
+    return jsonify({"status": "ok", "current": target.key})
+
+def json_response(obj, status=200):
+    """JSON response encoded with orjson when available (NumPy arrays included)."""
+    return app.response_class(dumps_json(obj), status=status, mimetype="application/json")
+
+def score(serving, X):
+    with metrics.timer("predict_stage_seconds", stage="score"):
+        if batcher is not None:
+            # Scored together with other in-flight requests (includes the queue wait)
+            return batcher.submit(X, serving)
+        return serving.predict_proba(X)
+
+def score_with_cache(serving, X):
+    """Score only the rows not already cached for this model."""
+    if prediction_cache is None:
+        return score(serving, X)
+    with metrics.timer("predict_stage_seconds", stage="cache"):
+        keys = prediction_cache.row_keys(serving.key, X)
+        proba, missing = prediction_cache.get_many(keys)
+    if missing.any():
+        fresh = score(serving, X[missing])
+        proba[missing] = fresh
+        with metrics.timer("predict_stage_seconds", stage="cache"):
+            prediction_cache.put_many([k for k, m in zip(keys, missing) if m], fresh)
+    return proba
 
 @app.route("/predict", methods=["POST"])
 @require_api_token
 def predict():
+    started = time.perf_counter()
+    response = handle_predict()
+    metrics.observe("predict_seconds", time.perf_counter() - started)
+    metrics.inc("predict_requests_total", status=response.status_code)
+    return response
+
+def handle_predict():
     try:
-        data = request.get_json().get("data")
-        if not data:
-            return jsonify({"error": "No input data provided"}), 400
+        # Single read of the published model, no lock needed
+        serving = model_slot.current
+        if serving is None:
+            return json_response({"error": "No model loaded yet."}, 503)
+
+        with metrics.timer("predict_stage_seconds", stage="read_body"):
+            body = request.get_data(cache=False)
+
+        # A retried request with the same Idempotency-Key gets the stored answer and is not logged again;
+        # the key is reserved before scoring, so a concurrent retry in any worker cannot score it twice
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if not idempotency_key or idempotency_cache is None:
+            return predict_body(serving, body)
+        state, stored = idempotency_cache.reserve(idempotency_key, hashlib.sha256(body).digest())
+        if state == "conflict":
+            return json_response({"error": "Idempotency-Key was already used with a different payload"}, 422)
+        if state == "in_flight":
+            response = json_response({"error": "A request with this Idempotency-Key is still being processed"}, 409)
+            response.headers["Retry-After"] = "1"
+            return response
+        if state == "replay":
+            response = app.response_class(stored, mimetype="application/json")
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        try:
+            response = predict_body(serving, body)
+        except BaseException:
+            idempotency_cache.release(idempotency_key)
+            raise
+        if response.status_code == 200:
+            idempotency_cache.complete(idempotency_key, response.get_data())
+        else:
+            idempotency_cache.release(idempotency_key)
+        return response
 
-        df = pd.DataFrame(data)
-        with lock:
-            preds_proba = model.predict_proba(df)[:, 1]
+    except Exception as e:
+        logging.exception("Prediction error")
+        return json_response({"error": str(e)}, 400)
 
-        # Log requests inkl. Class
-        log_request_to_csv(df, preds_proba, threshold=0.5)
+def predict_body(serving, body):
+    """Decode, score and log one request body; the response to return."""
+    try:
+        # JSON records/columns, msgpack, raw float32 or Arrow IPC, straight into a matrix
+        try:
+            with metrics.timer("predict_stage_seconds", stage="parse"):
+                X = decode_request(body, request.content_type, serving.schema)
+        except PayloadError as e:
+            return json_response({"error": str(e)}, 400)
+        recent_traffic.add(X, serving.feature_names)
+        preds_proba = score_with_cache(serving, X)
+        metrics.inc("predict_rows_total", len(X))
 
         # API-Output als "Fraud" / "No Fraud"
         predicted_class = (preds_proba >= 0.5).astype(int)
-        predicted_label = ["Fraud" if c == 1 else "No Fraud" for c in predicted_class]
 
-        return jsonify({"class": predicted_label})
+        # Log requests inkl. Class (buffered, written by a background thread)
+        with metrics.timer("predict_stage_seconds", stage="log"):
+            # X follows the serving model's column order; the log always uses FEATURE_COLUMNS
+            request_logger.log(X, predicted_class, serving.feature_names)
+            if drift_monitor is not None:
+                drift_monitor.observe(serving, X, predicted_class)
+
+        with metrics.timer("predict_stage_seconds", stage="serialize"):
+            predicted_label = np.where(predicted_class == 1, "Fraud", "No Fraud").tolist()
+            result = {"class": predicted_label, "probability": np.ascontiguousarray(preds_proba, dtype=np.float64)}
+            return json_response(result)
 
     except Exception as e:
         logging.exception("Prediction error")
-        return jsonify({"error": str(e)}), 400
+        return json_response({"error": str(e)}, 400)
 
 # MAIN
 if __name__ == "__main__":
-    try:
-        latest_model_key = get_latest_model_key()
-        model = load_model_from_s3(latest_model_key)
-    except Exception as e:
-        logging.error(f"Failed to load initial model: {e}")
-    app.run(host="0.0.0.0", port=8000)
+    # Single-process development server; use gunicorn.conf.py for production
+    init_process()
+    if FAST_START:
+        # Listen right away; /ready reports 503 until the model is loaded
+        def load_then_start_threads():
+            load_initial_model()
+            start_background_threads()
+        threading.Thread(target=load_then_start_threads, daemon=True).start()
+    else:
+        load_initial_model()
+        start_background_threads()
+    app.run(host="0.0.0.0", port=PORT)
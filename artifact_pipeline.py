@@ -0,0 +1,120 @@
+"""Publishing a trained model: one serialization, concurrent uploads, pointer last.
+
+- `serialize_model` pickles the model once (optionally compressed); the same
+  file is kept as the local latest model and uploaded to S3.
+- `publish_model_folder` uploads every artifact of a model folder in
+  parallel (multipart for large files), then writes manifest.json and only
+  then the LATEST pointer, so a reader following the pointer never sees a
+  half-uploaded folder.
+- `log_model_async` logs the model to MLflow on a background thread, so
+  retraining returns (and the model is served) without waiting for it.
+"""
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import joblib
+from boto3.s3.transfer import TransferConfig
+from compiled_forest import CompiledForest
+from model_registry import COMPILED_DIR_NAME, publish_pointer
+
+MANIFEST_NAME = "manifest.json"
+
+# One background thread, so MLflow calls never run concurrently; it is joined at interpreter exit
+_mlflow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mlflow-logging")
+_pending = []
+
+
+def new_model_folder(prefix):
+    """A fresh `<prefix>/<UTC timestamp>-<random suffix>-Model` folder; names still sort by time.
+
+    The suffix keeps two models published within the same second from
+    sharing (and overwriting) one folder.
+    """
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S")
+    return f"{prefix}/{timestamp}-{uuid.uuid4().hex[:8]}-Model"
+
+
+def serialize_model(model, path, compress=0):
+    """Pickle the model to `path` once; `compress` is joblib's level (0 = off, fastest to load)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    joblib.dump(model, path, compress=compress)
+    return path
+
+
+def _compiled_files(model, work_dir):
+    """{relative name: local path} of the model's memory-mappable node arrays, or {} if it cannot be flattened."""
+    try:
+        compiled = CompiledForest.from_sklearn(model)
+    except Exception as e:
+        print(f"Not uploading a compiled copy of the model: {e}")
+        return {}
+    directory = os.path.join(work_dir, COMPILED_DIR_NAME)
+    compiled.save(directory)
+    return {f"{COMPILED_DIR_NAME}/{name}": os.path.join(directory, name) for name in sorted(os.listdir(directory))}
+
+
+def publish_model_folder(s3_client, bucket, folder, files, model=None, pointer_prefix=None,
+                         max_workers=8, part_size=8 * 1024 * 1024):
+    """Upload `files` ({name: local path}, must include model.pkl) into `folder` and point readers at it.
+
+    With `model`, its compiled arrays are uploaded as well. All files go up
+    concurrently; manifest.json follows once every upload has finished and
+    the pointer under `pointer_prefix` is written last. Returns the manifest.
+    """
+    started = time.perf_counter()
+    config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                            max_concurrency=max_workers)
+    with tempfile.TemporaryDirectory() as work_dir:
+        uploads = {name: path for name, path in files.items() if path and os.path.exists(path)}
+        if model is not None:
+            uploads.update(_compiled_files(model, work_dir))
+        sizes = {name: os.path.getsize(path) for name, path in uploads.items()}
+        with ThreadPoolExecutor(max_workers) as pool:
+            futures = [pool.submit(s3_client.upload_file, path, bucket, f"{folder}/{name}", Config=config)
+                       for name, path in uploads.items()]
+            for future in futures:
+                future.result()
+
+    manifest = {
+        "model": f"{folder}/model.pkl",
+        "files": sizes,
+        "published_at": datetime.utcnow().isoformat(),
+    }
+    s3_client.put_object(Bucket=bucket, Key=f"{folder}/{MANIFEST_NAME}", Body=json.dumps(manifest).encode("utf-8"))
+    if pointer_prefix is not None and "model.pkl" in uploads:
+        publish_pointer(s3_client, bucket, pointer_prefix, manifest["model"])
+    print(f"Uploaded {len(uploads)} files ({sum(sizes.values()) / 2 ** 20:.1f} MB) to s3://{bucket}/{folder} "
+          f"in {time.perf_counter() - started:.2f}s")
+    return manifest
+
+
+def _log_model(run_id, model, input_example):
+    import mlflow.sklearn
+    started = time.perf_counter()
+    try:
+        mlflow.sklearn.log_model(model, "model", input_example=input_example, run_id=run_id)
+        print(f"Model logged to MLflow run {run_id} in {time.perf_counter() - started:.1f}s")
+    except Exception as e:
+        print(f"Logging the model to MLflow run {run_id} failed: {e}")
+
+
+def log_model_async(model, input_example, background=True):
+    """Log the model to the active MLflow run, on the background thread unless `background` is False."""
+    import mlflow
+    run_id = mlflow.active_run().info.run_id
+    if not background:
+        _log_model(run_id, model, input_example)
+        return None
+    future = _mlflow_executor.submit(_log_model, run_id, model, input_example)
+    _pending.append(future)
+    return future
+
+
+def wait_for_background():
+    """Block until all queued MLflow logging has finished."""
+    while _pending:
+        _pending.pop(0).result()
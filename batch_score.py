@@ -0,0 +1,220 @@
+"""Offline bulk scoring of large CSV/Parquet files or S3 prefixes.
+
+Loads the served model (newest in model_backups/, a given key, or
+LATEST_MODEL_PATH), streams the input in chunks, scores the chunks in a
+process pool and writes fraud probabilities and predicted classes in input
+order. Nothing is sent to the API and nothing is added to the request log.
+
+    python batch_score.py transactions.csv scores.parquet
+    python batch_score.py s3://my-bucket/weekly_data/ scores.csv --workers 4 --keep-columns Time,Amount
+    python batch_score.py history.parquet scores.parquet --local --chunk-rows 200000
+
+The forest is flattened once and saved as .npy files that every worker
+memory-maps, so the node arrays are in memory once however many workers run.
+Models that cannot be flattened are loaded by each worker instead.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import BUCKET_NAME, LATEST_MODEL_PATH, MODEL_CACHE_DIR, S3_MODEL_BACKUP_PREFIX
+from compiled_forest import CompiledForest, feature_names_of
+from model_registry import ModelRegistry
+from s3_data import get_arrow_s3, get_s3_client
+
+# Loading the model
+def resolve_model(model_key=None, local=False):
+    """(description, local pickle path) of the model to score with."""
+    if local:
+        return LATEST_MODEL_PATH, LATEST_MODEL_PATH
+    registry = ModelRegistry(get_s3_client(), BUCKET_NAME, S3_MODEL_BACKUP_PREFIX, MODEL_CACHE_DIR)
+    key = model_key or registry.latest_key()
+    return key, registry.fetch(key)
+
+def prepare_shared_model(model, work_dir):
+    """Save the flattened forest for the workers to memory-map; None if the model cannot be flattened."""
+    try:
+        compiled = CompiledForest.from_sklearn(model)
+    except Exception as e:
+        print(f"Model cannot be flattened ({e}); every worker loads the pickle instead")
+        return None
+    compiled_dir = os.path.join(work_dir, "compiled")
+    compiled.save(compiled_dir)
+    return compiled_dir
+
+# Worker side
+_score = None
+
+def init_worker(compiled_dir, model_path, feature_names):
+    global _score
+    if compiled_dir is not None:
+        forest = CompiledForest.load(compiled_dir, mmap_mode="r")
+        _score = lambda X: forest.predict_proba(X)[:, 1]
+    else:
+        model = joblib.load(model_path)
+        _score = lambda X: model.predict_proba(pd.DataFrame(X, columns=feature_names))[:, 1]
+
+def score_chunk(X):
+    return _score(X)
+
+# Input
+def list_inputs(source):
+    """Local files, a local directory, or an s3://bucket/prefix, as a sorted list of paths/URIs."""
+    if source.startswith("s3://"):
+        bucket, _, prefix = source[len("s3://"):].partition("/")
+        paginator = get_s3_client().get_paginator("list_objects_v2")
+        keys = []
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []) if obj["Key"].endswith((".csv", ".parquet")))
+        return [f"s3://{bucket}/{key}" for key in sorted(keys)]
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source) if name.endswith((".csv", ".parquet")))
+    return [source]
+
+def open_input(path):
+    if path.startswith("s3://"):
+        if path.endswith(".parquet"):
+            # Random access through ranged GETs: only the footer and the row groups being read are fetched
+            return get_arrow_s3().open_input_file(path[len("s3://"):])
+        bucket, _, key = path[len("s3://"):].partition("/")
+        # CSV can be read as a stream
+        return get_s3_client().get_object(Bucket=bucket, Key=key)["Body"]
+    return path
+
+def iter_chunks(paths, chunk_rows):
+    for path in paths:
+        source = open_input(path)
+        if path.endswith(".parquet"):
+            parquet = pq.ParquetFile(source)
+            try:
+                # One row group at a time, so a large file is never held in memory whole
+                for group in range(parquet.num_row_groups):
+                    for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=[group]):
+                        yield batch.to_pandas()
+            finally:
+                parquet.close()
+                if source is not path:
+                    source.close()
+        else:
+            yield from pd.read_csv(source, chunksize=chunk_rows)
+
+# Output
+class ChunkWriter:
+    """Append scored chunks to one CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith(".parquet")
+        self._writer = None
+        self._first = True
+
+    def write(self, df):
+        if self.parquet:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def to_matrix(chunk, feature_names):
+    missing = [c for c in feature_names if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Input is missing the model's features {missing}")
+    return chunk[feature_names].to_numpy(dtype=np.float32)
+
+def output_frame(chunk, proba, threshold, keep_columns):
+    out = chunk[keep_columns].reset_index(drop=True) if keep_columns else pd.DataFrame(index=range(len(proba)))
+    out["probability"] = proba
+    out["class"] = (proba >= threshold).astype(np.int8)
+    return out
+
+# Main
+def run(source, output, model_key=None, local=False, workers=os.cpu_count(), chunk_rows=100_000,
+        threshold=0.5, keep_columns=()):
+    """Score every row of `source` into `output`; returns a summary with rows per second."""
+    started = time.perf_counter()
+    description, model_path = resolve_model(model_key, local)
+    model = joblib.load(model_path)
+    feature_names = feature_names_of(model)
+    paths = list_inputs(source)
+    if not paths:
+        raise FileNotFoundError(f"No CSV or Parquet input found at {source}")
+    print(f"Scoring {len(paths)} file(s) with {description} on {workers or 1} process(es)")
+
+    work_dir = tempfile.mkdtemp(prefix="batch_score_")
+    writer = ChunkWriter(output)
+    rows = 0
+    try:
+        compiled_dir = prepare_shared_model(model, work_dir)
+        del model  # workers use the shared copy
+        setup = time.perf_counter() - started
+
+        def write(chunk, proba):
+            nonlocal rows
+            writer.write(output_frame(chunk, proba, threshold, list(keep_columns)))
+            rows += len(chunk)
+
+        if workers and workers > 1:
+            with ProcessPoolExecutor(workers, initializer=init_worker,
+                                     initargs=(compiled_dir, model_path, feature_names)) as pool:
+                # A bounded window of chunks in flight keeps memory flat; results are written in input order
+                in_flight = deque()
+                for chunk in iter_chunks(paths, chunk_rows):
+                    in_flight.append((chunk, pool.submit(score_chunk, to_matrix(chunk, feature_names))))
+                    if len(in_flight) >= 2 * workers:
+                        done_chunk, future = in_flight.popleft()
+                        write(done_chunk, future.result())
+                while in_flight:
+                    done_chunk, future = in_flight.popleft()
+                    write(done_chunk, future.result())
+        else:
+            init_worker(compiled_dir, model_path, feature_names)
+            for chunk in iter_chunks(paths, chunk_rows):
+                write(chunk, score_chunk(to_matrix(chunk, feature_names)))
+    finally:
+        writer.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "model": description,
+        "files": len(paths),
+        "rows": rows,
+        "seconds": elapsed,
+        "setup_seconds": setup,
+        "rows_per_second": rows / max(elapsed - setup, 1e-9),
+        "output": output,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="CSV or Parquet file, a directory of them, or s3://bucket/prefix")
+    parser.add_argument("output", help="output .csv or .parquet file")
+    parser.add_argument("--model-key", help="S3 key of the model to use (default: the served model)")
+    parser.add_argument("--local", action="store_true", help=f"use {LATEST_MODEL_PATH} instead of model_backups/")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--keep-columns", default="", help="comma-separated input columns copied to the output")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    summary = run(args.source, args.output, args.model_key, args.local, args.workers, args.chunk_rows,
+                  args.threshold, [c for c in args.keep_columns.split(",") if c])
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,442 @@
+"""Load test for the /predict endpoint.
+
+Starts a local fake S3 (moto server) holding a local model pickle, launches
+app.py against it and replays request payloads at a fixed concurrency
+(closed loop) or a fixed arrival rate (open loop). Results are printed as
+JSON: latency percentiles, throughput, status counts and CPU/RSS for every
+server process.
+
+    python benchmark.py --mode closed --concurrency 16 --duration 30
+    python benchmark.py --mode open --rate 500 --duration 30 --output bench.json
+    python benchmark.py --url http://localhost:8000 --token $API_TOKEN --mode open --rate 200
+
+In open-loop mode every request has a scheduled send time and its latency is
+measured from that time, so a stalled server shows up as queueing delay
+instead of silently lowering the offered load (coordinated omission).
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+from compiled_forest import FEATURE_COLUMNS
+from config import LATEST_MODEL_PATH
+
+BENCH_BUCKET = "benchmark-bucket"
+BENCH_TOKEN = "benchmark-token"
+MODEL_KEY = "model_backups/benchmark-Model/model.pkl"
+CONTENT_TYPES = {
+    "records": "application/json",
+    "columns": "application/json",
+    "float32": "application/octet-stream",
+}
+
+
+# Payloads
+def synthetic_payloads(n_requests, rows_per_request, fmt="records", seed=0):
+    """Rows with the same distributions as generate_weekly_data.py (without drift), in one /predict layout."""
+    rng = np.random.default_rng(seed)
+    n = n_requests * rows_per_request
+    X = np.column_stack([
+        rng.integers(1, 53, n).astype(float),
+        rng.normal(0, 1, (n, 28)),
+        rng.exponential(100, n),
+    ])
+    batches = [X[i:i + rows_per_request] for i in range(0, n, rows_per_request)]
+    if fmt == "float32":
+        return [batch.astype("<f4").tobytes() for batch in batches]
+    orient = "list" if fmt == "columns" else "records"
+    return [json.dumps({"data": pd.DataFrame(batch, columns=FEATURE_COLUMNS).to_dict(orient=orient)}).encode()
+            for batch in batches]
+
+
+def load_payloads(path):
+    """Request bodies from a JSON-lines file: `{"data": [...]}`, a list of records or a single record per line."""
+    payloads = []
+    with open(path) as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(item, dict) and "data" in item:
+                records = item["data"]
+            elif isinstance(item, dict):
+                records = [item]
+            else:
+                records = item
+            if isinstance(records, list) and records and all(
+                    isinstance(r, dict) and set(FEATURE_COLUMNS) <= set(r) for r in records):
+                payloads.append(json.dumps({"data": records}).encode())
+    if not payloads:
+        raise ValueError(f"No /predict payloads found in {path}")
+    return payloads
+
+
+# Fake S3 + server under test
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_model_pickle(path):
+    """Fit a small model on synthetic rows when no local pickle is available."""
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(5000, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    y = (X["V1"] + rng.normal(size=len(X)) > 2).astype(int)
+    model = RandomForestClassifier(n_estimators=25, max_depth=8, class_weight="balanced", random_state=0)
+    joblib.dump(model.fit(X, y), path)
+    return path
+
+
+def start_fake_s3(model_path):
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        sys.exit('The benchmark needs moto for its local S3: pip install "moto[server]"')
+    import boto3
+    from model_registry import publish_pointer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    s3 = boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1",
+                      aws_access_key_id="benchmark", aws_secret_access_key="benchmark")
+    s3.create_bucket(Bucket=BENCH_BUCKET)
+    s3.upload_file(model_path, BENCH_BUCKET, MODEL_KEY)
+    publish_pointer(s3, BENCH_BUCKET, "model_backups", MODEL_KEY)
+    return server, endpoint
+
+
+def start_server(command, endpoint, port, work_dir):
+    """Launch the API against the fake S3. Settings not overridden here are inherited from the environment."""
+    env = {
+        **os.environ,
+        "AWS_ENDPOINT_URL": endpoint,
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "BUCKET_NAME": BENCH_BUCKET,
+        "MODEL_BACKUPS_PREFIX": "model_backups",
+        "API_TOKEN": BENCH_TOKEN,
+        "PORT": str(port),
+        "MODEL_CACHE_DIR": os.path.join(work_dir, "model_cache"),
+        "REQUEST_LOG_DIR": os.path.join(work_dir, "request_logs"),
+        "SHARED_MODEL_DIR": os.path.join(work_dir, "shared_models"),
+    }
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen(shlex.split(command), cwd=app_dir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(url, token, timeout=120):
+    """Block until the API answers and has a model loaded."""
+    parsed = urlparse(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=5)
+            conn.request("GET", "/models", headers={"Authorization": f"Bearer {token}"})
+            resp = conn.getresponse()
+            body = resp.read()
+            conn.close()
+            if resp.status == 200 and json.loads(body).get("current"):
+                return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"API at {url} did not load a model within {timeout}s")
+
+
+# Per-process CPU and memory from /proc
+def process_tree(root_pid):
+    """The server process and all its descendants (pre-fork workers included)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def read_process(pid):
+    """(cpu_seconds, rss_mb) of one process, or None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (int(fields[11]) + int(fields[12])) / ticks, rss_kb / 1024
+
+
+class ResourceSampler:
+    """Samples CPU time and RSS of a process tree in the background."""
+
+    def __init__(self, root_pid, interval=0.5):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.start = {}
+        self.last = {}
+        self.peak_rss = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        for pid in process_tree(self.root_pid):
+            stats = read_process(pid)
+            if stats is None:
+                continue
+            self.start.setdefault(pid, stats)
+            self.last[pid] = stats
+            self.peak_rss[pid] = max(self.peak_rss.get(pid, 0.0), stats[1])
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._sample()
+            self._stop.wait(self.interval)
+
+    def begin(self):
+        self._sample()
+        self.started_at = time.monotonic()
+        self._thread.start()
+
+    def end(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        elapsed = time.monotonic() - self.started_at
+        workers = []
+        for pid in sorted(self.last):
+            cpu = self.last[pid][0] - self.start[pid][0]
+            workers.append({
+                "pid": pid,
+                "role": "main" if pid == self.root_pid else "worker",
+                "cpu_seconds": round(cpu, 3),
+                "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed > 0 else 0.0,
+                "rss_mb": round(self.last[pid][1], 1),
+                "peak_rss_mb": round(self.peak_rss[pid], 1),
+            })
+        return workers
+
+
+# Load generation
+class Client:
+    """One keep-alive connection; reconnects when the server closes it."""
+
+    def __init__(self, url, token, content_type="application/json"):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.headers = {"Content-Type": content_type, "Authorization": f"Bearer {token}"}
+        self.conn = None
+
+    def post(self, body):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            self.conn.request("POST", "/predict", body=body, headers=self.headers)
+            resp = self.conn.getresponse()
+            resp.read()
+            if resp.will_close:
+                self.conn.close()
+                self.conn = None
+            return resp.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            return 0
+
+
+def run_load(url, token, payloads, mode, concurrency, duration, rate=None, poisson=False, seed=0,
+             content_type="application/json"):
+    """Send requests for `duration` seconds and return (latencies in s, status codes, wall time)."""
+    latencies = [[] for _ in range(concurrency)]
+    statuses = [[] for _ in range(concurrency)]
+    counter = iter(range(sys.maxsize))
+    counter_lock = threading.Lock()
+    started = time.perf_counter()
+    stop_at = started + duration
+
+    if mode == "open":
+        # Fixed schedule of send times, independent of how fast the server answers
+        n = int(rate * duration)
+        if poisson:
+            gaps = np.random.default_rng(seed).exponential(1.0 / rate, n)
+            schedule = started + np.cumsum(gaps)
+        else:
+            schedule = started + np.arange(n) / rate
+
+    def worker(w):
+        client = Client(url, token, content_type)
+        while True:
+            with counter_lock:
+                i = next(counter)
+            if mode == "open":
+                if i >= len(schedule):
+                    return
+                intended = schedule[i]
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                intended = time.perf_counter()
+                if intended >= stop_at:
+                    return
+            status = client.post(payloads[i % len(payloads)])
+            latencies[w].append(time.perf_counter() - intended)
+            statuses[w].append(status)
+
+    threads = [threading.Thread(target=worker, args=(w,), daemon=True) for w in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    return np.array([x for l in latencies for x in l]), [s for l in statuses for s in l], wall
+
+
+def summarize(latencies, statuses, wall):
+    ms = latencies * 1000
+    ok = sum(1 for s in statuses if s == 200)
+    codes = {}
+    for s in statuses:
+        codes[str(s)] = codes.get(str(s), 0) + 1
+    pct = np.percentile(ms, [50, 95, 99, 99.9]) if len(ms) else [0.0] * 4
+    return {
+        "requests": len(statuses),
+        "ok": ok,
+        "errors": len(statuses) - ok,
+        "status_codes": codes,
+        "duration_s": round(wall, 3),
+        "rps": round(len(statuses) / wall, 2) if wall > 0 else 0.0,
+        "latency_ms": {
+            "p50": round(float(pct[0]), 3),
+            "p95": round(float(pct[1]), 3),
+            "p99": round(float(pct[2]), 3),
+            "p999": round(float(pct[3]), 3),
+            "max": round(float(ms.max()), 3) if len(ms) else 0.0,
+            "mean": round(float(ms.mean()), 3) if len(ms) else 0.0,
+        },
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Load test the /predict endpoint.")
+    p.add_argument("--mode", choices=["closed", "open"], default="closed",
+                   help="closed: fixed concurrency; open: fixed arrival rate")
+    p.add_argument("--concurrency", type=int, default=8,
+                   help="client threads (in open mode: the most requests in flight)")
+    p.add_argument("--rate", type=float, default=100.0, help="requests per second in open mode")
+    p.add_argument("--poisson", action="store_true", help="exponential inter-arrival times in open mode")
+    p.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    p.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the run")
+    p.add_argument("--requests", help="JSON-lines file of request payloads (default: synthetic rows)")
+    p.add_argument("--rows-per-request", type=int, default=1)
+    p.add_argument("--payload-format", choices=sorted(CONTENT_TYPES), default="records",
+                   help="layout of the synthetic payloads (JSON records, JSON columns or raw float32)")
+    p.add_argument("--model", default=LATEST_MODEL_PATH,
+                   help="local model pickle served from the fake S3 (a small one is trained if missing)")
+    p.add_argument("--server-cmd", default="python app.py", help="command that starts the API")
+    p.add_argument("--url", help="benchmark an already running API instead of starting one")
+    p.add_argument("--token", default=os.getenv("API_TOKEN"), help="API token when using --url")
+    p.add_argument("--pid", type=int, help="server PID to sample CPU/RSS for when using --url")
+    p.add_argument("--output", help="write the JSON report here instead of stdout")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.requests:
+        payloads = load_payloads(args.requests)
+    else:
+        payloads = synthetic_payloads(max(100, 10_000 // args.rows_per_request), args.rows_per_request,
+                                      args.payload_format)
+    content_type = "application/json" if args.requests else CONTENT_TYPES[args.payload_format]
+
+    fake_s3 = server = None
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        if args.url:
+            url, token, server_pid = args.url, args.token, args.pid
+        else:
+            model_path = args.model
+            if not os.path.exists(model_path):
+                model_path = build_model_pickle(os.path.join(work_dir, "model.pkl"))
+            fake_s3, endpoint = start_fake_s3(model_path)
+            port = free_port()
+            server = start_server(args.server_cmd, endpoint, port, work_dir)
+            url, token, server_pid = f"http://127.0.0.1:{port}", BENCH_TOKEN, server.pid
+        wait_until_ready(url, token)
+
+        if args.warmup > 0:
+            run_load(url, token, payloads, args.mode, args.concurrency, args.warmup, args.rate, args.poisson,
+                     content_type=content_type)
+
+        sampler = ResourceSampler(server_pid) if server_pid else None
+        if sampler:
+            sampler.begin()
+        latencies, statuses, wall = run_load(url, token, payloads, args.mode, args.concurrency,
+                                             args.duration, args.rate, args.poisson,
+                                             content_type=content_type)
+        report = {
+            "config": {
+                "mode": args.mode,
+                "concurrency": args.concurrency,
+                "rate": args.rate if args.mode == "open" else None,
+                "poisson": args.poisson if args.mode == "open" else None,
+                "duration_s": args.duration,
+                "rows_per_request": args.rows_per_request,
+                "payloads": args.requests or f"synthetic {args.payload_format}",
+                "server_cmd": None if args.url else args.server_cmd,
+            },
+            **summarize(latencies, statuses, wall),
+            "workers": sampler.end() if sampler else [],
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if fake_s3 is not None:
+            fake_s3.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    lat = report["latency_ms"]
+    print(f"{report['rps']} req/s, p50 {lat['p50']} ms, p99 {lat['p99']} ms, "
+          f"p99.9 {lat['p999']} ms, {report['errors']} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Compare the class-imbalance strategies of resampling.py on the creditcard dataset.
+
+Every strategy resamples the same stratified training split and fits the
+training forest (resampling.build_model) in a fresh forked process, so its peak
+memory is measured on its own. Prints wall time, peak memory, training rows,
+precision, recall and PR-AUC on the untouched test split, and names the
+cheapest strategy whose recall stays within PROMOTION_MAX_RECALL_DROP of
+plain SMOTE.
+
+    python benchmark_resampling.py                              # dataset/creditcard.csv from S3
+    python benchmark_resampling.py --csv creditcard.csv --output resampling.json
+    python benchmark_resampling.py --synthetic 300000 --strategies class_weight,undersample,smote_approx
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from sklearn.metrics import average_precision_score, precision_score, recall_score
+from sklearn.model_selection import train_test_split
+from config import (
+    RANDOM_STATE, OVERSAMPLING_RATIO, UNDERSAMPLING_RATIO, SMOTE_K_NEIGHBORS, SMOTE_N_JOBS, SMOTE_BLOCK_SIZE,
+    PROMOTION_MAX_RECALL_DROP, FULL_DATASET_KEY,
+)
+from resampling import STRATEGIES, build_model, make_resampler
+
+BASELINE = "smote"
+
+# Split shared with the forked workers (copy-on-write, never pickled)
+_split = None
+
+
+def rss_mb():
+    """Current resident set size (Linux), falling back to the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_strategy(strategy, seed):
+    """Resample, fit and score one strategy; runs in a freshly forked process."""
+    X_train, X_test, y_train, y_test = _split
+    start_rss = rss_mb()
+    resampler = make_resampler(strategy, seed, OVERSAMPLING_RATIO, UNDERSAMPLING_RATIO,
+                               SMOTE_K_NEIGHBORS, SMOTE_N_JOBS, SMOTE_BLOCK_SIZE)
+    started = time.perf_counter()
+    X_fit, y_fit = resampler.fit_resample(X_train, y_train)
+    resampled = time.perf_counter()
+    model = build_model(random_state=seed).fit(X_fit, y_fit)
+    fitted = time.perf_counter()
+    proba = model.predict_proba(X_test)[:, 1]
+    preds = (proba >= 0.5).astype(int)
+    return {
+        "strategy": strategy,
+        "resample_seconds": resampled - started,
+        "fit_seconds": fitted - resampled,
+        "total_seconds": fitted - started,
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - start_rss,
+        "training_rows": len(y_fit),
+        "minority_rows": int((pd.Series(y_fit) == 1).sum()),
+        "precision": precision_score(y_test, preds, zero_division=0),
+        "recall": recall_score(y_test, preds, zero_division=0),
+        "pr_auc": average_precision_score(y_test, proba),
+    }
+
+
+def load_data(args):
+    if args.synthetic:
+        from generate_weekly_data import generate_rows
+        import numpy as np
+        return generate_rows(args.synthetic, np.random.default_rng(args.seed), fraud_ratio=0.0017, fraud_signal=2.0)
+    if args.csv:
+        return pd.read_csv(args.csv)
+    from s3_data import load_csv_object
+    return load_csv_object(FULL_DATASET_KEY)
+
+
+def pick_cheapest(results, max_recall_drop):
+    """Fastest strategy whose recall is within `max_recall_drop` of the baseline (or of the best recall)."""
+    by_name = {r["strategy"]: r for r in results}
+    reference = by_name[BASELINE]["recall"] if BASELINE in by_name else max(r["recall"] for r in results)
+    eligible = [r for r in results if r["recall"] >= reference - max_recall_drop]
+    return min(eligible, key=lambda r: r["total_seconds"])["strategy"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", help="local creditcard.csv instead of the copy in S3")
+    parser.add_argument("--synthetic", type=int, help="use this many generated rows instead of the real dataset")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--seed", type=int, default=RANDOM_STATE)
+    parser.add_argument("--max-recall-drop", type=float, default=PROMOTION_MAX_RECALL_DROP)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args()
+
+
+def main():
+    global _split
+    args = parse_args()
+    df = load_data(args)
+    X = df.drop("Class", axis=1)
+    y = df["Class"]
+    _split = train_test_split(X, y, test_size=0.2, stratify=y, random_state=args.seed)
+    print(f"{len(df)} rows, {int(y.sum())} fraud; training split {len(_split[0])} rows")
+
+    results = []
+    context = multiprocessing.get_context("fork")
+    for strategy in args.strategies.split(","):
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(run_strategy, strategy, args.seed).result()
+        results.append(result)
+        print(f"{strategy:>13}: {result['total_seconds']:7.2f}s (resample {result['resample_seconds']:.2f}s), "
+              f"+{result['peak_memory_mb']:.0f} MB, {result['training_rows']} rows, "
+              f"precision {result['precision']:.3f}, recall {result['recall']:.3f}, PR-AUC {result['pr_auc']:.3f}")
+
+    summary = {"rows": len(df), "results": results, "cheapest": pick_cheapest(results, args.max_recall_drop)}
+    print(f"Cheapest strategy keeping recall: {summary['cheapest']} (set RESAMPLING_STRATEGY in config.py)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
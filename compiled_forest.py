@@ -0,0 +1,147 @@
+import json
+import os
+import numpy as np
+
+FEATURE_COLUMNS = ['Time'] + [f'V{i}' for i in range(1, 29)] + ['Amount']
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "missing_left", "value", "roots", "classes_")
+
+
+def feature_names_of(model):
+    """Column order the model was fitted with, defaulting to the creditcard schema."""
+    names = getattr(model, "feature_names_in_", None)
+    return list(names) if names is not None else list(FEATURE_COLUMNS)
+
+
+def rows_to_matrix(rows, feature_names):
+    """Convert a list of JSON records into a float64 matrix in the given column order."""
+    return np.array([[row[name] for name in feature_names] for row in rows], dtype=np.float64)
+
+
+class CompiledForest:
+    """RandomForestClassifier flattened into NumPy node arrays.
+
+    All trees are concatenated into one set of arrays so a batch is scored
+    with a single vectorized walk (one step per tree level) instead of going
+    through sklearn's per-call validation and pandas column handling.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value,
+                 roots, max_depth, classes, feature_names):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.feature_names = feature_names
+        self.n_trees = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Build the node arrays from a fitted sklearn forest classifier."""
+        estimators = getattr(model, "estimators_", None)
+        if not estimators or getattr(model, "n_outputs_", 1) != 1:
+            raise TypeError(f"Cannot compile model of type {type(model).__name__}")
+
+        features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for est in estimators:
+            tree = est.tree_
+            n = tree.node_count
+            node_ids = np.arange(n, dtype=np.int64) + offset
+            is_leaf = tree.children_left == -1
+
+            # Leaves point to themselves so extra traversal steps are no-ops
+            left = np.where(is_leaf, node_ids, tree.children_left + offset)
+            right = np.where(is_leaf, node_ids, tree.children_right + offset)
+            feature = np.where(is_leaf, 0, tree.feature).astype(np.int64)
+
+            miss = getattr(tree, "missing_go_to_left", None)
+            miss = np.zeros(n, dtype=bool) if miss is None else np.asarray(miss, dtype=bool)
+
+            # Same per-tree normalisation as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            value = value / normalizer
+
+            features.append(feature)
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(left)
+            rights.append(right)
+            missing.append(miss)
+            values.append(value)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            missing_left=np.concatenate(missing),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            classes=np.asarray(model.classes_),
+            feature_names=feature_names_of(model),
+        )
+
+    def save(self, directory):
+        """Write the node arrays as .npy files so other processes can memory-map them."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"max_depth": int(self.max_depth), "feature_names": list(self.feature_names)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Open a saved forest; with `mmap_mode` every process shares the same pages."""
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ARRAY_NAMES}
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(
+            feature=arrays["feature"],
+            threshold=arrays["threshold"],
+            left=arrays["left"],
+            right=arrays["right"],
+            missing_left=arrays["missing_left"],
+            value=arrays["value"],
+            roots=arrays["roots"],
+            max_depth=meta["max_depth"],
+            classes=np.asarray(arrays["classes_"]),
+            feature_names=meta["feature_names"],
+        )
+
+    def rows_to_matrix(self, rows):
+        """Convert a list of JSON records into a float64 matrix in model column order."""
+        return rows_to_matrix(rows, self.feature_names)
+
+    def predict_proba(self, X):
+        """Class probabilities for a 2D array whose columns follow `feature_names`."""
+        # sklearn casts inputs to float32 before comparing with float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f"Expected input of shape (n, {len(self.feature_names)}), got {X.shape}")
+        n_samples = X.shape[0]
+
+        nodes = np.repeat(self.roots, n_samples)
+        samples = np.tile(np.arange(n_samples), self.n_trees)
+        for _ in range(self.max_depth):
+            x = X[samples, self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        leaf_values = self.value[nodes].reshape(self.n_trees, n_samples, -1)
+        return leaf_values.sum(axis=0) / self.n_trees
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -1,13 +1,95 @@
 BUCKET_NAME = "fraud-detection-project-data-science-2025"
 WEEKS_PREFIX = "weekly_data/"
+WEEK_STATS_PREFIX = "weekly_stats/"
+DRIFT_ALERTS_PREFIX = "drift_alerts/"  # live drift alerts written by the API
+FULL_DATASET_KEY = "dataset/creditcard.csv"  # full training dataset for train.py
+
+# Local Arrow mirror of S3 CSVs (weekly data and the full training dataset)
+DATASET_CACHE_DIR = "./dataset_cache"
+DOWNLOAD_WORKERS = 8
 
 MLFLOW_TRACKING_URI = "file:./mlruns"
 LATEST_MODEL_PATH = "./models/latest_model/model.pkl"
 
 CHECK_INTERVAL = 150
 
+# Drift tests to run: any of "ttest", "ks", "psi"
+DRIFT_TESTS = ["ttest"]
+PSI_THRESHOLD = 0.2
+
 NUM_WEEKS_FOR_TRAINING = 12
 
+# Chunked training (train.py) for data larger than RAM
+STREAMING_TRAINING = False
+TRAINING_CHUNK_SIZE = 50_000
+MAJORITY_SAMPLE_RATE = 1.0
+FIT_BUFFER_ROWS = 200_000
+TREES_PER_BATCH = 25
+STREAMING_HOLDOUT_ROWS = 50_000  # newest rows held out for the test metrics and the promotion gate
+
+RANDOM_STATE = 42
+
+# Class-imbalance handling before fitting (resampling.py): "class_weight", "undersample",
+# "oversample", "smote" or "smote_approx"; compare them with benchmark_resampling.py
+RESAMPLING_STRATEGY = "smote"
+OVERSAMPLING_RATIO = 1.0  # minority per majority row after over-sampling (1.0 = balanced, as plain SMOTE)
+UNDERSAMPLING_RATIO = 0.1  # minority per majority row after majority undersampling
+SMOTE_K_NEIGHBORS = 5
+SMOTE_N_JOBS = -1  # parallel neighbour search of "smote"
+SMOTE_BLOCK_SIZE = 2048  # minority rows per neighbour-search block of "smote_approx"
+
+# Cross-validated hyperparameter search in retrain.py ("grid" or "halving")
+HYPERPARAM_SEARCH = False
+SEARCH_STRATEGY = "grid"
+SEARCH_GRID = {
+    "n_estimators": [25, 50],
+    "max_depth": [8, 12],
+    "min_samples_leaf": [1, 3],
+}
+SEARCH_CV_FOLDS = 5
+SEARCH_WORKERS = 4
+SEARCH_TIME_BUDGET = 600  # seconds
+HALVING_FACTOR = 3
+
+# Incremental retraining: grow the served forest with warm_start instead of refitting it
+INCREMENTAL_RETRAINING = False
+INCREMENTAL_NEW_WEEKS = 1  # weeks of new data per incremental run
+INCREMENTAL_NEW_TREES = 10
+INCREMENTAL_MAX_TREES = 25  # the weakest trees on recent data are dropped beyond this; same size keeps latency flat
+INCREMENTAL_MIN_TREE_SCORE_RATIO = 0.5  # trees scoring below this fraction of the median are dropped
+INCREMENTAL_HISTORY_FRACTION = 0.3  # share of the training rows drawn from the historical reservoir
+INCREMENTAL_VALIDATION_FRACTION = 0.2  # share of the newest week's rows held back to score the trees
+
+# Uniform sample of all weekly data seen so far, kept in S3 for incremental retraining
+RESERVOIR_KEY = "reservoir/reservoir.parquet"
+RESERVOIR_SIZE = 200_000
+
+# Held-out rows for retrain.py's test metrics and promotion gate: a hash-selected share of the
+# newest weekly files, which the served model has not trained on
+HOLDOUT_WEEKS = 1
+HOLDOUT_FRACTION = 0.5
+
+# Champion/challenger gate: a new model is only uploaded if it beats the served one
+PROMOTION_GATE = True
+MODEL_CACHE_DIR = "./models/cache"
+PROMOTION_BATCH_SIZE = 1000
+PROMOTION_REPLAY_DIR = "request_logs"  # closed request-log segments written by the API
+PROMOTION_REPLAY_ROWS = 100_000
+PROMOTION_MIN_PR_AUC_GAIN = 0.0
+PROMOTION_MAX_RECALL_DROP = 0.02
+PROMOTION_MAX_PRECISION_DROP = 0.05
+PROMOTION_MAX_LATENCY_RATIO = 1.5
+PROMOTION_RESULTS_FILE = "promotion.json"
+
+# Training-data feature statistics uploaded with each model; the API compares live traffic with them
+REFERENCE_STATS_FILE = "reference_stats.json"
+
+# Model publishing (artifact_pipeline.py)
+MODEL_COMPRESSION = 0  # joblib compression level of model.pkl (0 = none: larger upload, fastest load)
+UPLOAD_WORKERS = 8  # files uploaded in parallel, and threads per multipart upload
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+ASYNC_MLFLOW_LOGGING = True  # log the model to MLflow in the background instead of before the upload
+
 ENABLE_S3_MODEL_BACKUP = True
 S3_MODEL_PATH = "models/latest_model/model.pkl"
 S3_MODEL_BACKUP_PREFIX = "model_backups"
@@ -1,80 +1,94 @@
 import pandas as pd
-from io import BytesIO
-import boto3
+import json
 import os
-from dotenv import load_dotenv
-from config import BUCKET_NAME, WEEKS_PREFIX
-from scipy.stats import ttest_ind
+from config import BUCKET_NAME, WEEK_STATS_PREFIX, DRIFT_TESTS, PSI_THRESHOLD
+from drift_stats import FeatureStats, has_current_bins, merge_all, drift_report, drifted_features
+from s3_data import get_s3_client, list_week_objects, load_week_frame, load_week_frames
 
-# Load environment variables
-load_dotenv()
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
+# Shared boto3 S3 client
+s3_client = get_s3_client()
 
-# boto3 S3 client
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_DEFAULT_REGION
-)
+def list_week_keys():
+    """All weekly CSV keys, oldest first."""
+    return [key for key, _ in list_week_objects()]
 
 def load_latest_weeks(n_weeks=3):
     """Load the latest week as new data, and previous n_weeks as reference."""
-    resp = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=WEEKS_PREFIX)
-    files = sorted([obj["Key"] for obj in resp.get("Contents", []) if obj["Key"].endswith(".csv")])
+    files = list_week_objects()
     if len(files) < n_weeks + 1:
         print(f"Not enough data: need {n_weeks+1} weeks, found {len(files)}")
         return None, None
 
     # Newest week
-    latest_key = files[-1]
-    latest_obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=latest_key)
-    df_latest = pd.read_csv(BytesIO(latest_obj["Body"].read()))
+    df_latest = load_week_frame(*files[-1])
 
     # Reference: previous n_weeks
-    ref_keys = files[-(n_weeks+1):-1]
-    df_ref_list = []
-    for key in ref_keys:
-        obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-        df_ref_list.append(pd.read_csv(BytesIO(obj["Body"].read())))
-    df_ref = pd.concat(df_ref_list, ignore_index=True)
+    df_ref = load_week_frames(files[-(n_weeks+1):-1])
 
     return df_ref, df_latest
 
-def check_drift(reference_df, latest_df, alpha=0.05):
-    """Check for drift using t-tests per numeric feature with Bonferroni correction."""
-    drifted_features = []
-    numeric_cols = [c for c in reference_df.columns if pd.api.types.is_numeric_dtype(reference_df[c])]
+# Per-week sufficient statistics
+_stats_cache = {}
+
+def stats_key_for(week_key):
+    return f"{WEEK_STATS_PREFIX}{os.path.basename(week_key)[:-len('.csv')]}.json"
+
+def load_week_stats(week_key, etag):
+    """Stats for one weekly CSV: from memory, from S3, or computed once from the raw file.
+
+    Stored stats carry the ETag of the CSV they were computed from, so a
+    weekly file that was appended to is summarised again, as are stats
+    binned with older histogram edges.
+    """
+    if (week_key, etag) in _stats_cache:
+        return _stats_cache[(week_key, etag)]
+    stats_key = stats_key_for(week_key)
+    stats = None
+    try:
+        obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=stats_key)
+        stored = json.loads(obj["Body"].read())
+        if stored.get("source_etag") == etag and has_current_bins(stored):
+            stats = FeatureStats.from_dict(stored)
+    except s3_client.exceptions.NoSuchKey:
+        pass
+    if stats is None:
+        stats = FeatureStats.from_frame(load_week_frame(week_key, etag))
+        body = json.dumps({**stats.to_dict(), "source_etag": etag}).encode("utf-8")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=stats_key, Body=body)
+    _stats_cache[(week_key, etag)] = stats
+    return stats
+
+def load_latest_week_stats(n_weeks=3):
+    """Stats of the latest week, and merged stats of the previous n_weeks as reference."""
+    files = list_week_objects()
+    if len(files) < n_weeks + 1:
+        print(f"Not enough data: need {n_weeks+1} weeks, found {len(files)}")
+        return None, None
+    ref_stats = merge_all([load_week_stats(key, etag) for key, etag in files[-(n_weeks+1):-1]])
+    return ref_stats, load_week_stats(*files[-1])
 
-    n_tests = len(numeric_cols)
+def check_drift_stats(ref_stats, latest_stats, alpha=0.05, tests=DRIFT_TESTS, psi_threshold=PSI_THRESHOLD):
+    """Run the selected drift tests on all features at once from precomputed stats."""
+    report = drift_report(ref_stats, latest_stats)
+    n_tests = len(report["columns"])
     if n_tests == 0:
         print("No numeric features found to test.")
         return []
+    print(f"Performing {n_tests} {'/'.join(tests)} tests with Bonferroni correction (α={alpha}, adjusted α={alpha / n_tests:.6f})")
+    return drifted_features(report, alpha=alpha, tests=tests, psi_threshold=psi_threshold)
 
-    alpha_adj = alpha / n_tests
-    print(f"Performing {n_tests} t-tests with Bonferroni correction (α={alpha}, adjusted α={alpha_adj:.6f})")
-
-    for col in numeric_cols:
-        if col not in latest_df.columns:
-            continue
-        ref_col = reference_df[col].dropna()
-        new_col = latest_df[col].dropna()
-        if len(ref_col) < 2 or len(new_col) < 2:
-            continue
-        try:
-            t_stat, p_value = ttest_ind(ref_col, new_col, equal_var=False)
-            if p_value < alpha_adj:
-                drifted_features.append(col)
-        except Exception as e:
-            print(f"Skipping {col} due to error: {e}")
-    return drifted_features
+def check_drift(reference_df, latest_df, alpha=0.05):
+    """Check for drift using t-tests per numeric feature with Bonferroni correction."""
+    numeric_cols = [c for c in reference_df.columns if pd.api.types.is_numeric_dtype(reference_df[c])]
+    numeric_cols = [c for c in numeric_cols if c in latest_df.columns]
+    ref_stats = FeatureStats.from_frame(reference_df, numeric_cols)
+    latest_stats = FeatureStats.from_frame(latest_df, numeric_cols)
+    return check_drift_stats(ref_stats, latest_stats, alpha=alpha)
 
 if __name__ == "__main__":
-    df_ref, df_latest = load_latest_weeks(n_weeks=3)
-    if df_latest is not None and df_ref is not None:
-        drift_features = check_drift(df_ref, df_latest, alpha=0.05)
+    ref_stats, latest_stats = load_latest_week_stats(n_weeks=3)
+    if latest_stats is not None and ref_stats is not None:
+        drift_features = check_drift_stats(ref_stats, latest_stats, alpha=0.05)
         if drift_features:
             print("Drift detected in features:", drift_features)
         else:
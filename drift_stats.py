@@ -0,0 +1,174 @@
+import numpy as np
+
+# Shared histogram edges on an asinh scale: fine near zero, and identical for
+# every week and feature so histograms can simply be added together. asinh(16)
+# is ~4.4e6, so Time (seconds, up to 604,800 for a generated week) and Amount
+# stay inside the edges; bins are 0.1 wide, i.e. ~10% of the value above ~10.
+HIST_EDGES = np.linspace(-16.0, 16.0, 321)
+N_BINS = len(HIST_EDGES) + 1  # plus underflow and overflow bins
+
+
+def has_current_bins(d):
+    """Whether stored stats were binned with the current HIST_EDGES."""
+    return all(len(row) == N_BINS for row in d["hist"])
+
+
+class FeatureStats:
+    """Mergeable per-feature sufficient statistics for one or more weeks of data.
+
+    Holds count, mean and M2 (sum of squared deviations, Welford/Chan) plus a
+    fixed-bin histogram per feature, which is all the t-test, PSI and KS
+    checks need.
+    """
+
+    def __init__(self, columns, count, mean, m2, hist):
+        self.columns = list(columns)
+        self.count = np.asarray(count, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+        self.hist = np.asarray(hist, dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, X, columns):
+        X = np.asarray(X, dtype=np.float64)
+        valid = np.isfinite(X)
+        count = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(valid, X, 0.0).sum(axis=0) / count
+        mean = np.nan_to_num(mean)
+        m2 = np.where(valid, (X - mean) ** 2, 0.0).sum(axis=0)
+
+        n_features = X.shape[1]
+        bins = np.searchsorted(HIST_EDGES, np.arcsinh(np.where(valid, X, 0.0)), side="right")
+        flat = (bins + np.arange(n_features) * N_BINS)[valid]
+        hist = np.bincount(flat, minlength=n_features * N_BINS).reshape(n_features, N_BINS)
+        return cls(columns, count, mean, m2, hist)
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        if columns is None:
+            import pandas as pd
+            columns = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+        return cls.from_array(df[columns].to_numpy(dtype=np.float64), columns)
+
+    def select(self, columns):
+        idx = [self.columns.index(c) for c in columns]
+        return FeatureStats(columns, self.count[idx], self.mean[idx], self.m2[idx], self.hist[idx])
+
+    def merge(self, other):
+        """Combine two windows (Chan et al. parallel variance) on their common columns."""
+        columns = [c for c in self.columns if c in other.columns]
+        a, b = self.select(columns), other.select(columns)
+        count = a.count + b.count
+        delta = b.mean - a.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, a.mean + delta * b.count / count, 0.0)
+            m2 = a.m2 + b.m2 + np.where(count > 0, delta ** 2 * a.count * b.count / count, 0.0)
+        return FeatureStats(columns, count, mean, m2, a.hist + b.hist)
+
+    @property
+    def variance(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    def to_dict(self):
+        return {
+            "columns": self.columns,
+            "count": self.count.tolist(),
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "hist": self.hist.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["columns"], d["count"], d["mean"], d["m2"], d["hist"])
+
+
+def merge_all(stats_list):
+    merged = stats_list[0]
+    for s in stats_list[1:]:
+        merged = merged.merge(s)
+    return merged
+
+
+def welch_ttest(ref, new):
+    """Welch's t-test for every feature at once; returns (t, p) arrays."""
+    v1, v2 = ref.variance / ref.count, new.variance / new.count
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t_stat = (ref.mean - new.mean) / np.sqrt(v1 + v2)
+        dof = (v1 + v2) ** 2 / (v1 ** 2 / (ref.count - 1) + v2 ** 2 / (new.count - 1))
+    # scipy is imported on first use; it dominates the API's import time
+    from scipy.stats import t as student_t
+    p_value = 2.0 * student_t.sf(np.abs(t_stat), dof)
+    return t_stat, p_value
+
+
+def _proportions(hist):
+    totals = hist.sum(axis=1, keepdims=True)
+    totals[totals == 0] = 1.0
+    return hist / totals
+
+
+def psi(ref, new, eps=1e-4):
+    """Population stability index per feature from the shared histograms."""
+    p = np.clip(_proportions(ref.hist), eps, None)
+    q = np.clip(_proportions(new.hist), eps, None)
+    return ((q - p) * np.log(q / p)).sum(axis=1)
+
+
+def ks_test(ref, new):
+    """Two-sample KS statistic per feature on the binned CDFs, with asymptotic p-values."""
+    d = np.abs(np.cumsum(_proportions(ref.hist), axis=1) - np.cumsum(_proportions(new.hist), axis=1)).max(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        en = np.sqrt(ref.count * new.count / (ref.count + new.count))
+    from scipy.stats import kstwobign
+    return d, kstwobign.sf(d * en)
+
+
+def drift_report(ref, new):
+    """All drift scores for the features both windows have in common."""
+    columns = [c for c in ref.columns if c in new.columns]
+    ref, new = ref.select(columns), new.select(columns)
+    t_stat, t_p = welch_ttest(ref, new)
+    ks_d, ks_p = ks_test(ref, new)
+    enough = (ref.count >= 2) & (new.count >= 2)
+    return {
+        "columns": columns,
+        "enough_data": enough,
+        "t_stat": t_stat,
+        "t_pvalue": t_p,
+        "psi": psi(ref, new),
+        "ks_stat": ks_d,
+        "ks_pvalue": ks_p,
+    }
+
+
+def drifted_features(report, alpha=0.05, tests=("ttest",), psi_threshold=0.2):
+    """Features flagged by any of the selected tests (Bonferroni-corrected p-values)."""
+    n_tests = len(report["columns"])
+    if n_tests == 0:
+        return []
+    alpha_adj = alpha / n_tests
+    flagged = np.zeros(n_tests, dtype=bool)
+    if "ttest" in tests:
+        flagged |= report["t_pvalue"] < alpha_adj
+    if "ks" in tests:
+        flagged |= report["ks_pvalue"] < alpha_adj
+    if "psi" in tests:
+        flagged |= report["psi"] > psi_threshold
+    flagged &= report["enough_data"]
+    return [c for c, f in zip(report["columns"], flagged) if f]
+
+
+# Reference snapshot stored next to each model (reference_stats.json), used by
+# the API to score live traffic for drift
+def reference_to_dict(stats, fraud_rate):
+    return {**stats.to_dict(), "fraud_rate": float(fraud_rate)}
+
+
+def reference_from_dict(d):
+    """(FeatureStats, predicted fraud rate or None); (None, None) for a snapshot binned with other edges."""
+    if not has_current_bins(d):
+        return None, None
+    return FeatureStats.from_dict(d), d.get("fraud_rate")
@@ -1,48 +1,30 @@
 import time
-import subprocess
-from datetime import datetime
-import boto3
 import os
-from dotenv import load_dotenv
-from config import BUCKET_NAME, WEEKS_PREFIX, CHECK_INTERVAL
-
-# Load environment variables
-load_dotenv()
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
-
-# boto3 S3 client
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_DEFAULT_REGION
-)
-
-RETRAIN_SCRIPT = "retrain.py"
-DRIFT_CHECK_SCRIPT = "drift_check.py"
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import CHECK_INTERVAL, INCREMENTAL_RETRAINING, INCREMENTAL_NEW_WEEKS
+import drift_check
+import retrain
+from s3_data import list_week_objects, list_drift_alert_keys, prune_week_cache
+
+NUM_WEEKS_FOR_DRIFT = 3
+NUM_WEEKS_FOR_RETRAINING = 4
 
 def list_weeks():
     """Return list of weekly CSV keys in S3 for drift checking."""
-    resp = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=WEEKS_PREFIX)
-    return [obj['Key'] for obj in resp.get('Contents', []) if obj['Key'].endswith(".csv")]
+    return [key for key, _ in list_week_objects()]
 
 def run_drift_check():
-    """Run the drift check script and return list of drifted features."""
-    result = subprocess.run(["python", DRIFT_CHECK_SCRIPT], capture_output=True, text=True)
-    output = result.stdout.strip()
-    if "Drift detected" in output:
-        features_str = output.split("Drift detected in features: ")[1]
-        features = eval(features_str)
-        return features
-    return []
-
-def run_retraining(reason):
-    """Trigger retraining when drift is detected, logs to MLflow."""
-    print(f"Starting retraining due to: {reason}")
-    
-    # MLflow setup
+    """Run the drift check in-process and return list of drifted features."""
+    ref_stats, latest_stats = drift_check.load_latest_week_stats(n_weeks=NUM_WEEKS_FOR_DRIFT)
+    if ref_stats is None or latest_stats is None:
+        print("Not enough data to perform drift check.")
+        return []
+    return drift_check.check_drift_stats(ref_stats, latest_stats, alpha=0.05)
+
+def init_retrain_worker():
+    """MLflow setup for the retraining process."""
     import mlflow
     mlflow_path = os.path.join(os.getcwd(), "mlruns")
     os.makedirs(mlflow_path, exist_ok=True)
@@ -50,26 +32,116 @@ def run_retraining(reason):
     mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
     mlflow.set_experiment("fraud_detection")
 
-    # Run the retraining script
-    subprocess.run(["python", RETRAIN_SCRIPT], capture_output=False, text=True)
+def load_retraining_data():
+    """Weekly data for one retraining run; incremental runs grow the served forest on the newest weeks only."""
+    n_weeks = INCREMENTAL_NEW_WEEKS if INCREMENTAL_RETRAINING else NUM_WEEKS_FOR_RETRAINING
+    return retrain.load_last_n_weeks(n_weeks)
 
-if __name__ == "__main__":
-    last_seen = set()
+class RetrainScheduler:
+    """Runs retraining in a single long-lived worker process, one job at a time.
+
+    The worker keeps its imports between jobs, and the training frames are
+    handed over from the watchdog's weekly cache instead of being downloaded
+    again, so polling continues while a model is being fitted.
+    """
+
+    def __init__(self):
+        self.executor = self._new_executor()
+        self.future = None
+        self.last_result = None
+
+    @staticmethod
+    def _new_executor():
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_retrain_worker,
+        )
+
+    @property
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+    def submit(self, reason):
+        """Start retraining unless a retraining job is already in flight."""
+        if self.running:
+            print(f"Retraining already running, ignoring trigger: {reason}")
+            return False
+        print(f"Starting retraining due to: {reason}")
+        df = load_retraining_data()
+        try:
+            self.future = self.executor.submit(retrain.run_retraining, True, df)
+        except BrokenProcessPool:
+            # The previous worker died; start a fresh one
+            self.executor = self._new_executor()
+            self.future = self.executor.submit(retrain.run_retraining, True, df)
+        self.future.add_done_callback(self._on_done)
+        return True
+
+    def _on_done(self, future):
+        try:
+            self.last_result = future.result()
+            print(f"Retraining finished: {self.last_result}")
+        except Exception as e:
+            print(f"Retraining failed: {e}")
+
+class Watchdog:
+    """One polling step per call: new weekly files, drift check, live drift alerts.
+
+    The main loop calls `poll` every CHECK_INTERVAL seconds; simulate_year.py
+    calls it once per simulated week.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.last_seen = set()
+        # Alerts raised before the watchdog started are not acted on again
+        self.seen_alerts = set(list_drift_alert_keys())
+
+    def poll(self):
+        """Returns what happened: new weekly files, drifted features and whether retraining was started."""
+        events = {"new_files": [], "drift_features": [], "retrain": False}
 
-    while True:
         # Check for new weekly files
-        current_files = set(list_weeks())
-        new_files = current_files - last_seen
+        current_objects = list_week_objects()
+        current_files = set(current_objects)
+        new_files = [obj for obj in current_objects if obj not in self.last_seen]  # oldest first
 
         if new_files:
-            print(f"New weekly files detected: {new_files}")
+            events["new_files"] = [key for key, _ in new_files]
+            print(f"New weekly files detected: {events['new_files']}")
+            try:
+                retrain.update_reservoir(new_files)
+            except Exception as e:
+                print(f"Reservoir update failed: {e}")
             drift_features = run_drift_check()
+            events["drift_features"] = drift_features
             if drift_features:
-                run_retraining("drift detected")
+                print("Drift detected in features:", drift_features)
+                events["retrain"] = self.scheduler.submit("drift detected")
             else:
                 print("No drift detected. Skipping retraining.")
 
-        last_seen = current_files
+        # Live drift alerts from the API trigger retraining without waiting for the weekly file
+        alerts = set(list_drift_alert_keys())
+        new_alerts = alerts - self.seen_alerts
+        if new_alerts:
+            print(f"Live drift alerts from the API: {sorted(new_alerts)}")
+            events["retrain"] = self.scheduler.submit("live drift alert") or events["retrain"]
+        self.seen_alerts = alerts
+
+        prune_week_cache(current_objects)
+        self.last_seen = current_files
+        return events
+
+if __name__ == "__main__":
+    watchdog = Watchdog(RetrainScheduler())
+
+    while True:
+        try:
+            watchdog.poll()
+        except Exception as e:
+            print(f"Watchdog error: {e}")
 
         # Wait before checking again
         time.sleep(CHECK_INTERVAL)
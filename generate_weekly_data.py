@@ -1,3 +1,14 @@
+"""Synthetic weekly transaction data with injected drift.
+
+Every week is built as whole NumPy arrays from a generator seeded with
+(seed, week, chunk), so output is reproducible and weeks of millions of
+rows are written chunk by chunk in bounded memory.
+
+    python generate_weekly_data.py                                   # 52 small weeks, 5 drift spikes
+    python generate_weekly_data.py --min-rows 1000000 --max-rows 2000000 --format parquet
+    python generate_weekly_data.py --drift-shape gradual --drift-start 20 --fraud-signal 2
+"""
+import argparse
 import os
 import numpy as np
 import pandas as pd
@@ -9,34 +20,130 @@ max_rows_per_week = 150
 fraud_ratio = 0.01
 columns = ['Time'] + [f'V{i}' for i in range(1, 29)] + ['Amount', 'Class']
 
-# Create folder if not exists
-os.makedirs('dataset/weeks', exist_ok=True)
+WEEK_SECONDS = 7 * 24 * 60 * 60
+DRIFT_SHAPES = ("spikes", "sudden", "gradual", "seasonal", "none")
+DRIFT_FRAUD_RATIO = 0.15
+# Features that separate fraud from normal rows when a fraud signal is set (shifted down for fraud)
+SIGNAL_FEATURES = [14, 12, 17, 10, 4]
+
+
+def drift_levels(n_weeks, shape="spikes", n_drift_weeks=5, start=None, period=13, seed=0):
+    """Drift strength per week (index 0 = week 1) between 0 (none) and 1 (the full shift).
+
+    - spikes: `n_drift_weeks` random weeks at full strength
+    - sudden: full strength from week `start` on
+    - gradual: linear ramp from 0 at week `start` to 1 in the last week
+    - seasonal: sine wave with a `period`-week cycle
+    """
+    weeks = np.arange(1, n_weeks + 1)
+    start = start if start is not None else n_weeks // 2
+    if shape == "spikes":
+        levels = np.zeros(n_weeks)
+        picked = np.random.default_rng([seed, 0]).choice(n_weeks, size=min(n_drift_weeks, n_weeks), replace=False)
+        levels[picked] = 1.0
+        return levels
+    if shape == "sudden":
+        return (weeks >= start).astype(float)
+    if shape == "gradual":
+        return np.clip((weeks - start) / max(n_weeks - start, 1), 0.0, 1.0)
+    if shape == "seasonal":
+        return (1 - np.cos(2 * np.pi * (weeks - 1) / period)) / 2
+    if shape == "none":
+        return np.zeros(n_weeks)
+    raise ValueError(f"Unknown drift shape: {shape}")
+
+
+def generate_rows(n_rows, rng, drift=0.0, fraud_ratio=fraud_ratio, fraud_signal=0.0, time_range=(0, WEEK_SECONDS)):
+    """`n_rows` transactions as a DataFrame; `drift` in [0, 1] scales the shift."""
+    V = rng.standard_normal((n_rows, 28))
+    amount = rng.exponential(100, n_rows)
+    rate = fraud_ratio + drift * (DRIFT_FRAUD_RATIO - fraud_ratio)
+    label = (rng.random(n_rows) < rate).astype(np.int64)
+
+    if drift > 0:
+        # The same extreme shift as before, scaled by the drift strength
+        V[:, :5] += drift * rng.uniform(8, 12, (n_rows, 1))
+        V[:, 5:10] = (1 - drift) * V[:, 5:10] + drift * rng.normal(10, 5, (n_rows, 5))
+        amount *= 1 + drift * (rng.uniform(2, 4, n_rows) - 1)
+    if fraud_signal:
+        V[:, [i - 1 for i in SIGNAL_FEATURES]] -= fraud_signal * label[:, None]
+
+    df = pd.DataFrame(V, columns=columns[1:29])
+    # Seconds since the start of the week, so Time has the same distribution every week
+    df.insert(0, "Time", np.sort(rng.uniform(*time_range, n_rows)))
+    df["Amount"] = amount
+    df["Class"] = label
+    return df
+
+
+def iter_week_chunks(week, n_rows, seed=0, drift=0.0, chunk_rows=500_000, **kwargs):
+    """The rows of one week in chunks of at most `chunk_rows`."""
+    for chunk, offset in enumerate(range(0, n_rows, chunk_rows)):
+        rng = np.random.default_rng([seed, week, chunk])
+        size = min(chunk_rows, n_rows - offset)
+        # Each chunk covers its share of the week, so Time stays sorted across chunks
+        time_range = (WEEK_SECONDS * offset / n_rows, WEEK_SECONDS * (offset + size) / n_rows)
+        yield generate_rows(size, rng, drift, time_range=time_range, **kwargs)
+
+
+def generate_week(week, n_rows, seed=0, drift=0.0, **kwargs):
+    """A whole week in memory."""
+    return pd.concat(iter_week_chunks(week, n_rows, seed, drift, **kwargs), ignore_index=True)
+
+
+def week_sizes(n_weeks, min_rows, max_rows, seed=0):
+    return np.random.default_rng([seed, 1]).integers(min_rows, max_rows + 1, n_weeks)
+
+
+def write_week(path, chunks, fmt="csv"):
+    """Write chunks to one CSV or Parquet file without holding the week in memory."""
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    else:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
 
-# Weeks where we inject drift
-drift_weeks = np.random.choice(range(1, n_weeks+1), size=5, replace=False).tolist()
 
-for week in range(1, n_weeks+1):
-    rows_per_week = np.random.randint(min_rows_per_week, max_rows_per_week + 1)
-    week_data = []
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weeks", type=int, default=n_weeks)
+    parser.add_argument("--min-rows", type=int, default=min_rows_per_week)
+    parser.add_argument("--max-rows", type=int, default=max_rows_per_week)
+    parser.add_argument("--fraud-ratio", type=float, default=fraud_ratio)
+    parser.add_argument("--fraud-signal", type=float, default=0.0,
+                        help="shift of a few features for fraud rows, so models have something to learn")
+    parser.add_argument("--drift-shape", choices=DRIFT_SHAPES, default="spikes")
+    parser.add_argument("--drift-weeks", type=int, default=5, help="number of weeks for --drift-shape spikes")
+    parser.add_argument("--drift-start", type=int, help="first drifting week for sudden/gradual drift")
+    parser.add_argument("--drift-period", type=int, default=13, help="cycle length in weeks for seasonal drift")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--output-dir", default="dataset/weeks")
+    return parser.parse_args()
 
-    for _ in range(rows_per_week):
-        time = float(week)
-        V = np.random.normal(0, 1, 28)
-        amount = np.random.exponential(100)
-        class_label = 1 if np.random.rand() < fraud_ratio else 0
 
-        if week in drift_weeks:
-            # Extreme drift
-            V[:5] += np.random.uniform(8, 12)       
-            V[5:10] = np.random.normal(10, 5, 5)   
-            amount *= np.random.uniform(2, 4)      
-            class_label = 1 if np.random.rand() < 0.15 else 0  
+if __name__ == "__main__":
+    args = parse_args()
 
-        row = [time] + V.tolist() + [amount, class_label]
-        week_data.append(row)
+    # Create folder if not exists
+    os.makedirs(args.output_dir, exist_ok=True)
 
-    week_df = pd.DataFrame(week_data, columns=columns)
-    week_df.to_csv(f'dataset/weeks/week_{week}.csv', index=False)
+    levels = drift_levels(args.weeks, args.drift_shape, args.drift_weeks, args.drift_start, args.drift_period, args.seed)
+    sizes = week_sizes(args.weeks, args.min_rows, args.max_rows, args.seed)
+    for week in range(1, args.weeks + 1):
+        chunks = iter_week_chunks(week, int(sizes[week - 1]), args.seed, levels[week - 1], args.chunk_rows,
+                                  fraud_ratio=args.fraud_ratio, fraud_signal=args.fraud_signal)
+        write_week(os.path.join(args.output_dir, f"week_{week}.{args.format}"), chunks, args.format)
 
-print("Weekly datasets with varying lengths generated under dataset/weeks")
-print("Artificial drift injected in weeks:", drift_weeks)
+    print(f"Weekly datasets with {sizes.min()}-{sizes.max()} rows generated under {args.output_dir}")
+    print("Artificial drift injected in weeks:", [w for w, level in enumerate(levels, 1) if level > 0])
@@ -0,0 +1,28 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+#
+# The app is imported and the initial model loaded once in the master before
+# the workers are forked, so its arrays are shared copy-on-write. Each worker
+# then creates its own request logger and S3 client; exactly one worker (the
+# holder of the owner lock) runs the model reload and weekly upload threads,
+# and all workers switch models through the manifest in SHARED_MODEL_DIR.
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = 5
+accesslog = None
+
+
+def when_ready(server):
+    import app
+    app.load_initial_model()
+
+
+def post_fork(server, worker):
+    import app
+    app.init_worker()
@@ -0,0 +1,156 @@
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import average_precision_score
+from sklearn.model_selection import StratifiedKFold
+
+# Worker-side handles on the memory-mapped training data
+_X = None
+_y = None
+
+
+def _init_worker(data_dir):
+    """Open the shared arrays read-only; pages are shared with every other worker."""
+    global _X, _y
+    _X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    _y = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+
+
+def _run_fold(params, fold, n_splits, fraction, resampler, seed):
+    """Fit one candidate on one CV fold and return its PR-AUC on the validation part."""
+    started = time.perf_counter()
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    train_idx, test_idx = list(skf.split(np.zeros(len(_y)), _y))[fold]
+    if fraction < 1.0:
+        # Successive halving: early rungs see a stratified subsample of the fold
+        rng = np.random.default_rng([seed, fold])
+        keep = np.concatenate([
+            rng.choice(idx, size=max(2, int(len(idx) * fraction)), replace=False) if len(idx) > 2 else idx
+            for idx in (train_idx[_y[train_idx] == c] for c in np.unique(_y[train_idx]))
+        ])
+        train_idx = np.sort(keep)
+
+    X_train, y_train = np.asarray(_X[train_idx]), np.asarray(_y[train_idx])
+    if resampler is not None:
+        X_train, y_train = resampler.fit_resample(X_train, y_train)
+
+    model = RandomForestClassifier(**{**params, "n_jobs": 1, "random_state": seed})
+    model.fit(X_train, y_train)
+    proba = model.predict_proba(np.asarray(_X[test_idx]))[:, 1]
+    return average_precision_score(_y[test_idx], proba), time.perf_counter() - started
+
+
+def expand_grid(grid):
+    """All combinations of a {param: [values]} grid as a list of dicts."""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+class HyperparameterSearch:
+    """Stratified k-fold search over a parameter grid, spread across a process pool.
+
+    The training matrix is written once to `.npy` files and memory-mapped by
+    every worker, so it is never pickled per task. With
+    `strategy="halving"`, candidates are first scored on a small subsample of
+    each fold and only the best 1/`halving_factor` move on to the next,
+    larger rung. When `time_budget` seconds have passed, queued folds are
+    dropped and the worker processes are terminated, so folds still fitting
+    do not outlive the budget; only candidates with all folds scored are
+    ranked.
+    """
+
+    def __init__(self, base_params, grid, n_splits=5, strategy="grid", halving_factor=3,
+                 n_workers=4, time_budget=600, resampler=None, seed=42, on_trial=None):
+        if strategy not in ("grid", "halving"):
+            raise ValueError(f"Unknown search strategy: {strategy}")
+        self.base_params = dict(base_params)
+        self.candidates = expand_grid(grid)
+        self.n_splits = n_splits
+        self.strategy = strategy
+        self.halving_factor = halving_factor
+        self.n_workers = n_workers
+        self.time_budget = time_budget
+        self.resampler = resampler
+        self.seed = seed
+        self.on_trial = on_trial
+        self.trials = []
+
+    def _rungs(self):
+        if self.strategy == "grid":
+            return [1.0]
+        n_rungs = max(1, int(np.ceil(np.log(len(self.candidates)) / np.log(self.halving_factor))) + 1)
+        return [1.0 / self.halving_factor ** (n_rungs - 1 - r) for r in range(n_rungs)]
+
+    def run(self, X, y):
+        """Return (best_params, best_score); all scored trials are kept in `self.trials`."""
+        deadline = time.monotonic() + self.time_budget
+        data_dir = tempfile.mkdtemp(prefix="hpsearch_")
+        try:
+            np.save(os.path.join(data_dir, "X.npy"), np.ascontiguousarray(X, dtype=np.float64))
+            np.save(os.path.join(data_dir, "y.npy"), np.asarray(y, dtype=np.int64))
+            pool = Pool(processes=self.n_workers, initializer=_init_worker, initargs=(data_dir,))
+            try:
+                survivors = self.candidates
+                for fraction in self._rungs():
+                    scored = self._run_rung(pool, survivors, fraction, deadline)
+                    if not scored:
+                        break
+                    ranked = sorted(scored, key=lambda t: t["mean_pr_auc"], reverse=True)
+                    survivors = [t["params"] for t in ranked[:max(1, len(ranked) // self.halving_factor)]]
+                    if time.monotonic() >= deadline:
+                        print("Search time budget exhausted.")
+                        break
+            finally:
+                # Kills folds still running past the budget along with the idle workers
+                pool.terminate()
+                pool.join()
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        if not self.trials:
+            return None, None
+        # Only trials scored on the largest resource reached are comparable
+        top_fraction = max(t["fraction"] for t in self.trials)
+        best = max((t for t in self.trials if t["fraction"] == top_fraction), key=lambda t: t["mean_pr_auc"])
+        return {**self.base_params, **best["params"]}, best["mean_pr_auc"]
+
+    def _run_rung(self, pool, candidates, fraction, deadline):
+        results = []
+        for i, params in enumerate(candidates):
+            full = {**self.base_params, **params}
+            for fold in range(self.n_splits):
+                r = pool.apply_async(_run_fold, (full, fold, self.n_splits, fraction, self.resampler, self.seed))
+                results.append((i, r))
+        for _, r in results:
+            r.wait(max(0.0, deadline - time.monotonic()))
+
+        scores = {i: [] for i in range(len(candidates))}
+        fit_times = {i: [] for i in range(len(candidates))}
+        for i, r in results:
+            if r.ready() and r.successful():
+                score, seconds = r.get()
+                scores[i].append(score)
+                fit_times[i].append(seconds)
+
+        scored = []
+        for i, params in enumerate(candidates):
+            if len(scores[i]) != self.n_splits:
+                continue
+            trial = {
+                "params": params,
+                "fraction": fraction,
+                "fold_pr_auc": scores[i],
+                "mean_pr_auc": float(np.mean(scores[i])),
+                "std_pr_auc": float(np.std(scores[i])),
+                "mean_fit_seconds": float(np.mean(fit_times[i])),
+            }
+            self.trials.append(trial)
+            scored.append(trial)
+            if self.on_trial is not None:
+                self.on_trial(trial)
+        return scored
@@ -0,0 +1,191 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+import numpy as np
+from drift_stats import FeatureStats, merge_all, drift_report, drifted_features, reference_from_dict
+
+
+class LiveDriftMonitor:
+    """Drift scores of the traffic a serving process sees, updated continuously.
+
+    Request threads hand over each scored matrix with a non-blocking put
+    (dropped and counted when the queue is full). A background thread
+    drains the queue, stacks everything pending into one matrix and folds it
+    into mergeable per-feature statistics (Welford mean/M2 and the shared
+    drift histograms) plus the predicted-fraud count, all vectorized.
+
+    The window is the last `n_buckets` buckets of `window_rows / n_buckets`
+    rows, so old traffic ages out bucket by bucket without keeping any rows.
+    Every `interval` seconds the window is compared with the serving model's
+    reference snapshot (`ServingModel.reference`); the window restarts when
+    the model changes, and without a stored snapshot the first full window
+    of traffic becomes the reference. `on_alert(status)`
+    is called when drift is found, at most once per `alert_cooldown` seconds.
+    """
+
+    def __init__(self, window_rows=50_000, n_buckets=10, interval=30.0, min_rows=2_000, tests=("psi",),
+                 alpha=0.05, psi_threshold=0.2, fraud_rate_ratio=3.0, alert_cooldown=3600.0,
+                 queue_size=10_000, on_alert=None):
+        self.window_rows = window_rows
+        self.bucket_rows = max(1, window_rows // n_buckets)
+        self.n_buckets = n_buckets
+        self.interval = interval
+        self.min_rows = min_rows
+        self.tests = tuple(tests)
+        self.alpha = alpha
+        self.psi_threshold = psi_threshold
+        self.fraud_rate_ratio = fraud_rate_ratio
+        self.alert_cooldown = alert_cooldown
+        self.on_alert = on_alert
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._model_key = None
+        self._columns = None
+        self._reference = None
+        self._reference_rate = None
+        self._reference_source = None
+        self._buckets = deque(maxlen=n_buckets)  # closed buckets: (FeatureStats, rows, predicted fraud)
+        self._current = None
+        self._last_alert = None
+        self.counters = {"observed_rows": 0, "dropped_batches": 0, "evaluations": 0, "alerts": 0}
+        self._status = {"state": "no_model"}
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Request-thread side
+    def observe(self, serving, X, classes):
+        """Queue a matrix scored by `serving`; returns False if it was dropped."""
+        try:
+            self._queue.put_nowait((serving, X, classes))
+            return True
+        except queue.Full:
+            self.counters["dropped_batches"] += 1
+            return False
+
+    def set_reference(self, model_key, columns, reference=None, fraud_rate=None):
+        """Start a fresh window for a newly served model; `reference` is a FeatureStats or None."""
+        with self._lock:
+            self._model_key = model_key
+            self._columns = list(columns)
+            self._reference = reference
+            self._reference_rate = fraud_rate
+            self._reference_source = "training" if reference is not None else None
+            self._buckets.clear()
+            self._current = None
+            self._status = {"state": "collecting", "model_key": model_key}
+
+    # Worker side
+    def _drain(self, timeout):
+        """Everything queued for the newest model, as one matrix; waits up to `timeout` for the first item."""
+        try:
+            items = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return None, None
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        serving = items[-1][0]
+        if serving.key != self._model_key:
+            reference, fraud_rate = (reference_from_dict(serving.reference) if serving.reference is not None
+                                     else (None, None))
+            self.set_reference(serving.key, serving.feature_names, reference, fraud_rate)
+        items = [(X, c) for s, X, c in items if s.key == serving.key]
+        if len(items) == 1:
+            return items[0]
+        return np.concatenate([X for X, _ in items]), np.concatenate([c for _, c in items])
+
+    def _add(self, X, classes):
+        with self._lock:
+            if self._columns is None or X.shape[1] != len(self._columns):
+                return
+            stats = FeatureStats.from_array(X, self._columns)
+            n, n_fraud = len(X), int(np.count_nonzero(classes))
+            if self._current is None:
+                self._current = (stats, n, n_fraud)
+            else:
+                cur_stats, cur_n, cur_fraud = self._current
+                self._current = (cur_stats.merge(stats), cur_n + n, cur_fraud + n_fraud)
+            if self._current[1] >= self.bucket_rows:
+                self._buckets.append(self._current)
+                self._current = None
+            self.counters["observed_rows"] += n
+
+    def _window(self):
+        buckets = list(self._buckets) + ([self._current] if self._current is not None else [])
+        if not buckets:
+            return None, 0, 0
+        return (merge_all([b[0] for b in buckets]), sum(b[1] for b in buckets), sum(b[2] for b in buckets))
+
+    def _run(self):
+        next_evaluation = time.monotonic() + self.interval
+        while True:
+            try:
+                X, classes = self._drain(max(next_evaluation - time.monotonic(), 0.001))
+                if X is not None:
+                    self._add(X, classes)
+                if time.monotonic() >= next_evaluation:
+                    self.evaluate()
+                    next_evaluation = time.monotonic() + self.interval
+            except Exception as e:
+                logging.error(f"Live drift monitor error: {e}")
+
+    def evaluate(self):
+        """Compare the current window with the reference and update the status."""
+        with self._lock:
+            window, rows, n_fraud = self._window()
+            if self._reference is None and rows >= self.window_rows:
+                # No stored snapshot: the first full window of live traffic becomes the reference
+                self._reference, self._reference_rate, self._reference_source = window, n_fraud / rows, "traffic"
+                self._buckets.clear()
+                self._current = None
+                window, rows, n_fraud = None, 0, 0
+            reference, reference_rate = self._reference, self._reference_rate
+            status = {
+                "model_key": self._model_key,
+                "reference": self._reference_source,
+                "window_rows": rows,
+                "fraud_rate": n_fraud / rows if rows else None,
+                "reference_fraud_rate": reference_rate,
+                "evaluated_at": time.time(),
+            }
+        self.counters["evaluations"] += 1
+        if reference is None or rows < self.min_rows:
+            status["state"] = "collecting"
+            self._status = status
+            return status
+
+        report = drift_report(reference, window)
+        status["features"] = {
+            col: {"psi": float(p), "ks_pvalue": float(k), "t_pvalue": float(t)}
+            for col, p, k, t in zip(report["columns"], report["psi"], report["ks_pvalue"], report["t_pvalue"])
+        }
+        status["max_psi"] = float(np.nanmax(report["psi"])) if len(report["psi"]) else 0.0
+        status["drifted_features"] = drifted_features(report, self.alpha, self.tests, self.psi_threshold)
+        status["fraud_rate_drift"] = self._fraud_rate_drifted(status["fraud_rate"], reference_rate)
+        drifted = bool(status["drifted_features"]) or status["fraud_rate_drift"]
+        status["state"] = "drift" if drifted else "ok"
+        self._status = status
+
+        now = time.monotonic()
+        if drifted and (self._last_alert is None or now - self._last_alert >= self.alert_cooldown):
+            self._last_alert = now
+            self.counters["alerts"] += 1
+            if self.on_alert is not None:
+                self.on_alert(status)
+        return status
+
+    def _fraud_rate_drifted(self, rate, reference_rate):
+        if reference_rate is None or self.fraud_rate_ratio is None:
+            return False
+        eps = 1.0 / self.window_rows  # keeps the ratio finite when either rate is zero
+        ratio = (rate + eps) / (reference_rate + eps)
+        return bool(max(ratio, 1.0 / ratio) >= self.fraud_rate_ratio)
+
+    def status(self):
+        return {**self._status, **self.counters, "queue_depth": self._queue.qsize()}
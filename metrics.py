@@ -0,0 +1,200 @@
+import bisect
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds in seconds for latency histograms (last bucket is open-ended)
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+class Histogram:
+    """Fixed-bucket counter; cheap enough to update on every request."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def snapshot(self):
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else 0.0,
+        }
+
+
+def _label_str(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Counters, gauges and histograms of one process, rendered in Prometheus text format.
+
+    Metrics are declared once with their help text; updates are a dict
+    lookup and a few additions under one lock.
+    """
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help, buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    # Declarations
+    def counter(self, name, help_text):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, buckets)
+
+    def gauge(self, name, help_text, fn):
+        """`fn()` is called at scrape time and returns a number or a {labels-tuple: number} dict."""
+        self._meta[name] = ("gauge", help_text, None)
+        self._gauges[name] = fn
+
+    # Updates
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(self._meta[name][2])
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # Exposition
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(h.counts), h.total, h.sum, h.buckets) for k, h in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text, _) in self._meta.items():
+            full = self.prefix + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == "counter":
+                for (n, labels), value in counters.items():
+                    if n == name:
+                        lines.append(f"{full}{_label_str(labels)} {value}")
+            elif kind == "gauge":
+                try:
+                    value = self._gauges[name]()
+                except Exception:
+                    continue
+                items = value.items() if isinstance(value, dict) else [((), value)]
+                for labels, v in items:
+                    if v is not None:
+                        lines.append(f"{full}{_label_str(labels)} {float(v)}")
+            else:
+                for (n, labels), (counts, total, total_sum, buckets) in histograms.items():
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ["+Inf"], counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_label_str(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{full}_sum{_label_str(labels)} {total_sum}")
+                    lines.append(f"{full}_count{_label_str(labels)} {total}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on and off in a running process.
+
+    While running, a background thread records the Python stack of every
+    other thread every `interval` seconds. Stacks are aggregated in
+    collapsed form (`outer;inner;leaf count`, the input format of
+    flamegraph tools), so the cost is one dict update per thread per sample
+    and nothing at all while stopped.
+    """
+
+    def __init__(self):
+        self.samples = Counter()
+        self.n_samples = 0
+        self.interval = None
+        self.started_at = None
+        self._stop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.005, duration=60.0):
+        with self._lock:
+            if self.running:
+                return False
+            self.samples = Counter()
+            self.n_samples = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop, duration), daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self, stop, duration):
+        me = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not stop.is_set() and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            self.n_samples += 1
+            stop.wait(self.interval)
+
+    def report(self, match=None, limit=100):
+        """Collapsed stacks, most frequent first, optionally only those containing `match`."""
+        stacks = [(s, c) for s, c in list(self.samples.items()) if match is None or match in s]
+        stacks.sort(key=lambda item: item[1], reverse=True)
+        return stacks[:limit]
+
+    def describe(self):
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "started_at": self.started_at,
+            "samples": self.n_samples,
+            "distinct_stacks": len(self.samples),
+        }
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+import numpy as np
+from metrics import Histogram
+
+# Upper bounds of the histogram buckets (last bucket is open-ended)
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+WAIT_US_BUCKETS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000]
+
+
+class _Pending:
+    __slots__ = ("X", "model", "enqueued", "done", "result", "error")
+
+    def __init__(self, X, model):
+        self.X = X
+        self.model = model
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collect concurrent scoring calls into one matrix and score them together.
+
+    `score_fn(model, X)` receives the model a request was submitted with and
+    a 2D array of stacked rows, and must return one value per row. Requests
+    for different models (around a swap) are scored in separate groups, so
+    every caller gets scores from its own model. A batch is flushed when it
+    holds `max_batch_size` rows or when the oldest request has waited
+    `max_wait_us` microseconds.
+    """
+
+    def __init__(self, score_fn, max_batch_size=64, max_wait_us=500):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1e6
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.batch_rows = Histogram(BATCH_SIZE_BUCKETS)
+        self.batch_requests = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_us = Histogram(WAIT_US_BUCKETS)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, X, model=None):
+        """Score `X` with `model` as part of the next batch and return this caller's slice."""
+        item = _Pending(X, model)
+        self._queue.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        rows = len(first.X)
+        deadline = first.enqueued + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item.X)
+        return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect()
+            started = time.perf_counter()
+            try:
+                for group in self._by_model(batch):
+                    self._score_group(group)
+            finally:
+                with self._stats_lock:
+                    self.batch_rows.observe(rows)
+                    self.batch_requests.observe(len(batch))
+                    for item in batch:
+                        self.queue_wait_us.observe((started - item.enqueued) * 1e6)
+                for item in batch:
+                    item.done.set()
+
+    @staticmethod
+    def _by_model(batch):
+        """Split a batch into groups of requests submitted with the same model, in arrival order."""
+        groups = {}
+        for item in batch:
+            groups.setdefault(id(item.model), []).append(item)
+        return groups.values()
+
+    def _score_group(self, group):
+        try:
+            X = group[0].X if len(group) == 1 else np.concatenate([item.X for item in group])
+            scores = self.score_fn(group[0].model, X)
+            offset = 0
+            for item in group:
+                n = len(item.X)
+                item.result = scores[offset:offset + n]
+                offset += n
+        except Exception as e:
+            for item in group:
+                item.error = e
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_us": self.max_wait * 1e6,
+                "queue_depth": self._queue.qsize(),
+                "batch_rows": self.batch_rows.snapshot(),
+                "batch_requests": self.batch_requests.snapshot(),
+                "queue_wait_us": self.queue_wait_us.snapshot(),
+            }
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from compiled_forest import ARRAY_NAMES
+
+POINTER_NAME = "LATEST"
+COMPILED_DIR_NAME = "compiled"  # memory-mappable node arrays stored next to model.pkl
+
+
+def pointer_key(prefix):
+    return f"{prefix.rstrip('/')}/{POINTER_NAME}"
+
+
+def publish_pointer(s3_client, bucket, prefix, model_key):
+    """Write the small pointer object readers use to find the newest model without listing."""
+    s3_client.put_object(Bucket=bucket, Key=pointer_key(prefix), Body=model_key.encode("utf-8"))
+
+
+def _not_modified(error):
+    return (error.response.get("Error", {}).get("Code") in ("304", "NotModified")
+            or error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304)
+
+
+class ModelRegistry:
+    """Finds and downloads model pickles under `model_backups/` as cheaply as possible.
+
+    - The newest key is read from a pointer object with a conditional GET,
+      falling back to a paginated listing that only asks S3 for keys after
+      the newest one already seen (backup folders are timestamp-named, so
+      S3's lexicographic order is chronological).
+    - Pickles are kept in a content-addressed cache on disk, indexed by S3
+      key and ETag, and re-validated with If-None-Match so a restart or a
+      rollback never downloads the same model twice.
+    """
+
+    def __init__(self, s3_client, bucket, prefix="model_backups", cache_dir="./models/cache"):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self._pointer_etag = None
+        self._pointer_value = None
+        self._latest_listed = None
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._index_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._read_index()
+
+    # Latest key lookup
+    def latest_key(self):
+        key = self._read_pointer()
+        if key is None:
+            key = self._scan_latest()
+        if key is None:
+            raise FileNotFoundError("No model found in S3.")
+        return key
+
+    def _read_pointer(self):
+        kwargs = {"Bucket": self.bucket, "Key": pointer_key(self.prefix)}
+        if self._pointer_etag:
+            kwargs["IfNoneMatch"] = self._pointer_etag
+        try:
+            obj = self.s3.get_object(**kwargs)
+        except ClientError as e:
+            if _not_modified(e):
+                return self._pointer_value
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        self._pointer_etag = obj["ETag"]
+        self._pointer_value = obj["Body"].read().decode("utf-8").strip() or None
+        return self._pointer_value
+
+    def list_model_keys(self, start_after=None):
+        """All model.pkl keys under the prefix, following continuation tokens."""
+        paginator = self.s3.get_paginator("list_objects_v2")
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        keys = []
+        for page in paginator.paginate(**kwargs):
+            keys.extend(obj["Key"] for obj in page.get("Contents", []) if obj["Key"].endswith("model.pkl"))
+        return keys
+
+    def _scan_latest(self):
+        keys = self.list_model_keys(start_after=self._latest_listed)
+        if keys:
+            self._latest_listed = max(keys + ([self._latest_listed] if self._latest_listed else []))
+        return self._latest_listed
+
+    # Download + cache
+    def _read_index(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        tmp = f"{self._index_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def fetch(self, key):
+        """Return a local path holding the object at `key`, downloading only if it changed."""
+        entry = self._index.get(key)
+        cached = entry is not None and os.path.exists(self._blob_path(entry["sha256"]))
+        kwargs = {"Bucket": self.bucket, "Key": key}
+        if cached:
+            kwargs["IfNoneMatch"] = entry["etag"]
+        try:
+            obj = self.s3.get_object(**kwargs)
+        except ClientError as e:
+            if cached and _not_modified(e):
+                logging.info(f"Model s3://{self.bucket}/{key} unchanged, using local cache")
+                return self._blob_path(entry["sha256"])
+            raise
+        except Exception:
+            if cached:
+                logging.warning(f"S3 unavailable, using cached copy of {key}")
+                return self._blob_path(entry["sha256"])
+            raise
+
+        body = obj["Body"].read()
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+            os.replace(tmp, path)
+        with self._index_lock:
+            self._index[key] = {"etag": obj["ETag"], "sha256": digest}
+            self._write_index()
+        return path
+
+    def cached_path(self, key):
+        """Local path of an already downloaded object, without contacting S3."""
+        entry = self._index.get(key)
+        if entry is None or not os.path.exists(self._blob_path(entry["sha256"])):
+            return None
+        return self._blob_path(entry["sha256"])
+
+    def load(self, key):
+        import joblib
+        return joblib.load(self.fetch(key))
+
+    def fetch_compiled(self, key):
+        """Local directory with the compiled arrays stored next to `key`, or None if there are none.
+
+        Model folders are never rewritten, so a downloaded copy is reused
+        without asking S3 again.
+        """
+        folder = os.path.dirname(key)
+        local_dir = os.path.join(self.cache_dir, COMPILED_DIR_NAME, folder.replace("/", "_"))
+        if os.path.isdir(local_dir):
+            return local_dir
+        names = ["meta.json"] + [f"{name}.npy" for name in ARRAY_NAMES]
+        tmp = tempfile.mkdtemp(prefix=".compiled", dir=self.cache_dir)
+        try:
+            try:
+                self.s3.download_file(self.bucket, f"{folder}/{COMPILED_DIR_NAME}/meta.json", os.path.join(tmp, "meta.json"))
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                    return None
+                raise
+            with ThreadPoolExecutor(len(names) - 1) as pool:
+                list(pool.map(lambda name: self.s3.download_file(
+                    self.bucket, f"{folder}/{COMPILED_DIR_NAME}/{name}", os.path.join(tmp, name)), names[1:]))
+            os.makedirs(os.path.dirname(local_dir), exist_ok=True)
+            try:
+                os.replace(tmp, local_dir)
+            except OSError:
+                pass  # another process finished the same download first
+            return local_dir
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
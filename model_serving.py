@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from compiled_forest import feature_names_of
+from payloads import FeatureSchema
+
+
+class ServingModel:
+    """Everything the predict path needs for one model version.
+
+    Instances are never mutated after construction, so request threads can
+    read `ModelSlot.current` once and score without taking a lock.
+    `reference` is the model's drift reference snapshot (the parsed
+    reference_stats.json stored with it), or None. `model` may be None
+    for a model served only from its memory-mapped compiled arrays.
+    """
+
+    def __init__(self, key, model, compiled=None, feature_names=None, reference=None):
+        self.key = key
+        self.model = model
+        self.compiled = compiled
+        if feature_names is None:
+            feature_names = compiled.feature_names if model is None else feature_names_of(model)
+        self.feature_names = list(feature_names)
+        self.schema = FeatureSchema(self.feature_names)
+        self.reference = reference
+        self.loaded_at = time.time()
+
+    def predict_proba(self, X):
+        """Fraud probability for each row of a matrix in model column order."""
+        if self.compiled is not None:
+            return self.compiled.predict_proba(X)[:, 1]
+        import pandas as pd
+        return self.model.predict_proba(pd.DataFrame(X, columns=self.feature_names))[:, 1]
+
+    def describe(self):
+        return {
+            "key": self.key,
+            "compiled": self.compiled is not None,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def validate_model(candidate, samples, current=None, max_fraud_rate=0.5):
+    """Shadow-score `samples` with a candidate model and check the outputs are sane.
+
+    Scoring also warms the candidate up before it takes traffic.
+    Returns (ok, message).
+    """
+    if samples is None or len(samples) == 0:
+        return True, "no validation samples available"
+
+    proba = candidate.predict_proba(samples)
+    if proba.shape != (len(samples),):
+        return False, f"unexpected output shape {proba.shape}"
+    if not np.all(np.isfinite(proba)) or proba.min() < 0.0 or proba.max() > 1.0:
+        return False, "probabilities outside [0, 1]"
+
+    if candidate.compiled is not None and candidate.model is not None:
+        import pandas as pd
+        reference = candidate.model.predict_proba(pd.DataFrame(samples, columns=candidate.feature_names))[:, 1]
+        if not np.allclose(proba, reference, rtol=0.0, atol=1e-9):
+            return False, "compiled model disagrees with sklearn predict_proba"
+
+    fraud_rate = float((proba >= 0.5).mean())
+    if fraud_rate > max_fraud_rate:
+        return False, f"fraud rate {fraud_rate:.3f} on validation sample exceeds {max_fraud_rate}"
+
+    message = f"{len(samples)} rows, fraud rate {fraud_rate:.3f}"
+    if current is not None and current.feature_names == candidate.feature_names:
+        agreement = float(((current.predict_proba(samples) >= 0.5) == (proba >= 0.5)).mean())
+        message += f", agreement with {current.key}: {agreement:.3f}"
+    return True, message
+
+
+class ModelSlot:
+    """Holds the serving model plus the last few versions for instant rollback.
+
+    Readers only ever touch `current`; publishing is a single reference swap.
+    """
+
+    def __init__(self, history_size=3):
+        self.current = None
+        self.history = deque(maxlen=history_size)
+        self._swap_lock = threading.Lock()
+
+    def publish(self, serving):
+        with self._swap_lock:
+            if self.current is not None:
+                self.history.append(self.current)
+            self.current = serving
+
+    def find(self, key):
+        """The in-memory version with the given key, or None."""
+        for m in [self.current, *self.history]:
+            if m is not None and m.key == key:
+                return m
+        return None
+
+    def rollback(self, key=None):
+        """Swap back to the previous model, or to the one with the given key."""
+        with self._swap_lock:
+            if not self.history:
+                raise LookupError("No previous model in memory to roll back to.")
+            if key is None:
+                target = self.history.pop()
+            else:
+                matches = [m for m in self.history if m.key == key]
+                if not matches:
+                    raise LookupError(f"Model {key} is not in memory.")
+                target = matches[-1]
+                self.history.remove(target)
+            if self.current is not None:
+                self.history.append(self.current)
+            self.current = target
+            return target
+
+    def describe(self):
+        return {
+            "current": self.current.describe() if self.current is not None else None,
+            "history": [m.describe() for m in reversed(self.history)],
+        }
+
+
+class RowSample:
+    """Uniform sample of at most `capacity` traffic rows (reservoir sampling over rows).
+
+    Every row counts once, so large batch requests neither pin memory nor
+    crowd out small callers. Rows are kept with their column names and the
+    sample restarts when the columns change.
+    """
+
+    def __init__(self, capacity, seed=None):
+        self.capacity = capacity
+        self.columns = None
+        self.rows = None
+        self.size = 0
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def add(self, X, columns):
+        with self._lock:
+            if self.columns != list(columns) or self.rows is None or self.rows.dtype != X.dtype:
+                self.columns = list(columns)
+                self.rows = np.empty((self.capacity, X.shape[1]), dtype=X.dtype)
+                self.size = self.seen = 0
+            fill = min(self.capacity - self.size, len(X))
+            self.rows[self.size:self.size + fill] = X[:fill]
+            self.size += fill
+            rest = X[fill:]
+            if len(rest):
+                # Row t of the stream replaces a random slot with probability capacity / (t + 1)
+                t = self.seen + fill + np.arange(len(rest))
+                slots = (self._rng.random(len(rest)) * (t + 1)).astype(np.int64)
+                accepted = slots < self.capacity
+                self.rows[slots[accepted]] = rest[accepted]
+            self.seen += len(X)
+
+    def get(self, feature_names):
+        """The sampled rows in `feature_names` order, or None if empty or a column is missing."""
+        with self._lock:
+            if self.size == 0 or not set(feature_names) <= set(self.columns):
+                return None
+            order = [self.columns.index(name) for name in feature_names]
+            return self.rows[:self.size][:, order]
@@ -0,0 +1,124 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+
+MANIFEST_NAME = "CURRENT.json"
+
+
+class OwnerLock:
+    """Non-blocking exclusive flock; whichever process holds it owns the background tasks.
+
+    The lock is released by the kernel when the holder exits, so another
+    process can take over by calling `try_acquire` again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+
+class SharedModelStore:
+    """Announces the serving model to every worker process through a small manifest file.
+
+    The announcing process writes the compiled forest once as .npy files
+    under `shared_dir`; workers memory-map them, so a model's node arrays
+    sit in the page cache once no matter how many workers serve it. The
+    manifest is replaced atomically and workers poll its inode/mtime, which
+    costs one stat call per poll.
+    """
+
+    def __init__(self, shared_dir):
+        self.shared_dir = shared_dir
+        self.manifest_path = os.path.join(shared_dir, MANIFEST_NAME)
+        self._seen = None
+        os.makedirs(shared_dir, exist_ok=True)
+
+    def compiled_dir(self, model_path, key=None):
+        # Model pickles are content-addressed, so the digest names the compiled copy too;
+        # models served without a pickle are named after their S3 folder
+        if model_path is None:
+            return os.path.join(self.shared_dir, os.path.dirname(key).replace("/", "_"))
+        return os.path.join(self.shared_dir, os.path.splitext(os.path.basename(model_path))[0])
+
+    def announce(self, serving, model_path, latest_seen=None):
+        """Make `serving` the model all workers switch to; `model_path` is None for compiled-only models."""
+        compiled_dir = None
+        if serving.compiled is not None:
+            compiled_dir = self.compiled_dir(model_path, serving.key)
+            if not os.path.exists(compiled_dir):
+                tmp = f"{compiled_dir}.tmp{os.getpid()}"
+                try:
+                    serving.compiled.save(tmp)
+                    try:
+                        os.replace(tmp, compiled_dir)
+                    except OSError:
+                        if not os.path.isdir(compiled_dir):
+                            raise
+                        # another process wrote the same model's arrays first
+                finally:
+                    shutil.rmtree(tmp, ignore_errors=True)
+        reference_path = None
+        if serving.reference is not None:
+            reference_path = self.compiled_dir(model_path, serving.key) + ".reference.json"
+            if not os.path.exists(reference_path):
+                tmp = f"{reference_path}.tmp{os.getpid()}"
+                with open(tmp, "w") as f:
+                    json.dump(serving.reference, f)
+                os.replace(tmp, reference_path)
+        entry = {
+            "key": serving.key,
+            "model_path": os.path.abspath(model_path) if model_path else None,
+            "compiled_dir": os.path.abspath(compiled_dir) if compiled_dir else None,
+            "feature_names": serving.feature_names,
+            "reference_path": os.path.abspath(reference_path) if reference_path else None,
+            "latest_seen": latest_seen,
+            "announced_at": time.time(),
+            "announced_by": os.getpid(),
+        }
+        tmp = f"{self.manifest_path}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self.manifest_path)
+        self._seen = self._stat()
+        return entry
+
+    def _stat(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def read(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def poll(self):
+        """The manifest if it changed since the last call (or the last own announcement), else None."""
+        current = self._stat()
+        if current is None or current == self._seen:
+            return None
+        self._seen = current
+        return self.read()
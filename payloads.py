@@ -0,0 +1,216 @@
+import itertools
+import json
+import operator
+import numpy as np
+from compiled_forest import FEATURE_COLUMNS
+
+# Faster JSON codec and the msgpack content type are used when installed;
+# msgpack is not in requirements.txt, install it to accept msgpack bodies
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_TYPES = ("application/json",)
+FLOAT32_TYPES = ("application/octet-stream", "application/x-float32")
+ARROW_TYPES = ("application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class PayloadError(ValueError):
+    """The request body cannot be turned into a feature matrix."""
+
+
+def loads_json(body):
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def dumps_json(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_to_builtin).encode("utf-8")
+
+
+def _to_builtin(value):
+    """NumPy arrays and scalars as lists and Python numbers, for the stdlib json fallback."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FeatureSchema:
+    """Input columns one model expects, built once when the model is loaded.
+
+    Turns records, columns or binary matrices into a C-contiguous float64
+    matrix in model column order in a single pass, and rejects missing or
+    unknown fields and NaN/infinite values with a message naming the row
+    and field, so bad input never reaches the model.
+    """
+
+    def __init__(self, feature_names):
+        self.names = list(feature_names)
+        self.name_set = frozenset(self.names)
+        if len(self.names) == 1:
+            name = self.names[0]
+            self._values = lambda row: (row[name],)
+        else:
+            self._values = operator.itemgetter(*self.names)
+        # Binary payloads always arrive in FEATURE_COLUMNS order
+        if self.name_set <= set(FEATURE_COLUMNS):
+            order = [FEATURE_COLUMNS.index(name) for name in self.names]
+            self.binary_order = None if order == list(range(len(FEATURE_COLUMNS))) else order
+            self.binary_supported = True
+        else:
+            self.binary_order = None
+            self.binary_supported = False
+
+    def _field_error(self, keys, where):
+        missing = [name for name in self.names if name not in keys]
+        unknown = sorted(str(k) for k in keys if k not in self.name_set)
+        details = []
+        if missing:
+            details.append(f"missing fields {missing}")
+        if unknown:
+            details.append(f"unknown fields {unknown}")
+        return PayloadError(f"{where}: {'; '.join(details)}")
+
+    @staticmethod
+    def _to_float(values):
+        try:
+            return np.array(values, dtype=np.float64)
+        except (TypeError, ValueError) as e:
+            raise PayloadError(f"Feature values must be numbers: {e}")
+
+    def check(self, X):
+        """Reject NaN and infinite values; returns X unchanged."""
+        finite = np.isfinite(X)
+        if not finite.all():
+            bad = np.argwhere(~finite)
+            row, col = bad[0]
+            raise PayloadError(f"Row {row}: {self.names[col]} is {X[row, col]}; NaN and infinite values are not "
+                               f"allowed ({len(bad)} such values in the request)")
+        return X
+
+    def from_records(self, rows):
+        """[{"Time": ..., "V1": ..., ...}, ...]"""
+        n, k = len(rows), len(self.names)
+        try:
+            X = np.fromiter(itertools.chain.from_iterable(map(self._values, rows)), dtype=np.float64, count=n * k)
+            # Every record has all fields (no KeyError), so equal total size means no extra fields
+            valid = sum(map(len, rows)) == n * k
+        except (KeyError, TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise self._record_error(rows)
+        return self.check(X.reshape(n, k))
+
+    def _record_error(self, rows):
+        """Slow pass over the records to explain why the fast conversion failed."""
+        for i, row in enumerate(rows):
+            if not isinstance(row, dict):
+                return PayloadError(f"Record {i} is not an object")
+            if row.keys() != self.name_set:
+                return self._field_error(row.keys(), f"Record {i}")
+            for name in self.names:
+                value = row[name]
+                if value is None or isinstance(value, (str, list, dict)):
+                    return PayloadError(f"Record {i}: {name} must be a number, got {value!r}")
+        return PayloadError("Feature values must be numbers")
+
+    def from_columns(self, columns):
+        """{"Time": [...], "V1": [...], ...}"""
+        if columns.keys() != self.name_set:
+            raise self._field_error(columns.keys(), "Columns")
+        arrays = [self._to_float(columns[name]) for name in self.names]
+        lengths = {len(a) if a.ndim == 1 else -1 for a in arrays}
+        if len(lengths) != 1 or -1 in lengths:
+            raise PayloadError("Columns must be flat lists of equal length")
+        if 0 in lengths:
+            raise PayloadError("No input data provided")
+        return self.check(np.column_stack(arrays))
+
+    def from_matrix(self, X):
+        """A matrix whose columns follow FEATURE_COLUMNS (binary payloads)."""
+        if not self.binary_supported:
+            raise PayloadError(f"Binary payloads need the columns {FEATURE_COLUMNS}; this model expects {self.names}")
+        if self.binary_order is not None:
+            X = X[:, self.binary_order]
+        return self.check(np.ascontiguousarray(X, dtype=np.float64))
+
+    def from_table(self, table):
+        """An Arrow table with one column per feature."""
+        if set(table.column_names) != self.name_set:
+            raise self._field_error(table.column_names, "Columns")
+        if table.num_rows == 0:
+            raise PayloadError("No input data provided")
+        return self.check(np.column_stack([
+            table.column(name).to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+            for name in self.names
+        ]))
+
+
+def data_to_matrix(data, schema):
+    """The "data" field of a JSON/msgpack body: a list of records or a dict of columns."""
+    if not data:
+        raise PayloadError("No input data provided")
+    if isinstance(data, dict):
+        return schema.from_columns(data)
+    if isinstance(data, list):
+        return schema.from_records(data)
+    raise PayloadError("'data' must be a list of records or a dict of columns")
+
+
+def float32_to_matrix(body, schema):
+    """Raw little-endian float32 matrix, row-major, `len(FEATURE_COLUMNS)` values per row."""
+    width = len(FEATURE_COLUMNS)
+    if len(body) == 0 or len(body) % (4 * width) != 0:
+        raise PayloadError(f"Body must be a non-empty float32 matrix with {width} columns per row")
+    return schema.from_matrix(np.frombuffer(body, dtype="<f4").reshape(-1, width))
+
+
+def arrow_to_matrix(body, schema):
+    """Arrow IPC stream or file with one column per feature."""
+    import pyarrow as pa
+    try:
+        reader = pa.ipc.open_stream(body)
+    except pa.ArrowInvalid:
+        try:
+            reader = pa.ipc.open_file(body)
+        except pa.ArrowInvalid as e:
+            raise PayloadError(f"Invalid Arrow IPC payload: {e}")
+    return schema.from_table(reader.read_all())
+
+
+def decode_request(body, content_type, schema):
+    """Turn a /predict body into a validated feature matrix in the schema's column order.
+
+    Supported layouts, selected by Content-Type:
+    - JSON (default) or msgpack: `{"data": [{...}, ...]}` records or `{"data": {"Time": [...], ...}}` columns
+    - application/octet-stream: raw float32 rows in `Time, V1..V28, Amount` order
+    - application/vnd.apache.arrow.stream: Arrow IPC with one column per feature
+    """
+    content_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if content_type in FLOAT32_TYPES:
+        return float32_to_matrix(body, schema)
+    if content_type in ARROW_TYPES:
+        return arrow_to_matrix(body, schema)
+    if content_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise PayloadError("msgpack payloads need the msgpack package installed")
+        try:
+            payload = msgpack.unpackb(body)
+        except Exception as e:
+            raise PayloadError(f"Invalid msgpack body: {e}")
+    else:
+        try:
+            payload = loads_json(body)
+        except ValueError as e:
+            raise PayloadError(f"Invalid JSON body: {e}")
+    if not isinstance(payload, dict):
+        raise PayloadError("Body must be an object with a 'data' field")
+    return data_to_matrix(payload.get("data"), schema)
@@ -0,0 +1,206 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class TTLCache:
+    """Bounded LRU map whose entries also expire `ttl` seconds after they were stored.
+
+    Thread-safe; counts hits, misses, evictions (capacity) and expirations
+    (age) so the saving can be measured.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _get_locked(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        stored_at, value = entry
+        if now - stored_at > self.ttl:
+            del self._entries[key]
+            self.counters["expirations"] += 1
+            self.counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return value
+
+    def _put_locked(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def get(self, key):
+        with self._lock:
+            return self._get_locked(key, time.monotonic())
+
+    def put(self, key, value):
+        with self._lock:
+            self._put_locked(key, value, time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+            }
+
+
+class PredictionCache(TTLCache):
+    """Fraud probabilities per feature vector and model.
+
+    Keys combine the serving model's key with a hash of the canonical row
+    (float64 in model column order, -0.0 folded into 0.0), so a model swap
+    or rollback never returns a stale score.
+    """
+
+    @staticmethod
+    def row_keys(model_key, X):
+        canonical = np.ascontiguousarray(X, dtype=np.float64) + 0.0
+        return [(model_key, hashlib.blake2b(row.tobytes(), digest_size=16).digest()) for row in canonical]
+
+    def get_many(self, keys):
+        """(probabilities with NaN for misses, boolean mask of misses)."""
+        proba = np.full(len(keys), np.nan)
+        with self._lock:
+            now = time.monotonic()
+            for i, key in enumerate(keys):
+                value = self._get_locked(key, now)
+                if value is not None:
+                    proba[i] = value
+        return proba, np.isnan(proba)
+
+    def put_many(self, keys, values):
+        with self._lock:
+            now = time.monotonic()
+            for key, value in zip(keys, values):
+                self._put_locked(key, float(value), now)
+
+
+class IdempotencyStore:
+    """Responses per Idempotency-Key, shared by every worker process through one SQLite file.
+
+    `reserve` atomically claims a key with an in-flight marker before the
+    request is scored, so concurrent retries in other workers wait for the
+    first one instead of scoring and logging the rows again. `complete`
+    stores the response body; `release` drops the marker of a request that
+    failed. Entries expire `ttl` seconds after they were reserved, markers
+    of requests that never completed (e.g. a killed worker) after `lease`
+    seconds, and the oldest entries are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, path, max_entries, ttl, lease=60.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lease = lease
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "in_flight": 0, "conflicts": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db().execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, digest BLOB NOT NULL,"
+                       " body BLOB, created REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+
+    def _db(self):
+        # One connection per thread; transactions are opened explicitly
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db())
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def reserve(self, key, digest):
+        """Claim `key` for a request body with SHA-256 `digest`.
+
+        Returns ("reserved", None) when the caller should score the request,
+        ("replay", body) for a completed request with the same body,
+        ("in_flight", None) while another request holds the key and
+        ("conflict", None) when the key was used with a different body.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute("SELECT digest, body, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                stored_digest, body, created = row
+                expired = now - created > (self.ttl if body is not None else self.lease)
+                if not expired:
+                    if stored_digest != digest:
+                        state = "conflict"
+                    elif body is None:
+                        state = "in_flight"
+                    else:
+                        state = "replay"
+                    self._count({"conflict": "conflicts", "in_flight": "in_flight", "replay": "hits"}[state])
+                    return state, body if state == "replay" else None
+            db.execute("INSERT OR REPLACE INTO responses (key, digest, body, created) VALUES (?, ?, NULL, ?)",
+                       (key, digest, now))
+        self._count("misses")
+        return "reserved", None
+
+    def complete(self, key, body):
+        with self._transaction() as db:
+            db.execute("UPDATE responses SET body = ? WHERE key = ?", (body, key))
+            db.execute("DELETE FROM responses WHERE created < ?", (time.time() - max(self.ttl, self.lease),))
+            db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created DESC"
+                       " LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def release(self, key):
+        with self._transaction() as db:
+            db.execute("DELETE FROM responses WHERE key = ? AND body IS NULL", (key,))
+
+    def stats(self):
+        entries, in_flight = self._db().execute(
+            "SELECT COUNT(*), COUNT(*) - COUNT(body) FROM responses").fetchone()
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "entries": entries,
+            "reserved": in_flight,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            "path": self.path,
+        }
+
+
+class _Transaction:
+    """`with` block around one immediate (write-locked) SQLite transaction."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
@@ -0,0 +1,170 @@
+import glob
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from sklearn.metrics import precision_score, recall_score, f1_score, average_precision_score
+from config import (
+    BUCKET_NAME, S3_MODEL_BACKUP_PREFIX, MODEL_CACHE_DIR, PROMOTION_BATCH_SIZE, PROMOTION_REPLAY_DIR,
+    PROMOTION_REPLAY_ROWS, PROMOTION_MIN_PR_AUC_GAIN, PROMOTION_MAX_RECALL_DROP,
+    PROMOTION_MAX_PRECISION_DROP, PROMOTION_MAX_LATENCY_RATIO, PROMOTION_RESULTS_FILE
+)
+from compiled_forest import CompiledForest
+from model_registry import ModelRegistry
+from model_serving import ServingModel
+from request_logger import read_segment
+from s3_data import get_s3_client
+
+
+# Loading the two contenders and the replay traffic
+def load_champion():
+    """(key, model) of the model the API currently serves, or (None, None) if there is none yet."""
+    registry = ModelRegistry(get_s3_client(), BUCKET_NAME, S3_MODEL_BACKUP_PREFIX, MODEL_CACHE_DIR)
+    try:
+        key = registry.latest_key()
+    except FileNotFoundError:
+        return None, None
+    return key, registry.load(key)
+
+
+def to_serving(key, model):
+    """Wrap a model the way the API does, using the flattened forest when the model supports it."""
+    try:
+        compiled = CompiledForest.from_sklearn(model)
+    except Exception:
+        compiled = None
+    return ServingModel(key, model, compiled)
+
+
+def load_replay_traffic(log_dir=PROMOTION_REPLAY_DIR, max_rows=PROMOTION_REPLAY_ROWS):
+    """Newest closed request-log segments, up to `max_rows` rows, or None if there are none."""
+    paths = sorted(glob.glob(os.path.join(log_dir, "requests_*.parquet")) +
+                   glob.glob(os.path.join(log_dir, "requests_*.csv")), reverse=True)
+    frames, rows = [], 0
+    for path in paths:
+        if rows >= max_rows:
+            break
+        try:
+            df = read_segment(path)
+        except Exception as e:
+            print(f"Skipping unreadable request log {path}: {e}")
+            continue
+        frames.append(df)
+        rows += len(df)
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True).head(max_rows)
+
+
+# Scoring
+def score_batched(serving, df, batch_size=PROMOTION_BATCH_SIZE):
+    """Fraud probabilities for `df` in batches of `batch_size` rows, plus the latency per 1k rows in ms."""
+    X = df[serving.feature_names].to_numpy(dtype=np.float64)
+    if len(X) == 0:
+        return np.empty(0), 0.0
+    proba = np.empty(len(X))
+    started = time.perf_counter()
+    for start in range(0, len(X), batch_size):
+        proba[start:start + batch_size] = serving.predict_proba(X[start:start + batch_size])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return proba, elapsed_ms * 1000 / len(X)
+
+
+def classification_scores(y_true, proba, threshold=0.5):
+    preds = (proba >= threshold).astype(int)
+    return {
+        "precision": precision_score(y_true, preds, zero_division=0),
+        "recall": recall_score(y_true, preds, zero_division=0),
+        "f1_score": f1_score(y_true, preds, zero_division=0),
+        "pr_auc": average_precision_score(y_true, proba) if np.any(y_true == 1) else 0.0,
+    }
+
+
+# Champion/challenger comparison
+def compare_models(champion, challenger, X_holdout, y_holdout, replay=None):
+    """Score both models on the same held-out rows and replayed traffic.
+
+    Held-out rows have labels, so precision, recall and PR-AUC are compared.
+    Logged traffic only carries the label the serving model predicted, so on
+    the replay only alert rates and agreement are reported. Latency is
+    measured over all rows with the same batch size for both models.
+    """
+    results = {"holdout": {"rows": int(len(X_holdout))}, "replay": None, "latency_ms_per_1k": {}}
+    y = np.asarray(y_holdout).astype(int)
+    for name, serving in (("champion", champion), ("challenger", challenger)):
+        proba, latency = score_batched(serving, X_holdout)
+        results["holdout"][name] = classification_scores(y, proba)
+        results["latency_ms_per_1k"][name] = latency
+
+    if replay is not None and len(replay):
+        alerts = {}
+        for name, serving in (("champion", champion), ("challenger", challenger)):
+            proba, latency = score_batched(serving, replay)
+            alerts[name] = proba >= 0.5
+            # Weight the latency by row count across holdout and replay
+            n_holdout, n_replay = len(X_holdout), len(replay)
+            results["latency_ms_per_1k"][name] = (
+                (results["latency_ms_per_1k"][name] * n_holdout + latency * n_replay) / (n_holdout + n_replay)
+            )
+        results["replay"] = {
+            "rows": int(len(replay)),
+            "champion_alert_rate": float(alerts["champion"].mean()),
+            "challenger_alert_rate": float(alerts["challenger"].mean()),
+            "agreement": float((alerts["champion"] == alerts["challenger"]).mean()),
+        }
+    return results
+
+
+def decide(results):
+    """Return (promote, reasons) from the comparison results."""
+    champion, challenger = results["holdout"]["champion"], results["holdout"]["challenger"]
+    reasons = []
+    # A strict gain: a tie never replaces the served model
+    if challenger["pr_auc"] <= champion["pr_auc"] + PROMOTION_MIN_PR_AUC_GAIN:
+        reasons.append(f"PR-AUC {challenger['pr_auc']:.4f} does not beat champion {champion['pr_auc']:.4f}"
+                       f" by {PROMOTION_MIN_PR_AUC_GAIN}")
+    if challenger["recall"] < champion["recall"] - PROMOTION_MAX_RECALL_DROP:
+        reasons.append(f"recall {challenger['recall']:.4f} drops more than {PROMOTION_MAX_RECALL_DROP}"
+                       f" below champion {champion['recall']:.4f}")
+    if challenger["precision"] < champion["precision"] - PROMOTION_MAX_PRECISION_DROP:
+        reasons.append(f"precision {challenger['precision']:.4f} drops more than {PROMOTION_MAX_PRECISION_DROP}"
+                       f" below champion {champion['precision']:.4f}")
+    latency = results["latency_ms_per_1k"]
+    if latency["champion"] > 0 and latency["challenger"] > latency["champion"] * PROMOTION_MAX_LATENCY_RATIO:
+        reasons.append(f"latency {latency['challenger']:.2f} ms/1k rows exceeds {PROMOTION_MAX_LATENCY_RATIO}x"
+                       f" champion {latency['champion']:.2f} ms/1k rows")
+    return not reasons, reasons
+
+
+def run_promotion_gate(model, X_holdout, y_holdout, results_file=PROMOTION_RESULTS_FILE):
+    """Decide whether a freshly trained model may replace the served one and write the results to `results_file`.
+
+    Returns the result dict; `result["promote"]` tells the caller whether to upload.
+    """
+    challenger = to_serving("challenger", model)
+    champion_key = None
+    try:
+        champion_key, champion_model = load_champion()
+        if champion_model is None:
+            result = {"champion_key": None, "promote": True, "reasons": ["no champion model to compare against"]}
+        else:
+            champion = to_serving(champion_key, champion_model)
+            result = compare_models(champion, challenger, X_holdout, y_holdout, load_replay_traffic())
+            promote, reasons = decide(result)
+            result = {"champion_key": champion_key, "promote": promote, "reasons": reasons, **result}
+    except Exception as e:
+        # Only a registry without any model skips the comparison; a champion that
+        # cannot be loaded or cannot score the held-out data keeps serving
+        result = {"champion_key": champion_key, "promote": False,
+                  "reasons": [f"champion/challenger comparison failed: {type(e).__name__}: {e}"],
+                  "error": repr(e)}
+
+    with open(results_file, "w") as f:
+        json.dump(result, f, indent=2)
+
+    if result["promote"]:
+        print(f"Challenger promoted over {result['champion_key']}: {'; '.join(result['reasons']) or 'wins on all checks'}")
+    else:
+        print(f"Challenger rejected, keeping {result['champion_key']}: {'; '.join(result['reasons'])}")
+    return result
@@ -0,0 +1,207 @@
+import glob
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+SEGMENT_SUFFIX = {"parquet": ".parquet", "csv": ".csv"}
+IN_PROGRESS = ".inprogress"
+
+
+class RequestLogger:
+    """Buffered, background writer for scored requests.
+
+    Request threads only append a reference to their feature matrix into a
+    bounded in-memory buffer; a single writer thread flushes the buffer in
+    large batches (every `flush_rows` rows or `flush_interval` seconds) into
+    rotating segment files under `log_dir`. Segments are written as
+    `<name>.inprogress` and renamed when closed, so readers only ever see
+    complete files.
+
+    When the buffer holds `capacity` rows, new rows are dropped and counted
+    (`policy="drop"`) or the caller waits up to `block_timeout` seconds for
+    space (`policy="block"`).
+
+    With `segment_max_age` set, a segment is also closed once it is that many
+    seconds old, so segments of processes that never rotate explicitly are
+    still picked up by the weekly upload.
+
+    `on_flush(seconds, rows)`, if given, is called by the writer thread after
+    every successful flush (used for latency metrics).
+    """
+
+    def __init__(self, log_dir, columns, fmt="parquet", capacity=100_000, flush_rows=5_000,
+                 flush_interval=1.0, segment_max_rows=500_000, policy="drop", block_timeout=0.05,
+                 segment_max_age=None, on_flush=None):
+        if fmt not in SEGMENT_SUFFIX:
+            raise ValueError(f"Unsupported request log format: {fmt}")
+        self.log_dir = log_dir
+        self.columns = list(columns) + ["Class"]
+        self.fmt = fmt
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.segment_max_rows = segment_max_rows
+        self.segment_max_age = segment_max_age
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.on_flush = on_flush
+
+        self._buffer = []
+        self._buffered_rows = 0
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._segment_path = None
+        self._segment_rows = 0
+        self._segment_opened = 0.0
+        self._writer = None
+        self._seq = 0
+
+        self.counters = {"logged_rows": 0, "dropped_rows": 0, "flushes": 0,
+                         "segments_closed": 0, "write_errors": 0}
+
+        os.makedirs(log_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Request-thread side
+    def log(self, X, classes, columns=None):
+        """Queue rows for writing. Returns False if they were dropped.
+
+        `columns` names the columns of `X` when they are not the logger's
+        columns in order; they are realigned by the writer thread.
+        """
+        n = len(X)
+        with self._cond:
+            if self._buffered_rows + n > self.capacity:
+                if self.policy == "block":
+                    self._cond.wait_for(lambda: self._buffered_rows + n <= self.capacity, self.block_timeout)
+                if self._buffered_rows + n > self.capacity:
+                    self.counters["dropped_rows"] += n
+                    return False
+            self._buffer.append((X, classes, columns))
+            self._buffered_rows += n
+            self.counters["logged_rows"] += n
+            if self._buffered_rows >= self.flush_rows:
+                self._cond.notify_all()
+        return True
+
+    def stats(self):
+        with self._cond:
+            return {**self.counters, "buffered_rows": self._buffered_rows, "capacity": self.capacity}
+
+    # Writer side
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._buffered_rows >= self.flush_rows, self.flush_interval)
+            self.flush()
+            if self.segment_max_age is not None and self._segment_path is not None:
+                with self._write_lock:
+                    if time.monotonic() - self._segment_opened >= self.segment_max_age:
+                        self._close_segment()
+
+    def _take_buffer(self):
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+            self._buffered_rows = 0
+            self._cond.notify_all()
+        return batch
+
+    def flush(self):
+        """Write everything currently buffered to the open segment."""
+        import pandas as pd
+        with self._write_lock:
+            batch = self._take_buffer()
+            if not batch:
+                return
+            started = time.perf_counter()
+            try:
+                # float64 regardless of payload format, so every flush matches the segment schema
+                X = np.concatenate([self._aligned(b[0], b[2]) for b in batch]).astype(np.float64, copy=False)
+                classes = np.concatenate([b[1] for b in batch])
+                df = pd.DataFrame(X, columns=self.columns[:-1])
+                df["Class"] = classes.astype(int)
+                self._write(df)
+                self.counters["flushes"] += 1
+                if self._segment_rows >= self.segment_max_rows:
+                    self._close_segment()
+                if self.on_flush is not None:
+                    self.on_flush(time.perf_counter() - started, len(df))
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                logging.error(f"Error writing request log: {e}")
+
+    def _aligned(self, X, columns):
+        """`X` with its columns in logger order; columns it lacks are NaN."""
+        if columns is None or list(columns) == self.columns[:-1]:
+            return X
+        index = {name: i for i, name in enumerate(columns)}
+        out = np.full((len(X), len(self.columns) - 1), np.nan)
+        for j, name in enumerate(self.columns[:-1]):
+            if name in index:
+                out[:, j] = X[:, index[name]]
+        return out
+
+    def _write(self, df):
+        if self._segment_path is None:
+            self._seq += 1
+            name = f"requests_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{self._seq:06d}"
+            self._segment_path = os.path.join(self.log_dir, name + SEGMENT_SUFFIX[self.fmt] + IN_PROGRESS)
+            self._segment_rows = 0
+            self._segment_opened = time.monotonic()
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self._segment_path, table.schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self._segment_path, mode="a", header=self._segment_rows == 0, index=False)
+        self._segment_rows += len(df)
+
+    def _close_segment(self):
+        if self._segment_path is None:
+            return
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        os.replace(self._segment_path, self._segment_path[:-len(IN_PROGRESS)])
+        self._segment_path = None
+        self._segment_rows = 0
+        self.counters["segments_closed"] += 1
+
+    def rotate(self):
+        """Flush the buffer and close the open segment so it can be picked up."""
+        self.flush()
+        with self._write_lock:
+            self._close_segment()
+
+    def pending_bytes(self):
+        """Size on disk of the closed segments plus the one being written."""
+        open_segment = self._segment_path
+        paths = self.closed_segments() + ([open_segment] if open_segment else [])
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+    def closed_segments(self):
+        return sorted(glob.glob(os.path.join(self.log_dir, f"requests_*{SEGMENT_SUFFIX[self.fmt]}")))
+
+
+def read_segment(path):
+    import pandas as pd
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def iter_segment(path, batch_rows=50_000):
+    """A segment as DataFrames of at most `batch_rows` rows, without loading it whole."""
+    import pandas as pd
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=batch_rows)
@@ -0,0 +1,211 @@
+"""Interchangeable class-imbalance strategies applied to the training split before fitting.
+
+Every strategy has `fit_resample(X, y)` like imblearn's samplers, takes a
+DataFrame/Series or NumPy arrays and returns the same types:
+
+- class_weight: no resampling; the forest's class_weight="balanced" does the work
+- undersample: keep every minority row and a random subset of the majority
+- oversample: duplicate random minority rows
+- smote: imblearn SMOTE with a parallel exact neighbour search
+- smote_approx: SMOTE interpolation with neighbours searched inside random
+  blocks of minority rows, so the search is linear in the minority count
+
+Ratios are minority rows per majority row after resampling (1.0 = balanced).
+`build_model` is the training forest all strategies are fitted with.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from config import (
+    RESAMPLING_STRATEGY, OVERSAMPLING_RATIO, UNDERSAMPLING_RATIO, SMOTE_K_NEIGHBORS, SMOTE_N_JOBS, SMOTE_BLOCK_SIZE
+)
+
+STRATEGIES = ("class_weight", "undersample", "oversample", "smote", "smote_approx")
+
+
+def _class_indices(y):
+    """(minority row indices, majority row indices, minority label) of a binary target."""
+    labels, counts = np.unique(y, return_counts=True)
+    if len(labels) != 2:
+        return None
+    minority = labels[np.argmin(counts)]
+    return np.flatnonzero(y == minority), np.flatnonzero(y != minority), minority
+
+
+def _take(X, y, idx):
+    if isinstance(X, pd.DataFrame):
+        return X.iloc[idx].reset_index(drop=True), y.iloc[idx].reset_index(drop=True)
+    return X[idx], y[idx]
+
+
+def _append(X, y, X_new, label):
+    """Append synthetic rows of class `label`."""
+    if isinstance(X, pd.DataFrame):
+        new = pd.DataFrame(X_new, columns=X.columns)
+        return (pd.concat([X.reset_index(drop=True), new], ignore_index=True),
+                pd.concat([y.reset_index(drop=True), pd.Series(label, index=new.index, name=y.name, dtype=y.dtype)],
+                          ignore_index=True))
+    return np.concatenate([X, X_new.astype(X.dtype, copy=False)]), np.concatenate([y, np.full(len(X_new), label, y.dtype)])
+
+
+def _n_synthetic(n_minority, n_majority, ratio):
+    return max(int(ratio * n_majority) - n_minority, 0)
+
+
+class ClassWeightOnly:
+    name = "class_weight"
+
+    def fit_resample(self, X, y):
+        return X, y
+
+
+class MajorityUndersampler:
+    name = "undersample"
+
+    def __init__(self, ratio=0.1, seed=None):
+        self.ratio = ratio
+        self.seed = seed
+
+    def fit_resample(self, X, y):
+        split = _class_indices(np.asarray(y))
+        if split is None:
+            return X, y
+        minority, majority, _ = split
+        n_keep = min(len(majority), int(np.ceil(len(minority) / self.ratio)))
+        keep = np.random.default_rng(self.seed).choice(majority, size=n_keep, replace=False)
+        return _take(X, y, np.sort(np.concatenate([minority, keep])))
+
+
+class RandomOversampler:
+    name = "oversample"
+
+    def __init__(self, ratio=1.0, seed=None):
+        self.ratio = ratio
+        self.seed = seed
+
+    def fit_resample(self, X, y):
+        split = _class_indices(np.asarray(y))
+        if split is None:
+            return X, y
+        minority, majority, _ = split
+        n_new = _n_synthetic(len(minority), len(majority), self.ratio)
+        extra = np.random.default_rng(self.seed).choice(minority, size=n_new, replace=True)
+        return _take(X, y, np.concatenate([np.arange(len(y)), extra]))
+
+
+class SMOTEResampler:
+    """imblearn SMOTE; `n_jobs` parallelizes its exact k-NN search."""
+
+    name = "smote"
+
+    def __init__(self, ratio=1.0, k_neighbors=5, n_jobs=None, seed=None):
+        self.ratio = ratio
+        self.k_neighbors = k_neighbors
+        self.n_jobs = n_jobs
+        self.seed = seed
+
+    def fit_resample(self, X, y):
+        from imblearn.over_sampling import SMOTE
+        from sklearn.neighbors import NearestNeighbors
+        split = _class_indices(np.asarray(y))
+        if split is None or len(split[0]) < 2:
+            return X, y
+        minority, majority, _ = split
+        if _n_synthetic(len(minority), len(majority), self.ratio) == 0:
+            return X, y
+        k = min(self.k_neighbors, len(minority) - 1)
+        smote = SMOTE(sampling_strategy=self.ratio, random_state=self.seed,
+                      k_neighbors=NearestNeighbors(n_neighbors=k + 1, n_jobs=self.n_jobs))
+        return smote.fit_resample(X, y)
+
+
+class BlockSMOTE:
+    """SMOTE with an approximate neighbour search.
+
+    Minority rows are shuffled into blocks of about `block_size` rows and
+    each row's k nearest neighbours are searched only inside its block,
+    which costs O(n * block_size) instead of O(n^2) distance evaluations.
+    Synthetic rows are then interpolated exactly as SMOTE does.
+    """
+
+    name = "smote_approx"
+
+    def __init__(self, ratio=1.0, k_neighbors=5, block_size=2048, seed=None):
+        self.ratio = ratio
+        self.k_neighbors = k_neighbors
+        self.block_size = block_size
+        self.seed = seed
+
+    def neighbors(self, X_min, k, rng):
+        """Indices of k approximate nearest neighbours for every row of `X_min`."""
+        n = len(X_min)
+        result = np.empty((n, k), dtype=np.int64)
+        order = rng.permutation(n)
+        # Equal blocks of at least block_size rows (one block if there are fewer)
+        for block in np.array_split(order, max(n // self.block_size, 1)):
+            B = X_min[block]
+            sq = (B * B).sum(axis=1)
+            dist = sq[:, None] + sq[None, :] - 2.0 * (B @ B.T)
+            np.fill_diagonal(dist, np.inf)
+            result[block] = block[np.argpartition(dist, k - 1, axis=1)[:, :k]]
+        return result
+
+    def fit_resample(self, X, y):
+        y_values = np.asarray(y)
+        split = _class_indices(y_values)
+        if split is None or len(split[0]) < 2:
+            return X, y
+        minority, majority, label = split
+        n_new = _n_synthetic(len(minority), len(majority), self.ratio)
+        if n_new == 0:
+            return X, y
+        rng = np.random.default_rng(self.seed)
+        X_min = np.asarray(X.iloc[minority] if isinstance(X, pd.DataFrame) else X[minority], dtype=np.float64)
+        # Every block has at least min(block_size, minority rows) rows
+        k = min(self.k_neighbors, len(minority) - 1, self.block_size - 1)
+        nn = self.neighbors(X_min, k, rng)
+        base = rng.integers(0, len(X_min), n_new)
+        neighbor = nn[base, rng.integers(0, k, n_new)]
+        gap = rng.random((n_new, 1))
+        synthetic = X_min[base] + gap * (X_min[neighbor] - X_min[base])
+        return _append(X, y, synthetic, label)
+
+
+def make_resampler(strategy, seed=None, oversampling_ratio=1.0, undersampling_ratio=0.1,
+                   k_neighbors=5, n_jobs=None, block_size=2048):
+    """Build the resampler called `strategy` (one of STRATEGIES)."""
+    if strategy == "class_weight":
+        return ClassWeightOnly()
+    if strategy == "undersample":
+        return MajorityUndersampler(undersampling_ratio, seed)
+    if strategy == "oversample":
+        return RandomOversampler(oversampling_ratio, seed)
+    if strategy == "smote":
+        return SMOTEResampler(oversampling_ratio, k_neighbors, n_jobs, seed)
+    if strategy == "smote_approx":
+        return BlockSMOTE(oversampling_ratio, k_neighbors, block_size, seed)
+    raise ValueError(f"Unknown resampling strategy: {strategy}")
+
+
+def configured_resampler(enabled=True, seed=None):
+    """The RESAMPLING_STRATEGY from config.py; `enabled=False` keeps only the class weights."""
+    return make_resampler(RESAMPLING_STRATEGY if enabled else "class_weight", seed, OVERSAMPLING_RATIO,
+                          UNDERSAMPLING_RATIO, SMOTE_K_NEIGHBORS, SMOTE_N_JOBS, SMOTE_BLOCK_SIZE)
+
+
+# The forest the resampled rows are fitted with (train.py and benchmark_resampling.py)
+def build_model(**overrides):
+    """RandomForest with balanced class weights."""
+    params = dict(
+        n_estimators=25,
+        max_depth=8,
+        min_samples_split=5,
+        min_samples_leaf=3,
+        max_features='sqrt',
+        bootstrap=True,
+        n_jobs=-1,
+        random_state=42,
+        class_weight="balanced"
+    )
+    params.update(overrides)
+    return RandomForestClassifier(**params)
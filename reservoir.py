@@ -0,0 +1,126 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+METADATA_KEY = b"reservoir"
+# Index into `sources` of the source each row came from (-1 if unknown)
+SOURCE_COLUMN = "__source__"
+
+
+class ReservoirSample:
+    """Uniform fixed-size sample of every row ever added (reservoir sampling, Algorithm R).
+
+    `add` is vectorized: row i of a batch (the (seen + i)-th row overall)
+    draws a slot in [0, seen + i]; slots below `capacity` are overwritten
+    in row order, which gives the same distribution as the row-by-row
+    algorithm. The sources added so far (e.g. weekly file keys) are kept
+    with the sample, together with the number of rows taken from each, so a
+    weekly file that was appended to only contributes its new rows and no
+    row is counted twice. Every row remembers its source so a sample can
+    leave out given weeks.
+    """
+
+    def __init__(self, capacity, rows=None, seen=0, sources=(), seed=None, source_rows=None):
+        self.capacity = capacity
+        self.rows = rows
+        self.seen = seen
+        self.sources = list(sources)
+        # Rows taken from each source; sources from before this was tracked are missing
+        self.source_rows = dict(source_rows or {})
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return 0 if self.rows is None else len(self.rows)
+
+    def add(self, df, source=None):
+        """Offer the rows of `df` not offered before; returns False if there were none.
+
+        For a source that was added before, `df` is taken to be its earlier
+        rows followed by new ones (an append-only file), and only the rows
+        past those already taken are offered.
+        """
+        code = -1
+        if source is not None:
+            if source in self.sources:
+                code = self.sources.index(source)
+                taken = self.source_rows.get(source)
+                if taken is None or len(df) <= taken:
+                    return False
+                self.source_rows[source] = len(df)
+                df = df.iloc[taken:]
+            else:
+                self.sources.append(source)
+                self.source_rows[source] = len(df)
+                code = len(self.sources) - 1
+        if df.empty:
+            return True
+        df = df.reset_index(drop=True).assign(**{SOURCE_COLUMN: np.int32(code)})
+        if self.rows is None:
+            self.rows = df.iloc[:0].copy()
+
+        # Fill phase: the first `capacity` rows are all kept
+        fill = min(max(self.capacity - len(self.rows), 0), len(df))
+        if fill:
+            self.rows = pd.concat([self.rows, df.iloc[:fill]], ignore_index=True)
+            self.seen += fill
+            df = df.iloc[fill:].reset_index(drop=True)
+        if df.empty:
+            return True
+
+        # Replacement phase: row with overall index t replaces slot j ~ U[0, t] if j < capacity
+        t = self.seen + np.arange(len(df))
+        slots = (self.rng.random(len(df)) * (t + 1)).astype(np.int64)
+        accepted = np.flatnonzero(slots < self.capacity)
+        if len(accepted):
+            # Later rows win on repeated slots, as they would row by row
+            target = slots[accepted]
+            _, last = np.unique(target[::-1], return_index=True)
+            last = len(target) - 1 - last
+            slot_idx, row_idx = target[last], accepted[last]
+            for col in self.rows.columns:
+                values = self.rows[col].to_numpy(copy=True)
+                values[slot_idx] = df[col].to_numpy()[row_idx]
+                self.rows[col] = values
+        self.seen += len(df)
+        return True
+
+    def sample(self, n, seed=None, exclude_sources=()):
+        """Up to `n` rows drawn without replacement from the reservoir, none of them from `exclude_sources`."""
+        if self.rows is None or n <= 0:
+            return None
+        rows = self.rows
+        exclude_sources = set(exclude_sources)
+        excluded = [i for i, source in enumerate(self.sources) if source in exclude_sources]
+        if excluded:
+            rows = rows[~rows[SOURCE_COLUMN].isin(excluded)]
+        rows = rows.drop(columns=SOURCE_COLUMN)
+        if n >= len(rows):
+            return rows.reset_index(drop=True)
+        return rows.sample(n=n, random_state=seed).reset_index(drop=True)
+
+    def to_bytes(self):
+        """Parquet with the counters in the schema metadata."""
+        table = pa.Table.from_pandas(self.rows if self.rows is not None else pd.DataFrame(), preserve_index=False)
+        meta = json.dumps({"capacity": self.capacity, "seen": self.seen, "sources": self.sources,
+                           "source_rows": self.source_rows})
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: meta.encode("utf-8")})
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, capacity=None, seed=None):
+        table = pq.read_table(io.BytesIO(data))
+        meta = json.loads(table.schema.metadata[METADATA_KEY])
+        rows = table.to_pandas()
+        capacity = capacity or meta["capacity"]
+        if len(rows) > capacity:
+            rows = rows.sample(n=capacity, random_state=seed).reset_index(drop=True)
+        if len(rows.columns) and SOURCE_COLUMN not in rows.columns:
+            # Written before rows tracked their source
+            rows[SOURCE_COLUMN] = np.int32(-1)
+        return cls(capacity, rows if len(rows.columns) else None, meta["seen"], meta["sources"], seed,
+                   meta.get("source_rows"))
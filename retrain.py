@@ -1,109 +1,306 @@
+import copy
 import os
+import numpy as np
 import pandas as pd
-from io import BytesIO
-import boto3
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from imblearn.over_sampling import SMOTE
-import joblib
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, average_precision_score
 import mlflow
-import mlflow.sklearn
 import json
-from dotenv import load_dotenv
-from datetime import datetime
-from config import BUCKET_NAME, WEEKS_PREFIX, LATEST_MODEL_PATH
-
-# Load environment variables
-load_dotenv()
-
-# S3 client
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
+from config import (
+    BUCKET_NAME, LATEST_MODEL_PATH, S3_MODEL_BACKUP_PREFIX, RANDOM_STATE, HYPERPARAM_SEARCH,
+    SEARCH_STRATEGY, SEARCH_GRID, SEARCH_CV_FOLDS, SEARCH_WORKERS, SEARCH_TIME_BUDGET, HALVING_FACTOR,
+    PROMOTION_GATE, PROMOTION_RESULTS_FILE, REFERENCE_STATS_FILE, INCREMENTAL_RETRAINING, INCREMENTAL_NEW_TREES,
+    INCREMENTAL_MAX_TREES, INCREMENTAL_MIN_TREE_SCORE_RATIO, INCREMENTAL_HISTORY_FRACTION,
+    INCREMENTAL_VALIDATION_FRACTION, RESERVOIR_KEY, RESERVOIR_SIZE, MODEL_COMPRESSION, UPLOAD_WORKERS,
+    UPLOAD_PART_SIZE, ASYNC_MLFLOW_LOGGING, HOLDOUT_WEEKS, HOLDOUT_FRACTION
 )
+from drift_stats import FeatureStats, reference_to_dict
+from hyperparam_search import HyperparameterSearch
+from promotion import load_champion, run_promotion_gate
+from artifact_pipeline import log_model_async, new_model_folder, publish_model_folder, serialize_model
+from reservoir import ReservoirSample
+from resampling import configured_resampler
+from s3_data import get_s3_client, list_week_objects, load_week_frame, load_week_frames
+
+# Shared S3 client
+s3_client = get_s3_client()
 
 # MLflow experiment
 EXPERIMENT_NAME = "fraud_detection"
 mlflow.set_experiment(EXPERIMENT_NAME)
 
+# Default RandomForest settings; the search overrides the parameters in SEARCH_GRID
+BASE_MODEL_PARAMS = dict(
+    n_estimators=25,
+    max_depth=8,
+    min_samples_split=5,
+    min_samples_leaf=3,
+    max_features='sqrt',
+    bootstrap=True,
+    n_jobs=-1,
+    random_state=RANDOM_STATE,
+    class_weight="balanced"
+)
+
 # Helper functions
 def load_last_n_weeks(n=4):
-    resp = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=WEEKS_PREFIX)
-    files = sorted([obj['Key'] for obj in resp.get("Contents", []) if obj['Key'].endswith(".csv")])[-n:]
-    dfs = [pd.read_csv(BytesIO(s3_client.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read())) for key in files]
-    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
-
-def upload_model_to_s3(model_file, metrics_file, input_example_file):
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M")
-    s3_folder = f"model_backups/{timestamp}-Model"
-    for file in [model_file, metrics_file, input_example_file]:
-        if os.path.exists(file):
-            s3_client.upload_file(file, BUCKET_NAME, f"{s3_folder}/{os.path.basename(file)}")
-    print(f"Model, metrics, and input example uploaded to s3://{BUCKET_NAME}/{s3_folder}")
+    """The newest `n` weekly files, with the file of every row in the index level "week"."""
+    return load_week_frames(list_week_objects()[-n:], by_week=True)
+
+def upload_model_to_s3(model_file, metrics_file, input_example_file, promotion_file=None, reference_file=None, model=None):
+    s3_folder = new_model_folder(S3_MODEL_BACKUP_PREFIX)
+    files = [model_file, metrics_file, input_example_file, promotion_file, reference_file]
+    # Uploaded in parallel (with the compiled arrays of `model`); the API is pointed at the folder last
+    publish_model_folder(s3_client, BUCKET_NAME, s3_folder, {os.path.basename(f): f for f in files if f}, model,
+                         S3_MODEL_BACKUP_PREFIX, UPLOAD_WORKERS, UPLOAD_PART_SIZE)
+    return s3_folder
+
+def log_trial(trial):
+    """Log one CV trial as a nested MLflow run under the active retraining run."""
+    with mlflow.start_run(run_name="cv_trial", nested=True):
+        mlflow.log_params(trial["params"])
+        mlflow.log_param("sample_fraction", trial["fraction"])
+        mlflow.log_metric("cv_pr_auc", trial["mean_pr_auc"])
+        mlflow.log_metric("cv_pr_auc_std", trial["std_pr_auc"])
+        mlflow.log_metric("mean_fit_seconds", trial["mean_fit_seconds"])
+    print(f"Trial {trial['params']} (fraction {trial['fraction']:.2f}): PR-AUC {trial['mean_pr_auc']:.4f} ± {trial['std_pr_auc']:.4f}")
+
+def search_model_params(X_train, y_train, use_smote=True):
+    """Stratified k-fold search over SEARCH_GRID; returns the parameters with the best CV PR-AUC."""
+    search = HyperparameterSearch(
+        BASE_MODEL_PARAMS,
+        SEARCH_GRID,
+        n_splits=SEARCH_CV_FOLDS,
+        strategy=SEARCH_STRATEGY,
+        halving_factor=HALVING_FACTOR,
+        n_workers=SEARCH_WORKERS,
+        time_budget=SEARCH_TIME_BUDGET,
+        resampler=configured_resampler(use_smote, seed=RANDOM_STATE),
+        seed=RANDOM_STATE,
+        on_trial=log_trial,
+    )
+    best_params, best_score = search.run(X_train.to_numpy(), y_train.to_numpy())
+    if best_params is None:
+        print("No search trial finished within the time budget, using default parameters.")
+        return dict(BASE_MODEL_PARAMS)
+    print(f"Best parameters by CV PR-AUC ({best_score:.4f}): {best_params}")
+    mlflow.log_metric("best_cv_pr_auc", best_score)
+    return best_params
+
+# Held-out rows
+def row_buckets(X):
+    """A number in [0, 1) per row, from a hash of its values: a row lands in the same bucket in every run."""
+    return pd.util.hash_pandas_object(X, index=False).to_numpy() / 2.0 ** 64
+
+def newest_weeks_mask(X, n_weeks=HOLDOUT_WEEKS):
+    """Rows from the newest `n_weeks` weekly files; all rows if `X` carries no week labels."""
+    if "week" not in X.index.names:
+        return np.ones(len(X), dtype=bool)
+    weeks = X.index.get_level_values("week")
+    return weeks.isin(pd.unique(weeks)[-n_weeks:])
+
+def split_holdout(X, y, n_weeks=HOLDOUT_WEEKS, fraction=HOLDOUT_FRACTION):
+    """(X_train, X_test, y_train, y_test) with the test rows drawn from the newest weeks only.
+
+    The served model was trained before the newest week arrived, or with the
+    same rows held out: rows are assigned by a hash of their values, which
+    gives the same split in every run. Neither model has trained on the test
+    rows, so the metrics and the promotion gate compare them fairly.
+    """
+    if "week" not in X.index.names:
+        print("Training rows carry no week labels; holding out a share of all rows.")
+    test = newest_weeks_mask(X, n_weeks) & (row_buckets(X) < fraction)
+    return X[~test], X[test], y[~test], y[test]
+
+# Historical reservoir
+def load_reservoir():
+    """The reservoir sample of all weekly data from S3, or an empty one."""
+    try:
+        obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=RESERVOIR_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return ReservoirSample(RESERVOIR_SIZE, seed=RANDOM_STATE)
+    return ReservoirSample.from_bytes(obj["Body"].read(), RESERVOIR_SIZE, seed=RANDOM_STATE)
+
+def update_reservoir(objects):
+    """Add the rows of weekly CSVs ((key, etag) pairs) that are not in the reservoir yet.
+
+    Called for every new or changed weekly file; a week that compaction
+    appended to only contributes the appended rows.
+    """
+    reservoir = load_reservoir()
+    added = [key for key, etag in objects if reservoir.add(load_week_frame(key, etag), source=key)]
+    if added:
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=RESERVOIR_KEY, Body=reservoir.to_bytes())
+        print(f"Reservoir now samples {len(reservoir)} of {reservoir.seen} rows (added {added})")
+    return reservoir
+
+# Incremental retraining
+def is_compatible(champion, X):
+    """Whether the served model can be grown with warm_start on these columns."""
+    return (isinstance(champion, RandomForestClassifier)
+            and list(getattr(champion, "feature_names_in_", [])) == list(X.columns)
+            and len(champion.classes_) == 2)
+
+def prune_trees(model, X_val, y_val, max_trees=INCREMENTAL_MAX_TREES,
+                min_score_ratio=INCREMENTAL_MIN_TREE_SCORE_RATIO):
+    """Drop trees whose PR-AUC on the validation rows has decayed; returns the number dropped.
+
+    `X_val` must hold rows none of the trees has trained on, or the trees
+    that saw them win (grow_champion passes rows of the newest week that the
+    new trees were grown without). Trees below `min_score_ratio` times the
+    median score are dropped, then the weakest beyond `max_trees`.
+    """
+    if y_val.nunique() < 2:
+        print("No fraud cases in the validation rows, keeping all trees.")
+        return 0
+    X_val = X_val.to_numpy(dtype=np.float32)
+    scores = np.array([average_precision_score(y_val, tree.predict_proba(X_val)[:, 1])
+                       for tree in model.estimators_])
+    keep = np.flatnonzero(scores >= min_score_ratio * np.median(scores))
+    keep = keep[np.argsort(scores[keep])[::-1][:max_trees]]
+    if len(keep) == 0:
+        keep = np.array([int(np.argmax(scores))])
+    keep = np.sort(keep)
+    dropped = len(model.estimators_) - len(keep)
+    model.estimators_ = [model.estimators_[i] for i in keep]
+    model.n_estimators = len(model.estimators_)
+    return dropped
+
+def grow_champion(champion, X_train, y_train, use_smote=True):
+    """Add INCREMENTAL_NEW_TREES trees to a copy of the served forest and drop decayed ones.
+
+    The new trees are fitted on the recent training rows mixed with a
+    reservoir sample of older weeks (INCREMENTAL_HISTORY_FRACTION of the
+    rows), so the cost grows with the new data rather than the history.
+    The weeks being trained on are left out of that sample, so held-out and
+    validation rows cannot reach the new trees through it.
+
+    Trees are pruned on INCREMENTAL_VALIDATION_FRACTION of the newest week,
+    picked by row hash like the test rows: older trees were grown before
+    that week arrived (or without the same rows), the new trees without them.
+    """
+    val = newest_weeks_mask(X_train) & (row_buckets(X_train) >= 1 - INCREMENTAL_VALIDATION_FRACTION)
+    X_fit, X_val, y_fit, y_val = X_train[~val], X_train[val], y_train[~val], y_train[val]
+    n_history = int(len(X_fit) * INCREMENTAL_HISTORY_FRACTION / (1 - INCREMENTAL_HISTORY_FRACTION))
+    if "week" in X_train.index.names:
+        weeks = pd.unique(X_train.index.get_level_values("week"))
+        history = load_reservoir().sample(n_history, seed=RANDOM_STATE, exclude_sources=weeks)
+    else:
+        print("Training rows carry no week labels; not mixing in reservoir rows that may include them.")
+        history = None
+    if history is not None and "Class" in history.columns and set(X_fit.columns) <= set(history.columns):
+        X_fit = pd.concat([X_fit, history[X_fit.columns]], ignore_index=True)
+        y_fit = pd.concat([y_fit, history["Class"]], ignore_index=True)
+        print(f"Mixed {len(history)} historical rows into {len(X_fit) - len(history)} recent rows")
+
+    resampler = configured_resampler(use_smote, seed=RANDOM_STATE)
+    X_fit, y_fit = resampler.fit_resample(X_fit, y_fit)
+    print(f"After {resampler.name} resampling, training shape: {X_fit.shape}")
+    mlflow.log_param("resampling", resampler.name)
+
+    model = copy.deepcopy(champion)
+    n_old = len(model.estimators_)
+    model.set_params(warm_start=True, n_estimators=n_old + INCREMENTAL_NEW_TREES)
+    model.fit(X_fit, y_fit)
+    dropped = prune_trees(model, X_val, y_val)
+    print(f"Grew {n_old} trees by {INCREMENTAL_NEW_TREES}, dropped {dropped}, serving {model.n_estimators}")
+    mlflow.log_metric("previous_trees", n_old)
+    mlflow.log_metric("dropped_trees", dropped)
+    mlflow.log_metric("history_rows", 0 if history is None else len(history))
+    return model
 
 # Main retraining
-def run_retraining(use_smote=True):
-    df = load_last_n_weeks(4)
+def run_retraining(use_smote=True, df=None, search=HYPERPARAM_SEARCH, incremental=INCREMENTAL_RETRAINING):
+    """Retrain on the last 4 weeks (or on `df` if given) and return metrics plus the S3 folder.
+
+    Metrics and the promotion gate use held-out rows of the newest week (see
+    split_holdout), so `df` should come from load_last_n_weeks.
+
+    With `incremental`, the served forest is grown on `df` instead of being
+    replaced (see grow_champion); without a compatible served model it
+    falls back to a full fit.
+    """
+    if df is None:
+        df = load_last_n_weeks(4)
     if df.empty or "Class" not in df.columns:
         print("No data or target column missing. Aborting retraining.")
-        return
+        return None
 
     X = df.drop("Class", axis=1)
     y = df["Class"]
 
-    # Train/test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, stratify=y
-    )
+    # Test rows from the newest week, unseen by both the served model and the new one
+    X_train, X_test, y_train, y_test = split_holdout(X, y)
+    print(f"Training on {len(X_train)} rows, holding out {len(X_test)} rows of the newest week(s)")
 
-    if use_smote:
-        smote = SMOTE()
-        X_train, y_train = smote.fit_resample(X_train, y_train)
-        print(f"After SMOTE oversampling, training shape: {X_train.shape}")
-
-    model = RandomForestClassifier(
-        n_estimators=25,
-        max_depth=8,
-        min_samples_split=5,
-        min_samples_leaf=3,
-        max_features='sqrt',
-        bootstrap=True,
-        n_jobs=-1,
-        class_weight="balanced"
-    )
+    champion = None
+    if incremental:
+        _, champion = load_champion()
+        if champion is None or not is_compatible(champion, X):
+            print("No served forest to grow on these columns, falling back to a full fit.")
+            champion = None
+
+    with mlflow.start_run(run_name="retrain_incremental" if champion is not None else "retrain_local"):
+        # Feature statistics of the real (not oversampled) training rows, for live drift checks in the API
+        reference_stats = FeatureStats.from_frame(X_train)
+        input_example = X_train.head(1)
 
-    with mlflow.start_run(run_name="retrain_local"):
-        model.fit(X_train, y_train)
+        if champion is not None:
+            model = grow_champion(champion, X_train, y_train, use_smote)
+            params = {k: v for k, v in model.get_params().items() if k in BASE_MODEL_PARAMS}
+            mlflow.log_params(params)
+        else:
+            # Search on the raw training split; resampling is applied inside each fold
+            params = search_model_params(X_train, y_train, use_smote) if search else dict(BASE_MODEL_PARAMS)
+            mlflow.log_params(params)
+
+            resampler = configured_resampler(use_smote, seed=RANDOM_STATE)
+            X_train, y_train = resampler.fit_resample(X_train, y_train)
+            print(f"After {resampler.name} resampling, training shape: {X_train.shape}")
+            mlflow.log_param("resampling", resampler.name)
+
+            model = RandomForestClassifier(**params)
+            model.fit(X_train, y_train)
         preds = model.predict(X_test)
 
         acc = accuracy_score(y_test, preds)
         prec = precision_score(y_test, preds, zero_division=0)
         rec = recall_score(y_test, preds, zero_division=0)
         f1 = f1_score(y_test, preds, zero_division=0)
-        print(f"Test Accuracy: {acc:.4f}, Precision: {prec:.4f}, Recall: {rec:.4f}, F1: {f1:.4f}")
+        pr_auc = average_precision_score(y_test, model.predict_proba(X_test)[:, 1])
+        print(f"Test Accuracy: {acc:.4f}, Precision: {prec:.4f}, Recall: {rec:.4f}, F1: {f1:.4f}, PR-AUC: {pr_auc:.4f}")
 
         mlflow.log_metric("accuracy", acc)
         mlflow.log_metric("precision", prec)
         mlflow.log_metric("recall", rec)
         mlflow.log_metric("f1_score", f1)
+        mlflow.log_metric("pr_auc", pr_auc)
 
-        os.makedirs(os.path.dirname(LATEST_MODEL_PATH), exist_ok=True)
-        joblib.dump(model, LATEST_MODEL_PATH)
-
-        mlflow.sklearn.log_model(model, "model", input_example=X_train.head(1))
+        # One pickle for the local copy and S3; MLflow logging runs in the background
+        serialize_model(model, LATEST_MODEL_PATH, MODEL_COMPRESSION)
+        log_model_async(model, input_example, ASYNC_MLFLOW_LOGGING)
 
         metrics_file = "metrics.json"
         input_example_file = "input_example.csv"
         with open(metrics_file, "w") as f:
-            json.dump({"accuracy": acc, "precision": prec, "recall": rec, "f1_score": f1}, f)
-        X_train.head(1).to_csv(input_example_file, index=False)
+            json.dump({"accuracy": acc, "precision": prec, "recall": rec, "f1_score": f1, "pr_auc": pr_auc}, f)
+        input_example.to_csv(input_example_file, index=False)
+        with open(REFERENCE_STATS_FILE, "w") as f:
+            json.dump(reference_to_dict(reference_stats, preds.mean()), f)
 
-        upload_model_to_s3(LATEST_MODEL_PATH, metrics_file, input_example_file)
+        # Only replace the served model if the new one beats it on the same held-out rows
+        promotion = run_promotion_gate(model, X_test, y_test) if PROMOTION_GATE else {"promote": True}
+        mlflow.log_metric("promoted", int(promotion["promote"]))
+        if promotion["promote"]:
+            promotion_file = PROMOTION_RESULTS_FILE if PROMOTION_GATE else None
+            s3_folder = upload_model_to_s3(LATEST_MODEL_PATH, metrics_file, input_example_file, promotion_file,
+                                           REFERENCE_STATS_FILE, model)
+        else:
+            s3_folder = None
 
     print("Retraining completed.")
+    return {"accuracy": acc, "precision": prec, "recall": rec, "f1_score": f1, "pr_auc": pr_auc,
+            "params": params, "promoted": promotion["promote"], "s3_folder": s3_folder}
 
 if __name__ == "__main__":
     run_retraining(use_smote=True)
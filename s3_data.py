@@ -0,0 +1,201 @@
+import glob
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import boto3
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from dotenv import load_dotenv
+from config import BUCKET_NAME, WEEKS_PREFIX, DRIFT_ALERTS_PREFIX, DATASET_CACHE_DIR, DOWNLOAD_WORKERS
+
+# Load environment variables
+load_dotenv()
+
+
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """One boto3 S3 client per process, shared by drift_check, retrain and the watchdog."""
+    return boto3.client(
+        "s3",
+        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region_name=os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
+    )
+
+
+@lru_cache(maxsize=None)
+def get_arrow_s3():
+    """pyarrow's S3 filesystem with the same credentials, for ranged reads of Parquet objects."""
+    from pyarrow import fs
+    return fs.S3FileSystem(
+        access_key=os.getenv("AWS_ACCESS_KEY_ID"),
+        secret_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+        region=os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
+    )
+
+
+def week_sort_key(key):
+    """Order weekly files by the numbers in their name, e.g. (2025, 9) for week_2025_9.csv.
+
+    Older uploads have unpadded week numbers, so plain string order would put
+    week 10 before week 9.
+    """
+    return tuple(int(n) for n in re.findall(r"\d+", os.path.basename(key))), key
+
+
+def list_week_objects():
+    """(key, etag) of all weekly CSVs, oldest first."""
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    objects = []
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=WEEKS_PREFIX):
+        objects.extend((obj["Key"], obj["ETag"]) for obj in page.get("Contents", []) if obj["Key"].endswith(".csv"))
+    return sorted(objects, key=lambda obj: week_sort_key(obj[0]))
+
+
+def list_drift_alert_keys():
+    """Keys of the live drift alerts written by the API, oldest first."""
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    keys = []
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=DRIFT_ALERTS_PREFIX):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return sorted(keys)
+
+
+# Local columnar mirror of S3 CSVs
+def _cache_stem(key):
+    return os.path.join(DATASET_CACHE_DIR, key.replace("/", "__"))
+
+
+def _cache_path(key, etag):
+    etag = etag.strip('"')
+    return f"{_cache_stem(key)}.{etag}.arrow"
+
+
+def _read_cached(path):
+    # Uncompressed Arrow IPC, memory-mapped: no parsing, pages are read lazily
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def load_csv_object(key, etag=None):
+    """CSV object from S3 as a DataFrame, parsed once and then served from the local Arrow cache.
+
+    Without an ETag, a HEAD request decides whether the cached copy is current;
+    if S3 cannot be reached the newest cached copy is used.
+    """
+    s3 = get_s3_client()
+    if etag is None:
+        try:
+            etag = s3.head_object(Bucket=BUCKET_NAME, Key=key)["ETag"]
+        except Exception as e:
+            cached = sorted(glob.glob(f"{_cache_stem(key)}.*.arrow"), key=os.path.getmtime)
+            if not cached:
+                raise
+            logging.warning(f"Could not check s3://{BUCKET_NAME}/{key} ({e}), using cached copy")
+            return _read_cached(cached[-1])
+
+    path = _cache_path(key, etag)
+    if os.path.exists(path):
+        return _read_cached(path)
+
+    obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    df = pd.read_csv(obj["Body"])
+    path = _cache_path(key, obj["ETag"])
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp, compression="uncompressed")
+    os.replace(tmp, path)
+    # Drop copies of older versions of the same object
+    for stale in glob.glob(f"{_cache_stem(key)}.*.arrow"):
+        if stale != path:
+            os.remove(stale)
+    return df
+
+
+def iter_csv_chunks(key, chunksize=50_000):
+    """Yield an S3 CSV as DataFrame chunks without holding the whole file in memory.
+
+    The first pass streams the CSV from S3 and writes the local Arrow copy
+    batch by batch; later passes read record batches from the memory-mapped copy.
+    """
+    s3 = get_s3_client()
+    etag = s3.head_object(Bucket=BUCKET_NAME, Key=key)["ETag"]
+    path = _cache_path(key, etag)
+    if os.path.exists(path):
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pandas()
+        return
+
+    obj = s3.get_object(Bucket=BUCKET_NAME, Key=key)
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    path = _cache_path(key, obj["ETag"])
+    tmp = f"{path}.tmp"
+    writer = None
+    complete = False
+    try:
+        for chunk in pd.read_csv(obj["Body"], chunksize=chunksize):
+            if writer is not False:
+                try:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        schema = table.schema
+                        writer = pa.ipc.new_file(tmp, schema)
+                    writer.write_table(table.cast(schema))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError) as e:
+                    # Inconsistent dtypes between chunks: keep streaming, skip caching
+                    logging.warning(f"Not caching s3://{BUCKET_NAME}/{key}: {e}")
+                    if writer is not None:
+                        writer.close()
+                    writer = False
+            yield chunk
+        complete = True
+    finally:
+        if writer:
+            writer.close()
+            if complete:
+                os.replace(tmp, path)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# In-memory cache of parsed weekly CSVs, keyed by (key, etag) so a rewritten week is reloaded
+_week_frames = {}
+
+
+def load_week_frame(key, etag=None):
+    """Weekly CSV as a DataFrame, downloaded at most once per ETag."""
+    if etag is not None and (key, etag) in _week_frames:
+        return _week_frames[(key, etag)]
+    df = load_csv_object(key, etag)
+    if etag is not None:
+        _week_frames[(key, etag)] = df
+    return df
+
+
+def load_week_frames(objects, by_week=False):
+    """Concatenate the weekly frames for a list of (key, etag) pairs, fetching missing weeks concurrently.
+
+    With `by_week`, the outer index level "week" holds the key each row came from.
+    """
+    missing = [obj for obj in objects if obj not in _week_frames]
+    if len(missing) > 1:
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+            list(pool.map(lambda obj: load_week_frame(*obj), missing))
+    dfs = [load_week_frame(key, etag) for key, etag in objects]
+    if not dfs:
+        return pd.DataFrame()
+    if by_week:
+        return pd.concat(dfs, keys=[key for key, _ in objects], names=["week", None])
+    return pd.concat(dfs, ignore_index=True)
+
+
+def prune_week_cache(objects):
+    """Drop cached frames that are no longer among the given (key, etag) pairs."""
+    keep = set(objects)
+    for cached in list(_week_frames):
+        if cached not in keep:
+            del _week_frames[cached]
@@ -1,41 +1,217 @@
-import boto3
-import time
+"""Simulate a year of weekly uploads and the drift/retrain cycle they trigger.
+
+Real mode (default) uploads dataset/weeks/week_<n>.csv to the configured S3
+bucket and waits between weeks for a separately running drift_watchdog.py.
+
+With `--s3 local --clock virtual` the weeks go to a local S3 stand-in (moto
+server, or any endpoint given with --endpoint-url) and the watchdog runs
+in-process on a virtual clock: after each upload it polls once, and
+retraining runs to completion before the next simulated week, so a full
+52-week cycle takes minutes. A JSON summary with per-week timings is printed
+(or written with --output).
+
+    python simulate_year.py
+    python simulate_year.py --s3 local --clock virtual --generate --rows-per-week 200000 --fraud-signal 2
+"""
+import argparse
+import json
+import logging
 import os
+import time
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_DEFAULT_REGION = os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
-BUCKET_NAME = os.getenv("BUCKET_NAME")
 WEEKS_PREFIX = os.getenv("WEEKS_PREFIX", "weekly_data")
 
-# S3 client
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_DEFAULT_REGION
-)
-
-def upload_week_file(local_file, week_number):
-    """Upload a week's CSV to S3."""
-    s3_key = f"{WEEKS_PREFIX}/week_{week_number}.csv"
-    s3_client.upload_file(local_file, BUCKET_NAME, s3_key)
-    print(f"Uploaded {local_file} → s3://{BUCKET_NAME}/{s3_key}")
-
 # Simulation of weekly uploads
 NUM_WEEKS = 52
 DATA_FOLDER = "dataset/weeks"
+WEEK_SECONDS = 7 * 24 * 60 * 60
+
+
+class RealClock:
+    def now(self):
+        return datetime.utcnow()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class VirtualClock:
+    """Simulated time: sleeping only moves the clock forward."""
+
+    def __init__(self, start=None):
+        self.start = self.current = start or datetime(2025, 1, 6)
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+
+class InlineRetrainScheduler:
+    """Same interface as drift_watchdog.RetrainScheduler, but retrains synchronously in this process."""
+
+    running = False
+
+    def __init__(self):
+        self.runs = []
+
+    def submit(self, reason):
+        import drift_watchdog
+        import retrain
+        print(f"Starting retraining due to: {reason}")
+        started = time.perf_counter()
+        result = retrain.run_retraining(True, drift_watchdog.load_retraining_data())
+        self.runs.append({"reason": reason, "seconds": time.perf_counter() - started,
+                          "promoted": bool(result and result.get("promoted")),
+                          "pr_auc": result.get("pr_auc") if result else None})
+        return True
 
-for week in range(1, NUM_WEEKS + 1):
-    local_file = os.path.join(DATA_FOLDER, f"week_{week}.csv")
-    if os.path.exists(local_file):
-        upload_week_file(local_file, week)
-        # wait some time for drift_watchdog to pick it up
-        time.sleep(60)  # 60s for demo
+
+def start_local_s3(bucket):
+    """Start a moto S3 server and point every boto3 client of this process at it."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit('A local S3 needs moto: pip install "moto[server]"')
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    use_endpoint(f"http://{host}:{port}")
+    import boto3
+    boto3.client("s3").create_bucket(Bucket=bucket)
+    return server
+
+
+def use_endpoint(endpoint_url):
+    # boto3 reads AWS_ENDPOINT_URL, so s3_data, retrain and the watchdog all use the stand-in
+    os.environ["AWS_ENDPOINT_URL"] = endpoint_url
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "simulation")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "simulation")
+    os.environ["AWS_DEFAULT_REGION"] = os.getenv("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def iter_weeks(args):
+    """(week number, CSV bytes or local path) for every simulated week."""
+    if args.generate:
+        import generate_weekly_data as gen
+        levels = gen.drift_levels(args.weeks, args.drift_shape, args.drift_weeks, args.drift_start, seed=args.seed)
+        for week in range(1, args.weeks + 1):
+            df = gen.generate_week(week, args.rows_per_week, args.seed, levels[week - 1],
+                                   fraud_ratio=args.fraud_ratio, fraud_signal=args.fraud_signal)
+            yield week, df.to_csv(index=False).encode("utf-8")
     else:
-        print(f"File not found: {local_file}")
+        for week in range(1, args.weeks + 1):
+            local_file = os.path.join(DATA_FOLDER, f"week_{week}.csv")
+            if os.path.exists(local_file):
+                yield week, local_file
+            else:
+                print(f"File not found: {local_file}")
+
+
+def upload_week(s3_client, bucket, week_number, data):
+    """Upload a week's CSV to S3; zero-padded keys keep the weeks in order when listed."""
+    s3_key = f"{WEEKS_PREFIX}/week_{week_number:03d}.csv"
+    if isinstance(data, bytes):
+        s3_client.put_object(Bucket=bucket, Key=s3_key, Body=data)
+    else:
+        s3_client.upload_file(data, bucket, s3_key)
+    print(f"Uploaded week {week_number} → s3://{bucket}/{s3_key}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--s3", choices=["real", "local"], default="real")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint to use instead of starting moto")
+    parser.add_argument("--clock", choices=["real", "virtual"], default="real")
+    parser.add_argument("--interval", type=float, default=60, help="real clock: seconds between uploads")
+    parser.add_argument("--weeks", type=int, default=NUM_WEEKS)
+    parser.add_argument("--generate", action="store_true", help="generate weeks in memory instead of reading dataset/weeks")
+    parser.add_argument("--rows-per-week", type=int, default=50_000)
+    parser.add_argument("--fraud-ratio", type=float, default=0.01)
+    parser.add_argument("--fraud-signal", type=float, default=2.0)
+    parser.add_argument("--drift-shape", default="spikes")
+    parser.add_argument("--drift-weeks", type=int, default=5)
+    parser.add_argument("--drift-start", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON summary to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    from config import BUCKET_NAME
+    # The in-process watchdog reads the bucket from config.py
+    bucket = BUCKET_NAME if args.clock == "virtual" else os.getenv("BUCKET_NAME") or BUCKET_NAME
+
+    server = None
+    if args.endpoint_url:
+        use_endpoint(args.endpoint_url)
+    elif args.s3 == "local":
+        server = start_local_s3(bucket)
+
+    import boto3
+    s3_client = boto3.client("s3")
+    clock = VirtualClock() if args.clock == "virtual" else RealClock()
+
+    watchdog = scheduler = None
+    if args.clock == "virtual":
+        # Imported only now, so their S3 clients are created against the chosen endpoint
+        import drift_watchdog
+        scheduler = InlineRetrainScheduler()
+        watchdog = drift_watchdog.Watchdog(scheduler)
+
+    weeks = []
+    wall_start = time.perf_counter()
+    try:
+        for week, data in iter_weeks(args):
+            record = {"week": week, "date": clock.now().strftime("%Y-%m-%d")}
+            started = time.perf_counter()
+            upload_week(s3_client, bucket, week, data)
+            record["upload_seconds"] = time.perf_counter() - started
+
+            if watchdog is not None:
+                runs_before = len(scheduler.runs)
+                started = time.perf_counter()
+                events = watchdog.poll()
+                record["retrains"] = scheduler.runs[runs_before:]
+                # Drift check and reservoir update; retraining is counted separately
+                record["watchdog_seconds"] = (time.perf_counter() - started
+                                              - sum(run["seconds"] for run in record["retrains"]))
+                record["drift_features"] = events["drift_features"]
+                clock.sleep(WEEK_SECONDS)
+            else:
+                # wait some time for drift_watchdog to pick it up
+                clock.sleep(args.interval)
+            weeks.append(record)
+    finally:
+        if server is not None:
+            server.stop()
+
+    runs = [run for record in weeks for run in record.get("retrains", [])]
+    summary = {
+        "weeks": len(weeks),
+        "wall_seconds": time.perf_counter() - wall_start,
+        "simulated_days": (clock.now() - clock.start).days if args.clock == "virtual" else None,
+        "upload_seconds": sum(r["upload_seconds"] for r in weeks),
+        "watchdog_seconds": sum(r.get("watchdog_seconds", 0.0) for r in weeks),
+        "drift_weeks": [r["week"] for r in weeks if r.get("drift_features")],
+        "retrains": len(runs),
+        "promoted": sum(run["promoted"] for run in runs),
+        "retrain_seconds": sum(run["seconds"] for run in runs),
+        "per_week": weeks,
+    }
+    text = json.dumps(summary, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text if args.clock == "virtual" else "\n--- Yearly Weekly Data Simulation Completed ---")
+
 
-print("\n--- Yearly Weekly Data Simulation Completed ---")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 #!/bin/bash
 
-# Start Flask App auf 8000
+# Start Flask App auf 8000 (pre-fork gunicorn workers, see gunicorn.conf.py)
 echo "Starting Flask API..."
-python app.py &
+gunicorn -c gunicorn.conf.py app:app &
 
 # Start MLflow UI auf Port 5001
 echo "Starting MLflow UI..."
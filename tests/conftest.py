@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing retrain.py sets the MLflow experiment; keep that out of ./mlruns
+os.environ.setdefault("MLFLOW_TRACKING_URI",
+                      "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="mlflow_tests_"), "mlflow.db"))
+# Never let a test reach real AWS
+for name, value in (("AWS_ACCESS_KEY_ID", "testing"), ("AWS_SECRET_ACCESS_KEY", "testing"),
+                    ("AWS_DEFAULT_REGION", "us-east-1")):
+    os.environ[name] = value
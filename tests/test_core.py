@@ -0,0 +1,285 @@
+"""Core serving and training invariants: the flattened forest, payload
+validation, the S3 model registry, hot-swapping and the held-out split.
+
+    pip install pytest moto
+    python -m pytest -q
+"""
+import io
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from compiled_forest import FEATURE_COLUMNS, CompiledForest
+from model_registry import ModelRegistry, publish_pointer
+from model_serving import ModelSlot, ServingModel
+from payloads import FeatureSchema, PayloadError, decode_request
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(3000, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    y = (X["V1"] + rng.normal(size=len(X)) > 1.5).astype(int)
+    return X, y
+
+
+@pytest.fixture(scope="module")
+def forest(data):
+    X, y = data
+    return RandomForestClassifier(n_estimators=15, max_depth=8, class_weight="balanced", random_state=1).fit(X, y)
+
+
+# Flattened forest
+def test_compiled_forest_matches_sklearn(data, forest):
+    X, _ = data
+    compiled = CompiledForest.from_sklearn(forest)
+    np.testing.assert_allclose(compiled.predict_proba(X.to_numpy()), forest.predict_proba(X), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(compiled.predict(X.to_numpy()), forest.predict(X))
+
+
+def test_compiled_forest_matches_sklearn_after_memory_mapped_reload(data, forest, tmp_path):
+    X, _ = data
+    CompiledForest.from_sklearn(forest).save(tmp_path / "compiled")
+    loaded = CompiledForest.load(tmp_path / "compiled", mmap_mode="r")
+    assert loaded.feature_names == FEATURE_COLUMNS
+    np.testing.assert_allclose(loaded.predict_proba(X.to_numpy()), forest.predict_proba(X), rtol=0, atol=1e-12)
+
+
+def test_compiled_forest_routes_missing_values_like_sklearn(data):
+    X, y = data
+    X = X.copy()
+    X.iloc[::7, 3] = np.nan
+    model = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=2).fit(X, y)
+    compiled = CompiledForest.from_sklearn(model)
+    np.testing.assert_allclose(compiled.predict_proba(X.to_numpy()), model.predict_proba(X), rtol=0, atol=1e-12)
+
+
+def test_compiled_forest_rejects_wrong_width_and_non_forests(data, forest):
+    X, y = data
+    with pytest.raises(ValueError, match="Expected input of shape"):
+        CompiledForest.from_sklearn(forest).predict_proba(X.to_numpy()[:, :5])
+    with pytest.raises(TypeError):
+        CompiledForest.from_sklearn(object())
+
+
+# Payload validation
+@pytest.fixture
+def schema():
+    return FeatureSchema(FEATURE_COLUMNS)
+
+
+def record(value=0.5):
+    return {name: value for name in FEATURE_COLUMNS}
+
+
+def test_schema_accepts_records_and_columns_in_model_order(schema):
+    rows = [record(1.0), record(2.0)]
+    X = schema.from_records(rows)
+    assert X.shape == (2, len(FEATURE_COLUMNS)) and X.flags["C_CONTIGUOUS"]
+    np.testing.assert_array_equal(schema.from_columns({name: [1.0, 2.0] for name in FEATURE_COLUMNS}), X)
+
+
+@pytest.mark.parametrize("rows, message", [
+    ([{k: v for k, v in record().items() if k != "V3"}], r"Record 0: missing fields \['V3'\]"),
+    ([record(), {**record(), "Extra": 1.0}], r"Record 1: unknown fields \['Extra'\]"),
+    ([{**record(), "V1": "abc"}], "Record 0: V1 must be a number"),
+    ([{**record(), "V1": None}], "Row 0: V1 is nan"),
+    ([record(), ["not", "a", "record"]], "Record 1 is not an object"),
+    ([{**record(), "Amount": float("nan")}], "Row 0: Amount is nan"),
+    ([record(), {**record(), "Time": float("inf")}], "Row 1: Time is inf"),
+])
+def test_schema_rejects_bad_records(schema, rows, message):
+    with pytest.raises(PayloadError, match=message):
+        schema.from_records(rows)
+
+
+def test_schema_rejects_bad_columns(schema):
+    columns = {name: [1.0, 2.0] for name in FEATURE_COLUMNS}
+    with pytest.raises(PayloadError, match="missing fields"):
+        schema.from_columns({k: v for k, v in columns.items() if k != "Amount"})
+    with pytest.raises(PayloadError, match="equal length"):
+        schema.from_columns({**columns, "V2": [1.0]})
+    with pytest.raises(PayloadError, match="No input data"):
+        schema.from_columns({name: [] for name in FEATURE_COLUMNS})
+
+
+@pytest.mark.parametrize("body, content_type, message", [
+    (b"{not json", "application/json", "Invalid JSON body"),
+    (b"[1, 2]", "application/json", "'data' field"),
+    (b'{"data": []}', "application/json", "No input data"),
+    (b'{"data": 5}', "application/json", "list of records or a dict of columns"),
+    (np.zeros(len(FEATURE_COLUMNS) + 1, dtype="<f4").tobytes(), "application/octet-stream", "float32 matrix"),
+    (b"", "application/octet-stream", "float32 matrix"),
+    (b"garbage", "application/vnd.apache.arrow.stream", "Invalid Arrow IPC payload"),
+])
+def test_decode_request_rejects_malformed_bodies(schema, body, content_type, message):
+    with pytest.raises(PayloadError, match=message):
+        decode_request(body, content_type, schema)
+
+
+def test_binary_payloads_need_the_creditcard_columns():
+    schema = FeatureSchema(["Amount", "Other"])
+    body = np.zeros((2, len(FEATURE_COLUMNS)), dtype="<f4").tobytes()
+    with pytest.raises(PayloadError, match="Binary payloads need the columns"):
+        decode_request(body, "application/octet-stream", schema)
+
+
+# Model registry on a mocked S3
+@pytest.fixture
+def s3():
+    moto = pytest.importorskip("moto")
+    import boto3
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="models")
+        yield client
+
+
+def put_model(s3, key, model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    s3.put_object(Bucket="models", Key=key, Body=buffer.getvalue())
+
+
+def record_calls(s3, operation):
+    """Parameters of every `operation` request the client sends from now on."""
+    calls = []
+    s3.meta.events.register(f"before-parameter-build.s3.{operation}", lambda params, **kwargs: calls.append(dict(params)))
+    return calls
+
+
+def test_registry_reads_latest_pointer_with_conditional_get(s3, forest, tmp_path):
+    put_model(s3, "model_backups/2025-01-01_00-00-00-aaaa-Model/model.pkl", forest)
+    put_model(s3, "model_backups/2025-02-01_00-00-00-bbbb-Model/model.pkl", forest)
+    publish_pointer(s3, "models", "model_backups", "model_backups/2025-01-01_00-00-00-aaaa-Model/model.pkl")
+    registry = ModelRegistry(s3, "models", "model_backups", str(tmp_path / "cache"))
+    gets = record_calls(s3, "GetObject")
+    lists = record_calls(s3, "ListObjectsV2")
+
+    # The pointer wins over the newest folder name, and is revalidated with its ETag
+    assert registry.latest_key() == "model_backups/2025-01-01_00-00-00-aaaa-Model/model.pkl"
+    assert registry.latest_key() == "model_backups/2025-01-01_00-00-00-aaaa-Model/model.pkl"
+    assert "IfNoneMatch" not in gets[0] and gets[1]["IfNoneMatch"]
+    assert not lists
+
+    publish_pointer(s3, "models", "model_backups", "model_backups/2025-02-01_00-00-00-bbbb-Model/model.pkl")
+    assert registry.latest_key() == "model_backups/2025-02-01_00-00-00-bbbb-Model/model.pkl"
+
+
+def test_registry_without_pointer_lists_every_page_and_only_newer_keys(s3, forest, tmp_path):
+    folders = [f"model_backups/2025-01-{day:02d}_00-00-00-abcd-Model" for day in range(1, 8)]
+    for folder in folders:
+        put_model(s3, f"{folder}/model.pkl", forest)
+        s3.put_object(Bucket="models", Key=f"{folder}/metrics.json", Body=b"{}")
+    # Two keys per page, so the listing has to follow continuation tokens
+    s3.meta.events.register("before-parameter-build.s3.ListObjectsV2",
+                            lambda params, **kwargs: params.update(MaxKeys=2))
+    lists = record_calls(s3, "ListObjectsV2")
+    registry = ModelRegistry(s3, "models", "model_backups", str(tmp_path / "cache"))
+
+    assert registry.list_model_keys() == [f"{folder}/model.pkl" for folder in folders]
+    assert len(lists) == 7 and "ContinuationToken" in lists[-1]
+
+    lists.clear()
+    assert registry.latest_key() == f"{folders[-1]}/model.pkl"
+    put_model(s3, "model_backups/2025-01-08_00-00-00-abcd-Model/model.pkl", forest)
+    assert registry.latest_key() == "model_backups/2025-01-08_00-00-00-abcd-Model/model.pkl"
+    assert lists[-1]["StartAfter"] == f"{folders[-1]}/model.pkl"
+
+
+def test_registry_without_models_raises(s3, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        ModelRegistry(s3, "models", "model_backups", str(tmp_path / "cache")).latest_key()
+
+
+def test_registry_fetch_downloads_only_changed_models(s3, data, forest, tmp_path):
+    key = "model_backups/2025-01-01_00-00-00-aaaa-Model/model.pkl"
+    put_model(s3, key, forest)
+    registry = ModelRegistry(s3, "models", "model_backups", str(tmp_path / "cache"))
+    gets = record_calls(s3, "GetObject")
+
+    path = registry.fetch(key)
+    assert registry.fetch(key) == path
+    assert gets[1]["IfNoneMatch"] == registry._index[key]["etag"]
+    # A new registry (a restart) reuses the cache on disk
+    assert ModelRegistry(s3, "models", "model_backups", str(tmp_path / "cache")).fetch(key) == path
+
+    X, y = data
+    put_model(s3, key, RandomForestClassifier(n_estimators=3, random_state=5).fit(X, y))
+    assert registry.fetch(key) != path
+    assert registry.load(key).n_estimators == 3
+
+
+# Hot swap and rollback
+def serving(key, forest):
+    return ServingModel(key, forest, CompiledForest.from_sklearn(forest))
+
+
+def test_model_slot_swaps_and_rolls_back(forest):
+    slot = ModelSlot(history_size=2)
+    a, b, c = (serving(key, forest) for key in "abc")
+    for m in (a, b, c):
+        slot.publish(m)
+    assert slot.current is c and list(slot.history) == [a, b]
+
+    assert slot.rollback() is b
+    assert slot.current is b and list(slot.history) == [a, c]
+    assert slot.rollback("a") is a
+    assert slot.current is a and list(slot.history) == [c, b]
+    assert slot.find("c") is c and slot.find("x") is None
+
+
+def test_model_slot_history_is_bounded_and_rollback_needs_history(forest):
+    slot = ModelSlot(history_size=2)
+    with pytest.raises(LookupError):
+        slot.rollback()
+    for key in "abcd":
+        slot.publish(serving(key, forest))
+    assert [m.key for m in slot.history] == ["b", "c"]
+    with pytest.raises(LookupError, match="not in memory"):
+        slot.rollback("a")
+    assert slot.current.key == "d"
+
+
+# Held-out rows
+@pytest.fixture(scope="module")
+def retrain():
+    return pytest.importorskip("retrain")
+
+
+def weekly_frame(data, n_weeks=3):
+    X, y = data
+    weeks = np.repeat([f"weekly_data/week_2025_{w:02d}.csv" for w in range(1, n_weeks + 1)],
+                      int(np.ceil(len(X) / n_weeks)))[:len(X)]
+    index = pd.MultiIndex.from_arrays([weeks, np.arange(len(X))], names=["week", None])
+    return X.set_index(index), y.set_axis(index)
+
+
+def test_split_holdout_is_deterministic_and_newest_week_only(retrain, data):
+    X, y = weekly_frame(data)
+    X_train, X_test, y_train, y_test = retrain.split_holdout(X, y, n_weeks=1, fraction=0.5)
+    again = retrain.split_holdout(X, y, n_weeks=1, fraction=0.5)
+
+    pd.testing.assert_frame_equal(X_test, again[1])
+    pd.testing.assert_series_equal(y_train, again[2])
+    assert set(X_test.index.get_level_values("week")) == {"weekly_data/week_2025_03.csv"}
+    assert len(X_train) + len(X_test) == len(X)
+    assert 0.4 < len(X_test) / 1000 < 0.6
+
+
+def test_split_holdout_follows_row_values_not_position(retrain, data):
+    X, y = weekly_frame(data)
+    shuffled = np.random.default_rng(3).permutation(len(X))
+    _, X_test, _, _ = retrain.split_holdout(X, y, n_weeks=1, fraction=0.5)
+    _, X_test_shuffled, _, _ = retrain.split_holdout(X.iloc[shuffled], y.iloc[shuffled], n_weeks=1, fraction=0.5)
+    assert set(X_test.index) == set(X_test_shuffled.index)
+
+
+def test_split_holdout_without_week_labels_uses_all_rows(retrain, data):
+    X, y = data
+    _, X_test, _, y_test = retrain.split_holdout(X, y, fraction=0.2)
+    assert 0.15 < len(X_test) / len(X) < 0.25
+    assert X_test.index.equals(y_test.index)
@@ -1,29 +1,25 @@
 import os
+import resource
+from collections import deque
+import numpy as np
 import pandas as pd
-from io import BytesIO
-import boto3
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-from imblearn.over_sampling import SMOTE
-import joblib
 import mlflow
-import mlflow.sklearn
-from dotenv import load_dotenv
-from datetime import datetime
 import json
-from config import BUCKET_NAME, LATEST_MODEL_PATH
-
-# Load environment variables
-load_dotenv()
+from config import (
+    BUCKET_NAME, FULL_DATASET_KEY, LATEST_MODEL_PATH, S3_MODEL_BACKUP_PREFIX, STREAMING_TRAINING,
+    TRAINING_CHUNK_SIZE, MAJORITY_SAMPLE_RATE, FIT_BUFFER_ROWS, TREES_PER_BATCH, STREAMING_HOLDOUT_ROWS,
+    PROMOTION_GATE, PROMOTION_RESULTS_FILE, REFERENCE_STATS_FILE, MODEL_COMPRESSION, UPLOAD_WORKERS,
+    UPLOAD_PART_SIZE, ASYNC_MLFLOW_LOGGING
+)
+from drift_stats import FeatureStats, reference_to_dict
+from artifact_pipeline import log_model_async, new_model_folder, publish_model_folder, serialize_model, wait_for_background
+from promotion import run_promotion_gate
+from resampling import build_model, configured_resampler
+from s3_data import get_s3_client, load_csv_object, iter_csv_chunks
 
 # S3 client setup
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_DEFAULT_REGION", "eu-central-1")
-)
+s3_client = get_s3_client()
 
 # MLflow experiment
 EXPERIMENT_NAME = "fraud_detection"
@@ -31,20 +27,70 @@ mlflow.set_experiment(EXPERIMENT_NAME)
 
 # Helper functions
 def load_full_dataset():
-    """Load the complete dataset from S3."""
-    key = "dataset/creditcard.csv"
-    obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=key)
-    df = pd.read_csv(BytesIO(obj['Body'].read()))
-    return df
-
-def save_model_to_s3(model_file, metrics_file=None, input_example_file=None):
-    """Upload model, metrics, and input example to S3."""
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M")
-    s3_folder = f"model_backups/{timestamp}-Model"
-    for file in [model_file, metrics_file, input_example_file]:
-        if file and os.path.exists(file):
-            s3_client.upload_file(file, BUCKET_NAME, f"{s3_folder}/{os.path.basename(file)}")
-    print(f"Model, metrics, and input example uploaded to s3://{BUCKET_NAME}/{s3_folder}")
+    """Load the complete dataset from S3 (served from the local Arrow cache when unchanged)."""
+    return load_csv_object(FULL_DATASET_KEY)
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def split_newest(X, y, test_size=0.2):
+    """Hold out the newest `test_size` of the rows by Time; a model trained on an earlier split never saw them."""
+    order = np.argsort(X["Time"].to_numpy(), kind="stable")
+    n_test = max(int(len(X) * test_size), 1)
+    train_idx, test_idx = np.sort(order[:-n_test]), np.sort(order[-n_test:])
+    return X.iloc[train_idx], X.iloc[test_idx], y.iloc[train_idx], y.iloc[test_idx]
+
+def save_model_to_s3(model_file, metrics_file=None, input_example_file=None, promotion_file=None, reference_file=None, model=None):
+    """Upload model, metrics, input example, promotion results, drift reference and (given `model`) compiled arrays to S3."""
+    s3_folder = new_model_folder(S3_MODEL_BACKUP_PREFIX)
+    files = [model_file, metrics_file, input_example_file, promotion_file, reference_file]
+    # Uploaded in parallel (with the compiled arrays of `model`); the API is pointed at the folder last
+    publish_model_folder(s3_client, BUCKET_NAME, s3_folder, {os.path.basename(f): f for f in files if f}, model,
+                         S3_MODEL_BACKUP_PREFIX, UPLOAD_WORKERS, UPLOAD_PART_SIZE)
+
+def save_and_backup_model(model, metrics, input_example, X_holdout=None, y_holdout=None, reference=None):
+    """Log metrics and model to the active MLflow run, save locally and back up to S3.
+
+    With held-out rows and PROMOTION_GATE set, the upload only happens if the
+    model beats the one currently served. `reference` (see
+    drift_stats.reference_to_dict) is uploaded as the live drift reference.
+    """
+    print(f"Test Accuracy: {metrics['accuracy']:.4f}, Precision: {metrics['precision']:.4f}, "
+          f"Recall: {metrics['recall']:.4f}, F1: {metrics['f1_score']:.4f}")
+
+    # Log metrics to MLflow
+    for name, value in metrics.items():
+        mlflow.log_metric(name, value)
+
+    # Save locally; the same pickle is uploaded to S3
+    serialize_model(model, LATEST_MODEL_PATH, MODEL_COMPRESSION)
+
+    # Log model to MLflow (in the background, it pickles the model again)
+    log_model_async(model, input_example, ASYNC_MLFLOW_LOGGING)
+
+    # Save metrics and input example for S3 backup
+    metrics_file = "metrics.json"
+    input_example_file = "input_example.csv"
+    with open(metrics_file, "w") as f:
+        json.dump(metrics, f)
+    input_example.to_csv(input_example_file, index=False)
+    reference_file = None
+    if reference is not None:
+        reference_file = REFERENCE_STATS_FILE
+        with open(reference_file, "w") as f:
+            json.dump(reference, f)
+
+    promotion_file = None
+    if PROMOTION_GATE and X_holdout is not None:
+        promotion = run_promotion_gate(model, X_holdout, y_holdout)
+        mlflow.log_metric("promoted", int(promotion["promote"]))
+        if not promotion["promote"]:
+            return False
+        promotion_file = PROMOTION_RESULTS_FILE
+
+    save_model_to_s3(LATEST_MODEL_PATH, metrics_file, input_example_file, promotion_file, reference_file, model)
+    return True
 
 # Main training function
 def main(use_smote=True):
@@ -58,65 +104,144 @@ def main(use_smote=True):
     X = df.drop("Class", axis=1)
     y = df["Class"]
 
-    # Train/test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, stratify=y, random_state=42
-    )
-
-    # Optional SMOTE oversampling
-    if use_smote:
-        smote = SMOTE(random_state=42)
-        X_train, y_train = smote.fit_resample(X_train, y_train)
-        print(f"After SMOTE oversampling, training shape: {X_train.shape}")
-
-    # RandomForest with balanced class weights
-    model = RandomForestClassifier(
-        n_estimators=25,
-        max_depth=8,
-        min_samples_split=5,
-        min_samples_leaf=3,
-        max_features='sqrt',
-        bootstrap=True,
-        n_jobs=-1,
-        random_state=42,
-        class_weight="balanced"
-    )
+    # The newest rows are held out, so the promotion gate compares both models on unseen data
+    X_train, X_test, y_train, y_test = split_newest(X, y)
+
+    # Feature statistics of the real (not oversampled) training rows
+    reference_stats = FeatureStats.from_frame(X_train)
+
+    # Class-imbalance resampling (RESAMPLING_STRATEGY, or class weights only without use_smote)
+    resampler = configured_resampler(use_smote, seed=42)
+    X_train, y_train = resampler.fit_resample(X_train, y_train)
+    print(f"After {resampler.name} resampling, training shape: {X_train.shape}")
+
+    model = build_model()
 
     with mlflow.start_run(run_name="train_local"):
+        mlflow.log_param("resampling", resampler.name)
         # Train model
         model.fit(X_train, y_train)
         preds = model.predict(X_test)
 
         # Compute metrics
-        acc = accuracy_score(y_test, preds)
-        prec = precision_score(y_test, preds, zero_division=0)
-        rec = recall_score(y_test, preds, zero_division=0)
-        f1 = f1_score(y_test, preds, zero_division=0)
-        print(f"Test Accuracy: {acc:.4f}, Precision: {prec:.4f}, Recall: {rec:.4f}, F1: {f1:.4f}")
-
-        # Log metrics to MLflow
-        mlflow.log_metric("accuracy", acc)
-        mlflow.log_metric("precision", prec)
-        mlflow.log_metric("recall", rec)
-        mlflow.log_metric("f1_score", f1)
-
-        # Save locally
-        os.makedirs(os.path.dirname(LATEST_MODEL_PATH), exist_ok=True)
-        joblib.dump(model, LATEST_MODEL_PATH)
-
-        # Log model to MLflow
-        mlflow.sklearn.log_model(model, "model", input_example=X_train.head(1))
-
-        # Save metrics and input example for S3 backup
-        metrics_file = "metrics.json"
-        input_example_file = "input_example.csv"
-        with open(metrics_file, "w") as f:
-            json.dump({"accuracy": acc, "precision": prec, "recall": rec, "f1_score": f1}, f)
-        X_train.head(1).to_csv(input_example_file, index=False)
-
-        save_model_to_s3(LATEST_MODEL_PATH, metrics_file, input_example_file)
+        metrics = {
+            "accuracy": accuracy_score(y_test, preds),
+            "precision": precision_score(y_test, preds, zero_division=0),
+            "recall": recall_score(y_test, preds, zero_division=0),
+            "f1_score": f1_score(y_test, preds, zero_division=0),
+        }
+        mlflow.log_metric("peak_rss_mb", peak_rss_mb())
+        print(f"Peak RSS: {peak_rss_mb():.0f} MB")
+
+        reference = reference_to_dict(reference_stats, preds.mean())
+        uploaded = save_and_backup_model(model, metrics, X_train.head(1), X_test, y_test, reference)
+
+    if uploaded:
+        print(f"Model saved locally at {LATEST_MODEL_PATH}, logged to MLflow, and backed up to S3.")
+    else:
+        print(f"Model saved locally at {LATEST_MODEL_PATH} and logged to MLflow; not uploaded.")
+
+# Streaming training
+def iter_chunks(keys, chunksize):
+    for key in keys:
+        yield from iter_csv_chunks(key, chunksize)
+
+def iter_training_rows(chunks, newest, holdout_rows=STREAMING_HOLDOUT_ROWS):
+    """Yield the rows of `chunks` except the last `holdout_rows`, which are left in the deque `newest`."""
+    held = 0
+    for chunk in chunks:
+        newest.append(chunk)
+        held += len(chunk)
+        while held > holdout_rows:
+            excess = held - holdout_rows
+            oldest = newest[0]
+            if len(oldest) <= excess:
+                newest.popleft()
+            else:
+                # Split a chunk that straddles the boundary
+                newest[0] = oldest.iloc[excess:]
+                oldest = oldest.iloc[:excess]
+            held -= len(oldest)
+            yield oldest
+
+def fit_tree_batch(model, buffer, resampler):
+    """Grow TREES_PER_BATCH more trees on the buffered sample. Returns the rows it was fitted on."""
+    X = pd.concat(buffer, ignore_index=True)
+    y = X.pop("Class")
+    X, y = resampler.fit_resample(X, y)
+    model.n_estimators += TREES_PER_BATCH
+    model.fit(X, y)
+    print(f"Fitted trees up to {model.n_estimators} on {X.shape[0]} rows, peak RSS {peak_rss_mb():.0f} MB")
+    return X
+
+def train_streaming(use_smote=True, keys=None, chunksize=TRAINING_CHUNK_SIZE):
+    """Train with bounded memory on datasets larger than RAM.
+
+    The data is streamed in chunks, oldest first. The newest
+    STREAMING_HOLDOUT_ROWS rows are held back as the test split for the
+    metrics and the promotion gate, so the served model is compared on rows
+    it has not trained on. Every other chunk keeps every minority row and a
+    MAJORITY_SAMPLE_RATE fraction of the majority rows in a buffer of
+    FIT_BUFFER_ROWS rows. Each full buffer is resampled on its own
+    (RESAMPLING_STRATEGY) and used to grow TREES_PER_BATCH more trees
+    (warm_start).
+    """
+    keys = keys or [FULL_DATASET_KEY]
+    model = build_model(n_estimators=0, warm_start=True)
+    resampler = configured_resampler(use_smote, seed=42)
+    sampler = np.random.default_rng(42)
+    buffer, buffered, buffered_minority, input_example = [], 0, 0, None
+    reference_stats = None  # merged feature statistics of all training rows
+    newest = deque()  # the newest rows, held out until newer ones push them into training
+
+    for train_rows in iter_training_rows(iter_chunks(keys, chunksize), newest, STREAMING_HOLDOUT_ROWS):
+        chunk_stats = FeatureStats.from_frame(train_rows.drop("Class", axis=1))
+        reference_stats = chunk_stats if reference_stats is None else reference_stats.merge(chunk_stats)
+        is_minority = (train_rows["Class"] == 1).to_numpy()
+        keep = is_minority | (sampler.random(len(train_rows)) < MAJORITY_SAMPLE_RATE)
+        buffer.append(train_rows[keep])
+        buffered += int(keep.sum())
+        buffered_minority += int(is_minority.sum())
+        # Both classes are needed for every batch of trees
+        if buffered >= FIT_BUFFER_ROWS and 0 < buffered_minority < buffered:
+            fitted = fit_tree_batch(model, buffer, resampler)
+            if input_example is None:
+                input_example = fitted.head(1)
+            buffer, buffered, buffered_minority = [], 0, 0
+    if 0 < buffered_minority < buffered:
+        fitted = fit_tree_batch(model, buffer, resampler)
+        if input_example is None:
+            input_example = fitted.head(1)
+    if model.n_estimators == 0:
+        print(f"Not enough data beyond the {STREAMING_HOLDOUT_ROWS} held-out rows. Exiting.")
+        return
 
-    print(f"Model saved locally at {LATEST_MODEL_PATH}, logged to MLflow, and backed up to S3.")
+    holdout = pd.concat(newest, ignore_index=True)
+    y_holdout = holdout.pop("Class")
+    preds = model.predict(holdout)
+    metrics = {
+        "accuracy": accuracy_score(y_holdout, preds),
+        "precision": precision_score(y_holdout, preds, zero_division=0),
+        "recall": recall_score(y_holdout, preds, zero_division=0),
+        "f1_score": f1_score(y_holdout, preds, zero_division=0),
+    }
+
+    with mlflow.start_run(run_name="train_streaming"):
+        mlflow.log_params({"chunksize": chunksize, "majority_sample_rate": MAJORITY_SAMPLE_RATE, "resampling": resampler.name,
+                           "fit_buffer_rows": FIT_BUFFER_ROWS, "trees_per_batch": TREES_PER_BATCH})
+        mlflow.log_metric("peak_rss_mb", peak_rss_mb())
+        print(f"Peak RSS: {peak_rss_mb():.0f} MB")
+        reference = reference_to_dict(reference_stats, preds.mean())
+        uploaded = save_and_backup_model(model, metrics, input_example, holdout, y_holdout, reference)
+
+    if uploaded:
+        print(f"Model saved locally at {LATEST_MODEL_PATH}, logged to MLflow, and backed up to S3.")
+    else:
+        print(f"Model saved locally at {LATEST_MODEL_PATH} and logged to MLflow; not uploaded.")
 
 if __name__ == "__main__":
-    main(use_smote=True)
+    if STREAMING_TRAINING:
+        train_streaming(use_smote=True)
+    else:
+        main(use_smote=True)
+    wait_for_background()
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from botocore.exceptions import ClientError
+from request_logger import iter_segment
+
+MB = 1024 * 1024
+
+
+class MultipartWriter:
+    """File-like sink that streams bytes into an S3 multipart upload.
+
+    Parts of `part_size` bytes are uploaded in parallel; at most
+    `2 * max_workers` parts are held in memory at a time.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=8 * MB, max_workers=4, metadata=None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self._buffer = bytearray()
+        self._futures = []
+        self._slots = threading.Semaphore(2 * max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key,
+                                                            Metadata=metadata or {})["UploadId"]
+        self.bytes_written = 0
+
+    def _upload_part(self, number, body):
+        try:
+            resp = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                       PartNumber=number, Body=body)
+            return {"PartNumber": number, "ETag": resp["ETag"]}
+        finally:
+            self._slots.release()
+
+    def _submit(self, body):
+        self._slots.acquire()
+        number = len(self._futures) + 1
+        self._futures.append(self._executor.submit(self._upload_part, number, bytes(body)))
+
+    def write(self, data):
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+
+    def close(self):
+        try:
+            if self._buffer or not self._futures:
+                self._submit(self._buffer)
+                self._buffer = bytearray()
+            parts = [f.result() for f in self._futures]
+            self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                              MultipartUpload={"Parts": parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def abort(self):
+        try:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception as e:
+            logging.error(f"Could not abort multipart upload of {self.key}: {e}")
+
+
+class WeeklyUploader:
+    """Moves closed request-log segments to S3 and compacts them into one CSV per week.
+
+    Segments are first staged as headerless CSV objects under
+    `<staging_prefix>/week_<year>_<ww>/`, either when enough data has piled
+    up locally or on the weekly timer. Compaction then streams the existing
+    weekly object (if any) and all staged parts into
+    `<weekly_prefix>/week_<year>_<ww>.csv` with a parallel multipart upload,
+    so nothing is lost if the weekly file is uploaded more than once.
+
+    Compaction is idempotent: before completing the upload it writes the full
+    list of staged parts in the new weekly object to
+    `<weekly_prefix>/_compacted/<week>/<id>.json`, and the object's metadata
+    names that id. Parts already listed are skipped, so a retry after a
+    failed clean-up does not append them twice.
+    """
+
+    def __init__(self, s3_client, bucket, request_logger, weekly_prefix="weekly_data",
+                 staging_prefix="weekly_staging", part_size=8 * MB, max_workers=4):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.request_logger = request_logger
+        self.weekly_prefix = weekly_prefix.rstrip("/")
+        self.staging_prefix = staging_prefix.rstrip("/")
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def week_label(now=None):
+        year, week_num, _ = (now or datetime.utcnow()).isocalendar()
+        return f"week_{year}_{week_num:02d}"
+
+    def stage_segments(self):
+        """Rotate the open segment and upload all closed segments to the staging prefix."""
+        with self._lock:
+            self.request_logger.rotate()
+            segments = self.request_logger.closed_segments()
+            week = self.week_label()
+            for path in segments:
+                name = os.path.basename(path).rsplit(".", 1)[0]
+                key = f"{self.staging_prefix}/{week}/{name}.csv"
+                # Streamed batch by batch, so a large segment is never held in memory
+                writer = MultipartWriter(self.s3, self.bucket, key, self.part_size, self.max_workers)
+                try:
+                    for batch in iter_segment(path):
+                        writer.write(batch.to_csv(index=False, header=False).encode("utf-8"))
+                except Exception:
+                    writer.abort()
+                    raise
+                writer.close()
+                os.remove(path)
+            if segments:
+                logging.info(f"Staged {len(segments)} request log segments under s3://{self.bucket}/{self.staging_prefix}/{week}/")
+            return len(segments)
+
+    def _list_staged(self):
+        paginator = self.s3.get_paginator("list_objects_v2")
+        by_week = defaultdict(list)
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.staging_prefix}/"):
+            for obj in page.get("Contents", []):
+                week = obj["Key"][len(self.staging_prefix) + 1:].split("/", 1)[0]
+                by_week[week].append(obj["Key"])
+        return by_week
+
+    def _stream_object(self, key, writer):
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+        for chunk in body.iter_chunks(chunk_size=self.part_size):
+            writer.write(chunk)
+
+    def _manifest_key(self, week, compaction):
+        return f"{self.weekly_prefix}/_compacted/{week}/{compaction}.json"
+
+    def _compacted_parts(self, week, compaction):
+        """Staged keys already in the weekly object written by compaction `compaction`."""
+        if not compaction:
+            return set()
+        body = self.s3.get_object(Bucket=self.bucket, Key=self._manifest_key(week, compaction))["Body"].read()
+        return set(json.loads(body)["parts"])
+
+    def compact_week(self, week, staged_keys):
+        target = f"{self.weekly_prefix}/{week}.csv"
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=target)
+            existing = True
+            previous = head.get("Metadata", {}).get("compaction")
+        except ClientError:
+            existing = False
+            previous = None
+        done = self._compacted_parts(week, previous)
+        new_keys = sorted(k for k in staged_keys if k not in done)
+
+        if new_keys:
+            compaction = uuid.uuid4().hex
+            # The manifest exists before the object that refers to it
+            self.s3.put_object(Bucket=self.bucket, Key=self._manifest_key(week, compaction),
+                               Body=json.dumps({"parts": sorted(done | set(new_keys))}).encode("utf-8"))
+            writer = MultipartWriter(self.s3, self.bucket, target, self.part_size, self.max_workers,
+                                     metadata={"compaction": compaction})
+            try:
+                if existing:
+                    self._stream_object(target, writer)
+                else:
+                    writer.write((",".join(self.request_logger.columns) + "\n").encode("utf-8"))
+                for key in new_keys:
+                    self._stream_object(key, writer)
+            except Exception:
+                writer.abort()
+                raise
+            writer.close()
+            logging.info(f"Uploaded weekly data ({len(new_keys)} parts, {writer.bytes_written} bytes) to s3://{self.bucket}/{target}")
+            if previous:
+                self.s3.delete_object(Bucket=self.bucket, Key=self._manifest_key(week, previous))
+        if len(new_keys) < len(staged_keys):
+            logging.info(f"Skipped {len(staged_keys) - len(new_keys)} staged parts already in s3://{self.bucket}/{target}")
+
+        for i in range(0, len(staged_keys), 1000):
+            self.s3.delete_objects(Bucket=self.bucket, Delete={"Objects": [{"Key": k} for k in staged_keys[i:i + 1000]]})
+
+    def compact_all(self):
+        """Compact every staged week into its weekly object."""
+        with self._lock:
+            staged = self._list_staged()
+            if not staged:
+                logging.info("No new data to upload this week.")
+            for week, keys in sorted(staged.items()):
+                self.compact_week(week, keys)
+            return len(staged)